@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# 问答服务端到端压测：回放测试问句，统计延迟分位数、吞吐量与各阶段耗时
+import argparse
+import json
+import time
+from multiprocessing.pool import ThreadPool
+
+from pymongo import MongoClient
+
+from benchmark.fixture import DEFAULT_FIXTURE_PATH, CORPUS_FILE, load_fixture, build_offline_bots
+from config import MONGODB_HOST, MONGODB_PORT, MONGODB_DBNAME, MONGODB_TEST_CORPUS, ANSWER_CACHE_SIZE, QUERY_TIMEOUT
+from service import warm_up
+from service.dispatch_service import DispatchBot
+from utils.tracer import Tracer
+
+
+def percentile(sorted_values, p):
+    """
+    最近秩法计算分位数
+    :param sorted_values: 升序排列的数值
+    :param p: 百分位（0-100）
+    """
+    if not sorted_values:
+        return 0.0
+    rank = int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1
+    return sorted_values[min(max(rank, 0), len(sorted_values) - 1)]
+
+
+def load_live_queries(limit=None):
+    client = MongoClient(MONGODB_HOST, MONGODB_PORT)
+    collection = client.get_database(MONGODB_DBNAME).get_collection(MONGODB_TEST_CORPUS)
+    cursor = collection.find({}, {'query': 1})
+    if limit:
+        cursor = cursor.limit(limit)
+    return [doc['query'] for doc in cursor]
+
+
+def run_query(dispatch_bot, query):
+    tracer = Tracer()
+    start = time.time()
+    error = ''
+    source = ''
+    try:
+        _, source = dispatch_bot.dispatch(query, tracer=tracer)
+    except Exception, e:
+        error = repr(e)
+    summary = tracer.summary()
+    return {'latency_ms': (time.time() - start) * 1000, 'source': source, 'error': error,
+            'degraded': 'degraded' in summary, 'summary': summary}
+
+
+def benchmark(dispatch_bot, queries, concurrency=1, warmup=0):
+    """
+    回放问句并统计性能指标
+    :param dispatch_bot: 问答机器人
+    :param queries: 问句列表
+    :param concurrency: 并发数
+    :param warmup: 预热的问句数，不计入统计
+    :return: 统计结果
+    """
+    for query in queries[:warmup]:
+        dispatch_bot.dispatch(query)
+    pool = ThreadPool(concurrency)
+    start = time.time()
+    results = pool.map(lambda q: run_query(dispatch_bot, q), queries, chunksize=1)
+    elapsed = time.time() - start
+    pool.close()
+    pool.join()
+
+    latencies = sorted(result['latency_ms'] for result in results)
+    stages = {}
+    for result in results:
+        for name, item in result['summary'].items():
+            stage = stages.setdefault(name, {'count': 0, 'total_ms': 0.0})
+            stage['count'] += item['count']
+            stage['total_ms'] += item['total_ms']
+    for stage in stages.values():
+        stage['per_query_ms'] = round(stage['total_ms'] / max(len(results), 1), 3)
+        stage['total_ms'] = round(stage['total_ms'], 3)
+    sources = {}
+    for result in results:
+        key = result['source'] or ('ERROR' if result['error'] else 'MISSING')
+        sources[key] = sources.get(key, 0) + 1
+    return {
+        'queries': len(results),
+        'concurrency': concurrency,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_qps': round(len(results) / elapsed, 3) if elapsed else 0.0,
+        'latency_ms': {'mean': round(sum(latencies) / max(len(latencies), 1), 3),
+                       'p50': round(percentile(latencies, 50), 3),
+                       'p95': round(percentile(latencies, 95), 3),
+                       'p99': round(percentile(latencies, 99), 3),
+                       'max': round(latencies[-1], 3) if latencies else 0.0},
+        'sources': sources,
+        'errors': sum(1 for result in results if result['error']),
+        'degraded': sum(1 for result in results if result['degraded']),  # 因时间不足跳过了部分处理步骤的问句数
+        'stages': stages,
+    }
+
+
+def print_report(report):
+    print 'queries=%s, concurrency=%s, elapsed=%.3fs, throughput=%.3f qps, errors=%s, degraded=%s' % (
+        report['queries'], report['concurrency'], report['elapsed_s'], report['throughput_qps'], report['errors'],
+        report['degraded'])
+    latency = report['latency_ms']
+    print 'latency(ms): mean=%.3f p50=%.3f p95=%.3f p99=%.3f max=%.3f' % (
+        latency['mean'], latency['p50'], latency['p95'], latency['p99'], latency['max'])
+    print 'sources: %s' % json.dumps(report['sources'])
+    print '%-32s %10s %14s %14s' % ('stage', 'count', 'total(ms)', 'per query(ms)')
+    for name, stage in sorted(report['stages'].items(), key=lambda x: -x[1]['total_ms']):
+        print '%-32s %10s %14.3f %14.3f' % (name, stage['count'], stage['total_ms'], stage['per_query_ms'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='knowledge graph qa benchmark')
+    parser.add_argument('--offline', action='store_true', help='use in-process fake backends loaded from fixture')
+    parser.add_argument('--fixture', default=DEFAULT_FIXTURE_PATH, help='fixture directory for --offline')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--limit', type=int, default=0, help='max number of queries, 0 for all')
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--cache', action='store_true', help='enable answer cache')
+    parser.add_argument('--output', default='', help='write report as json')
+    parser.add_argument('--timeout', type=float, default=QUERY_TIMEOUT,
+                        help='time budget per query in seconds, 0 for no deadline')
+    args = parser.parse_args()
+
+    if args.offline:
+        fixture = load_fixture(args.fixture)
+        template_bot, retrieval_bot = build_offline_bots(fixture)
+        _queries = [doc['query'] for doc in fixture[CORPUS_FILE]]
+        if args.limit:
+            _queries = _queries[:args.limit]
+    else:
+        template_bot, retrieval_bot = None, None
+        _queries = load_live_queries(args.limit)
+    warm_up()
+    _dispatch_bot = DispatchBot(template_bot, retrieval_bot, worker_num=max(args.concurrency, 1),
+                                cache_size=ANSWER_CACHE_SIZE if args.cache else 0, trace_sample_rate=0,
+                                timeout=args.timeout)
+    _report = benchmark(_dispatch_bot, _queries, concurrency=args.concurrency, warmup=args.warmup)
+    _dispatch_bot.close()
+    print_report(_report)
+    if args.output:
+        with open(args.output, 'w') as fw:
+            json.dump(_report, fw, indent=2)
@@ -1,50 +1,135 @@
 # -*- coding: utf-8 -*-
+# 多进程评测：将测试问句分块分发到进程池，每个进程只加载一次bot，结果按原顺序写入csv
+import argparse
 import os
+import time
+import traceback
+from multiprocessing import Pool, cpu_count
 from time import strftime, localtime
 
 from pymongo import MongoClient
 from tqdm import tqdm
 
+from benchmark.fixture import CORPUS_FILE, load_fixture, build_offline_bots
 from config import MONGODB_HOST, MONGODB_PORT, MONGODB_DBNAME, MONGODB_TEST_CORPUS, HERE
-from service.retrieval_service import RetrievalBot
-from service.template_service import TemplateBot
+from service import warm_up
+from service.dispatch_service import DispatchBot
 
-client = MongoClient(MONGODB_HOST, MONGODB_PORT)
-db = client.get_database(MONGODB_DBNAME)
-test_corpus_collection = db.get_collection(MONGODB_TEST_CORPUS)
+CHUNK_SIZE = 20  # 每次分发给进程的问句数
+
+worker_bot = None  # 进程内的问答机器人，由init_worker创建
+
+
+def load_test_corpus(limit=None):
+    client = MongoClient(MONGODB_HOST, MONGODB_PORT)
+    test_corpus_collection = client.get_database(MONGODB_DBNAME).get_collection(MONGODB_TEST_CORPUS)
+    cursor = test_corpus_collection.find({}, {'query': 1, 'answer': 1})
+    if limit:
+        cursor = cursor.limit(limit)
+    docs = [{'query': doc['query'], 'answer': doc['answer']} for doc in cursor]
+    client.close()
+    return docs
+
+
+def init_worker(fixture_path=None):
+    global worker_bot
+    # 评测不设时间预算（timeout=0），避免进程池负载高时降级得到的答案被当作缺失
+    if fixture_path:
+        template_bot, retrieval_bot = build_offline_bots(load_fixture(fixture_path))
+        worker_bot = DispatchBot(template_bot, retrieval_bot, cache_size=0, trace_sample_rate=0, timeout=0)
+    else:
+        worker_bot = DispatchBot(cache_size=0, trace_sample_rate=0, timeout=0)
+    warm_up()
+
+
+def evaluate_chunk(docs):
+    """
+    在进程中逐条回答问句，记录耗时与异常
+    :param docs: [{'query': 问句, 'answer': 标准答案}]
+    :return: [(query, answer, reply_answer, source, elapsed_ms, error)]
+    """
+    results = []
+    for doc in docs:
+        query = doc['query']
+        reply_answer, source, error = '', '', ''
+        start = time.time()
+        try:
+            reply_answer, source = worker_bot.dispatch(query)
+        except Exception, e:
+            error = traceback.format_exc().strip().split('\n')[-1].decode('utf-8', 'replace')
+            worker_bot.exception(e)
+        elapsed_ms = (time.time() - start) * 1000
+        results.append((query, doc['answer'], reply_answer, source, elapsed_ms, error))
+    return results
+
+
+def evaluate_chunk_batch(docs):
+    """
+    在进程中用dispatch_batch批量回答整块问句，每条问句的耗时为整块耗时的平均值；批量问答异常时逐条重新回答
+    :param docs: [{'query': 问句, 'answer': 标准答案}]
+    :return: [(query, answer, reply_answer, source, elapsed_ms, error)]
+    """
+    start = time.time()
+    try:
+        replies = worker_bot.dispatch_batch([doc['query'] for doc in docs])
+    except Exception, e:
+        worker_bot.exception(e)
+        return evaluate_chunk(docs)
+    elapsed_ms = (time.time() - start) * 1000 / max(len(docs), 1)
+    return [(doc['query'], doc['answer'], reply_answer, source, elapsed_ms, '')
+            for doc, (reply_answer, source) in zip(docs, replies)]
+
+
+def iter_chunks(docs, chunk_size=CHUNK_SIZE):
+    for idx in xrange(0, len(docs), chunk_size):
+        yield docs[idx:idx + chunk_size]
 
 
 if __name__ == '__main__':
-    template_bot = TemplateBot()
-    retrieval_bot = RetrievalBot()
-    test_corpus_docs = test_corpus_collection.find()
+    parser = argparse.ArgumentParser(description='knowledge graph qa evaluation')
+    parser.add_argument('--processes', type=int, default=cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--limit', type=int, default=0, help='max number of queries, 0 for all')
+    parser.add_argument('--fixture', default='', help='evaluate offline with the fixture directory')
+    parser.add_argument('--batch', action='store_true',
+                        help='answer each chunk with dispatch_batch, elapsed time is averaged over the chunk')
+    args = parser.parse_args()
+
+    if args.fixture:
+        test_corpus_docs = load_fixture(args.fixture)[CORPUS_FILE]
+        if args.limit:
+            test_corpus_docs = test_corpus_docs[:args.limit]
+    else:
+        test_corpus_docs = load_test_corpus(args.limit)
     start_time = strftime("%Y-%m-%d-%H:%M:%S", localtime())
-    model_name = 'template_bot'
+    model_name = 'dispatch_bot_batch' if args.batch else 'dispatch_bot'
     missing_path = os.path.join(HERE, 'data/test_result/missing_%s_%s.csv' % (model_name, start_time))
     answer_path = os.path.join(HERE, 'data/test_result/answer_%s_%s.csv' % (model_name, start_time))
     fw_missing = open(missing_path, 'w')
     fw_answer = open(answer_path, 'w')
-    for doc in tqdm(test_corpus_docs):
-        query = doc['query']
-        answer = doc['answer']
-        try:
-            reply_answer = template_bot.reply(query).replace('\n', '\t')
-            if reply_answer:
-                line = '\t'.join([query, answer, reply_answer, 'TEMPLATE'])
-                fw_answer.write(line.encode('utf-8'))
-                fw_answer.write('\n')
-            else:
-                reply_answer = retrieval_bot.reply(query).replace('\n', '\t')
-                if reply_answer:
-                    line = '\t'.join([query, answer, reply_answer, 'RETRIEVAL'])
+
+    pool = Pool(args.processes, initializer=init_worker, initargs=(args.fixture or None, ))
+    error_count = 0
+    evaluate = evaluate_chunk_batch if args.batch else evaluate_chunk
+    with tqdm(total=len(test_corpus_docs)) as progress:
+        for chunk_results in pool.imap(evaluate, iter_chunks(test_corpus_docs, args.chunk_size)):
+            for query, answer, reply_answer, source, elapsed_ms, error in chunk_results:
+                progress.update(1)
+                elapsed = '%.3f' % elapsed_ms
+                reply_answer = reply_answer.replace('\n', '\t')
+                if reply_answer:  # 答案文件：问句、标准答案、回答、来源、耗时、异常
+                    line = '\t'.join([query, answer, reply_answer, source, elapsed, error])
                     fw_answer.write(line.encode('utf-8'))
                     fw_answer.write('\n')
-                else:
-                    line = '\t'.join([query, answer])
+                else:  # 缺失文件：问句、标准答案、耗时、异常
+                    line = '\t'.join([query, answer, elapsed, error])
                     fw_missing.write(line.encode('utf-8'))
                     fw_missing.write('\n')
-        except Exception, e:
-            print 'got error:', query
+                if error:
+                    error_count += 1
+    pool.close()
+    pool.join()
 
     fw_answer.close()
     fw_missing.close()
+    print 'done, queries=%s, errors=%s' % (len(test_corpus_docs), error_count)
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+# mongodb、solr、neo4j的进程内替身，用于离线压测
+import math
+import re
+from collections import defaultdict
+
+from config import SOLR_DEFAULT_ROWS
+from const import CYPER_SUBJECT_TEMPLATE, CYPER_OBJECT_TEMPLATE
+from utils import seg_doc_with_search, str2unicode
+from utils.logger import BaseLogger
+
+
+class FakeSolrAPIHandler(BaseLogger):
+    """
+    基于内存倒排索引的solr core替身，接口与SolrAPIHandler一致
+    召回规则与solr查询相同（查询词命中任一检索域即召回），按命中词的idf之和排序
+    """
+    def __init__(self, core_name, docs):
+        super(FakeSolrAPIHandler, self).__init__()
+        self.core_name = core_name
+        self.docs = docs
+        self._indexes = {}  # 检索域 -> 倒排索引
+        self.debug('init fake solr core_name=%s, docs=%s', core_name, len(docs))
+
+    def _field_index(self, field):
+        if field not in self._indexes:
+            index = defaultdict(set)
+            for idx, doc in enumerate(self.docs):
+                value = doc.get(field, u'')
+                words = value if isinstance(value, list) else value.split()
+                for word in words:
+                    index[word.strip()].add(idx)
+            self._indexes[field] = index
+        return self._indexes[field]
+
+    def _filter(self, extend_condition):
+        """
+        解析附加查询条件，仅支持+(field: value)的形式
+        """
+        conditions = re.findall(r'\+\((\w+):\s*([^)]+?)\s*\)', extend_condition or '')
+        return lambda doc: all(doc.get(field) == value for field, value in conditions)
+
+    def search_with_seg(self, query, **kwargs):
+        return self.search_words(seg_doc_with_search(str2unicode(query)), **kwargs)
+
+    def search_words(self, words, **kwargs):
+        query_fields = kwargs.get("query_fields", [])
+        rows = kwargs.get("rows", SOLR_DEFAULT_ROWS)
+        words = set(w.strip() for w in words if w.strip())
+        doc_filter = self._filter(kwargs.get("extend_condition", ""))
+        scores = defaultdict(float)
+        for field in query_fields:
+            index = self._field_index(field)
+            for word in words:
+                hits = index.get(word, ())
+                if hits:
+                    idf = math.log(float(len(self.docs)) / len(hits)) + 1.0
+                    for idx in hits:
+                        scores[idx] += idf
+        ranked = sorted((idx for idx in scores if doc_filter(self.docs[idx])), key=lambda x: (-scores[x], x))
+        return [dict(self.docs[idx], score=scores[idx]) for idx in ranked[:rows]]
+
+    def search_index(self, query_str, **kwargs):
+        return self.search_raw(query_str, **kwargs)
+
+    def search_raw(self, query_str, **kwargs):
+        rows = kwargs.get("rows", SOLR_DEFAULT_ROWS)
+        start = kwargs.get("start", 0)
+        if query_str == '*:*':
+            docs = self.docs
+        else:
+            is_match = re.match(r'^(\w+):\s*(\S+)$', query_str)
+            if not is_match:
+                self.warn('@@@@@@@@@@@@@@@@@@@@@@ fake solr only supports *:* and field:value, query_str=%s', query_str)
+                return []
+            field, value = is_match.groups()
+            docs = [doc for doc in self.docs if doc.get(field) == value]
+        return [dict(doc) for doc in docs[start:start + rows]]
+
+
+class FakeCursor(object):
+    def __init__(self, rows):
+        self.rows = rows
+
+    def data(self):
+        return self.rows
+
+
+class FakeTransaction(object):
+    def __init__(self, graph):
+        self.graph = graph
+
+    def run(self, statement):
+        return self.graph.run(statement)
+
+    def commit(self):
+        pass
+
+
+def _cypher_pattern(template):
+    """
+    将const中的cypher模板转换为解析语句的正则表达式，%s对应一个捕获组
+    """
+    parts = template.split('%s')
+    return re.compile(u'^' + u'(.+?)'.join(re.escape(part) for part in parts) + u'$')
+
+
+class FakeGraph(BaseLogger):
+    """
+    内存中的图数据库替身，支持const中CYPER_SUBJECT_TEMPLATE和CYPER_OBJECT_TEMPLATE生成的查询语句
+    其他语句从录制的结果中查找
+    """
+    def __init__(self, nodes, relations, responses=None):
+        """
+        :param nodes: 节点列表，[{'id': 节点id, 'properties': 节点属性}]
+        :param relations: 关系列表，[{'start': 起始节点id, 'type': 关系类型, 'end': 终止节点id}]
+        :param responses: 录制的查询结果，{cypher语句: 查询结果}
+        """
+        super(FakeGraph, self).__init__()
+        self.nodes = dict((node['id'], node.get('properties', {})) for node in nodes)
+        self.name_index = defaultdict(list)
+        for node_id, properties in self.nodes.items():
+            self.name_index[properties.get('name')].append(node_id)
+        self.out_relations = defaultdict(list)  # 节点id -> [(关系类型, 终止节点id)]
+        self.in_relations = defaultdict(list)   # 节点id -> [(关系类型, 起始节点id)]
+        for relation in relations:
+            self.out_relations[relation['start']].append((relation['type'], relation['end']))
+            self.in_relations[relation['end']].append((relation['type'], relation['start']))
+        self.responses = responses or {}
+        self.handlers = [
+            (_cypher_pattern(CYPER_SUBJECT_TEMPLATE['node_property']), self._node_property),
+            (_cypher_pattern(CYPER_SUBJECT_TEMPLATE['equal_node_property']), self._equal_node_property),
+            (_cypher_pattern(CYPER_SUBJECT_TEMPLATE['node_relation_property']), self._subject_relation_property),
+            (_cypher_pattern(CYPER_OBJECT_TEMPLATE['node_name']), self._node_name),
+            (_cypher_pattern(CYPER_OBJECT_TEMPLATE['node_relation_property']), self._object_relation_property),
+        ]
+
+    def _node_property(self, name, node_property, alias):
+        return [{alias: self.nodes[node_id].get(node_property)} for node_id in self.name_index.get(name, [])]
+
+    def _equal_node_property(self, name, node_property, alias):
+        rows = []
+        for node_id in self.name_index.get(name, []):
+            relations = self.out_relations[node_id] + self.in_relations[node_id]  # 无方向的关系
+            for relation_type, equal_id in relations:
+                if relation_type == 'COMMON_SAMEAS':
+                    rows.append({alias: self.nodes[equal_id].get(node_property)})
+        return rows
+
+    def _subject_relation_property(self, name, relation, node_property, alias):
+        rows = []
+        for node_id in self.name_index.get(name, []):
+            for relation_type, end_id in self.out_relations[node_id]:
+                if relation_type == relation:
+                    rows.append({alias: self.nodes[end_id].get(node_property)})
+        return rows
+
+    def _node_name(self, node_property, value, alias):
+        return [{alias: properties.get('name')} for properties in self.nodes.values()
+                if properties.get(node_property) == value]
+
+    def _object_relation_property(self, relation, name, node_property, alias):
+        rows = []
+        for node_id in self.name_index.get(name, []):
+            for relation_type, start_id in self.in_relations[node_id]:
+                if relation_type == relation:
+                    rows.append({alias: self.nodes[start_id].get(node_property)})
+        return rows
+
+    def run(self, statement):
+        statement = str2unicode(statement)
+        for pattern, handler in self.handlers:
+            is_match = pattern.match(statement)
+            if is_match:
+                return FakeCursor(handler(*is_match.groups()))
+        if statement in self.responses:
+            return FakeCursor(self.responses[statement])
+        self.warn('@@@@@@@@@@@@@@@@@@@@@@ fake graph can not handle statement=%s', statement)
+        return FakeCursor([])
+
+    def begin(self):
+        return FakeTransaction(self)
+
+
+class FakeMongoCursor(object):
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __iter__(self):
+        return iter(self.docs)
+
+    def count(self):
+        return len(self.docs)
+
+
+class FakeCollection(object):
+    """
+    mongodb collection的替身，find仅支持等值和$in条件
+    """
+    def __init__(self, docs):
+        self.docs = docs
+
+    @staticmethod
+    def _match(doc, spec):
+        for field, condition in spec.items():
+            value = doc.get(field)
+            if isinstance(condition, dict):
+                if '$in' in condition and value not in condition['$in']:
+                    return False
+            elif value != condition:
+                return False
+        return True
+
+    def find(self, spec=None):
+        spec = spec or {}
+        return FakeMongoCursor([dict(doc) for doc in self.docs if self._match(doc, spec)])
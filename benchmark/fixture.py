@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# 离线压测数据的导出与加载
+import json
+import os
+
+from py2neo import authenticate, Graph
+from pymongo import MongoClient
+
+from benchmark.fakes import FakeSolrAPIHandler, FakeGraph, FakeCollection
+from config import HERE, TEMPLATE_CORE_NAME, TRIPLE_CORE_NAME, MONGODB_HOST, MONGODB_PORT, MONGODB_DBNAME, \
+    MONGODB_BIOLOGY_PROPERTY, MONGODB_TEST_CORPUS, NEO4J_HOST_PORT, NEO4J_USER, NEO4J_PWD, NEO4J_URL
+from service.retrieval_service import RetrievalBot
+from service.template_service import TemplateBot
+from utils.logger import BaseLogger
+from utils.neo4j_api import KnowledgeDBAPI
+from utils.solr_api import SolrAPIHandler
+
+DEFAULT_FIXTURE_PATH = os.path.join(HERE, 'data/benchmark_fixture')
+
+# 压测数据文件，每行一个json文档
+TEMPLATE_FILE = 'template.jsonl'       # solr问句模板core
+TRIPLE_FILE = 'triple.jsonl'           # solr三元组core
+PROPERTY_FILE = 'property.jsonl'       # mongodb关系属性库
+NODE_FILE = 'graph_node.jsonl'         # neo4j节点
+RELATION_FILE = 'graph_relation.jsonl'  # neo4j关系
+CORPUS_FILE = 'corpus.jsonl'           # 测试问句
+
+DUMP_PAGE_SIZE = 1000
+
+
+def write_jsonl(path, docs):
+    count = 0
+    with open(path, 'w') as fw:
+        for doc in docs:
+            line = json.dumps(doc, ensure_ascii=False, default=str)
+            if isinstance(line, unicode):
+                line = line.encode('utf-8')
+            fw.write(line)
+            fw.write('\n')
+            count += 1
+    return count
+
+
+def read_jsonl(path):
+    docs = []
+    if os.path.exists(path):
+        with open(path, 'r') as fr:
+            for line in fr:
+                if line.strip():
+                    docs.append(json.loads(line))
+    return docs
+
+
+class FixtureDumper(BaseLogger):
+    """
+    从线上的solr、mongodb、neo4j导出离线压测数据
+    """
+    def __init__(self, path=DEFAULT_FIXTURE_PATH, **kwargs):
+        super(FixtureDumper, self).__init__(**kwargs)
+        self.path = path
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    def _dump_solr_core(self, core_name):
+        core = SolrAPIHandler(core_name)
+        start = 0
+        while True:
+            docs = core.search_index('*:*', rows=DUMP_PAGE_SIZE, start=start)
+            docs = list(docs) if docs else []
+            for doc in docs:
+                doc.pop('score', None)
+                doc.pop('_version_', None)
+                yield doc
+            if len(docs) < DUMP_PAGE_SIZE:
+                break
+            start += DUMP_PAGE_SIZE
+
+    def _dump_collection(self, collection_name, fields=None):
+        client = MongoClient(MONGODB_HOST, MONGODB_PORT)
+        collection = client.get_database(MONGODB_DBNAME).get_collection(collection_name)
+        for doc in collection.find():
+            doc.pop('_id', None)
+            if fields:
+                doc = dict((field, doc.get(field)) for field in fields)
+            yield doc
+
+    def _dump_graph(self):
+        authenticate(NEO4J_HOST_PORT, NEO4J_USER, NEO4J_PWD)
+        graph = Graph(NEO4J_URL)
+        nodes = graph.run("MATCH (node) RETURN id(node) as id, properties(node) as properties").data()
+        relations = graph.run("MATCH (node_a)-[r]->(node_b) "
+                              "RETURN id(node_a) as start, type(r) as type, id(node_b) as end").data()
+        return nodes, relations
+
+    def dump(self, corpus_limit=None):
+        count = write_jsonl(os.path.join(self.path, TEMPLATE_FILE), self._dump_solr_core(TEMPLATE_CORE_NAME))
+        self.info('dump %s templates', count)
+        count = write_jsonl(os.path.join(self.path, TRIPLE_FILE), self._dump_solr_core(TRIPLE_CORE_NAME))
+        self.info('dump %s triples', count)
+        count = write_jsonl(os.path.join(self.path, PROPERTY_FILE), self._dump_collection(MONGODB_BIOLOGY_PROPERTY))
+        self.info('dump %s properties', count)
+        corpus = self._dump_collection(MONGODB_TEST_CORPUS, fields=['query', 'answer'])
+        if corpus_limit:
+            corpus = (doc for idx, doc in enumerate(corpus) if idx < corpus_limit)
+        count = write_jsonl(os.path.join(self.path, CORPUS_FILE), corpus)
+        self.info('dump %s corpus docs', count)
+        nodes, relations = self._dump_graph()
+        write_jsonl(os.path.join(self.path, NODE_FILE), nodes)
+        write_jsonl(os.path.join(self.path, RELATION_FILE), relations)
+        self.info('dump %s nodes, %s relations', len(nodes), len(relations))
+
+
+def load_fixture(path=DEFAULT_FIXTURE_PATH):
+    """
+    加载离线压测数据
+    :return: {文件名: 文档列表}
+    """
+    return dict((name, read_jsonl(os.path.join(path, name)))
+                for name in [TEMPLATE_FILE, TRIPLE_FILE, PROPERTY_FILE, NODE_FILE, RELATION_FILE, CORPUS_FILE])
+
+
+def build_offline_bots(fixture):
+    """
+    使用离线压测数据构建TemplateBot和RetrievalBot，不依赖solr、mongodb和neo4j
+    :param fixture: load_fixture的返回值
+    :return: (template_bot, retrieval_bot)
+    """
+    template_core = FakeSolrAPIHandler(TEMPLATE_CORE_NAME, fixture[TEMPLATE_FILE])
+    triple_core = FakeSolrAPIHandler(TRIPLE_CORE_NAME, fixture[TRIPLE_FILE])
+    knowledge_db = KnowledgeDBAPI(graph=FakeGraph(fixture[NODE_FILE], fixture[RELATION_FILE]),
+                                  property_collection=FakeCollection(fixture[PROPERTY_FILE]))
+    template_bot = TemplateBot(template_core=template_core, triple_core=triple_core, knowledge_db=knowledge_db)
+    retrieval_bot = RetrievalBot(triple_core=triple_core)
+    return template_bot, retrieval_bot
+
+
+if __name__ == '__main__':
+    FixtureDumper().dump()
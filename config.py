@@ -7,6 +7,39 @@ HERE = os.path.abspath(os.path.dirname(__file__))
 LOGGER_PATH = HERE
 LOGGER_NAME = "knowledge_graph_qa_service.log"
 
+# trace config
+TRACE_SAMPLE_RATE = 0.0  # 请求耗时追踪的采样比例，为0时不采样
+TRACE_SAMPLE_PATH = os.path.join(LOGGER_PATH, "knowledge_graph_qa_trace.jsonl")
+
+# web config
+WEB_HOST = "0.0.0.0"
+WEB_PORT = 8000
+WEB_WORKER_NUM = 16  # web服务工作线程数
+
+# dispatch config
+DISPATCH_WORKER_NUM = 16  # 并行执行检索问答的线程数
+
+# deadline config
+QUERY_TIMEOUT = 3.0          # 单次问答的时间预算（秒），为0时不限制
+QUERY_DEGRADE_RESERVE = 0.5  # 剩余时间低于该值（秒）时跳过可选的处理步骤，返回目前得到的最好答案
+
+# template config
+TEMPLATE_WORKER_NUM = 8  # 并行匹配主语/宾语及并行查询知识库的线程数
+TEMPLATE_ANSWER_MODE = "sequential"  # 知识库查询方式：sequential/concurrent得到最高优先级的结果后停止，all查询全部三元组
+ENTITY_GAZETTEER_ENABLED = True  # 是否使用进程内的实体词典匹配主语，未匹配到时仍使用solr检索
+
+# embedding config
+EMBEDDING_BACKEND = "gensim"  # 词向量后端：gensim（KeyedVectors）、memmap（只读内存映射的float32矩阵）或h5
+
+# scoring config
+SCORING_PROCESSES = 0        # 计算候选三元组文档迁移距离的工作进程数，0表示在请求线程中计算
+SCORING_CHUNK_SIZE = 4       # 每个工作进程一次计算的候选数
+SCORING_MIN_CANDIDATES = 8   # 候选数达到该值时才使用工作进程
+
+# answer cache config
+ANSWER_CACHE_SIZE = 10000  # 答案缓存的最大条数，为0时不缓存
+ANSWER_CACHE_TTL = 3600    # 答案缓存过期时间（秒），为0时不过期
+
 # solr config
 SOLR_HOST = "127.0.0.1"
 SOLR_PORT = 8983
@@ -20,6 +53,7 @@ QUERY_CORE = "/".join([SOLR_SERVER, QUERY_CORE_NAME])
 
 TEMPLATE_CORE_NAME = "biology-template"
 TEMPLATE_CORE = "/".join([SOLR_SERVER, TEMPLATE_CORE_NAME])
+TEMPLATE_STORE_SOURCE = "solr"  # 问句模板的加载来源，solr或mongodb
 
 SOLR_CORE_MAP = {
     TRIPLE_CORE_NAME: TRIPLE_CORE,
@@ -30,8 +64,16 @@ SOLR_CORE_MAP = {
 SOLR_DEFAULT_ROWS = 50
 SOLR_DEFAULT_RETURN_FIELDS = ['*', 'score']
 
+# RetrievalBot的召回方式，solr（关键词检索）或dense（进程内的词向量质心余弦检索）
+RETRIEVAL_ENGINE = "solr"
+DENSE_INDEX_TYPE = "flat"  # dense召回的索引类型，flat（全量矩阵乘）或ivf（倒排聚类，适合大规模三元组库）
+DENSE_IVF_NLIST = 0        # ivf的聚类数，0表示取三元组数的平方根
+DENSE_IVF_NPROBE = 8       # ivf检索时访问的聚类数
+DENSE_MIN_SIMILARITY = 0.5  # dense召回的最低余弦相似度，相当于solr召回要求命中查询词
+
 # jieba_config
 CUSTOM_DICTIONARY_PATH = os.path.join(HERE, "data/dictionary", "custom_dictionary.txt")
+JIEBA_CACHE_PATH = os.path.join(HERE, "data/dictionary", "jieba_custom_dictionary.cache")  # 加载自定义词典后的词典缓存
 
 # neo4j config
 NEO4J_HOST_PORT = "localhost:7475"
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import math
 import os
 
 from config import HERE
@@ -38,13 +39,39 @@ SOLR_ESCAPE_PATTERN = {"+": "\+",
 # 模板匹配过滤阈值
 TRIPLE_MATCH_THRESHOLD = 1.0
 
-# 词向量路径
+# 词向量路径，train_embedding保存的Word2Vec；
+# 需用wordvector.export_keyed_vectors导出为同目录下的.kv文件（数组为单独的.npy），gensim后端才能内存映射加载
 DEFAULT_WORDING_EMBEDDING_PATH = os.path.join(HERE, 'data/word_embedding',
                                               'word_embedding_2017-06-25-23:36:57.vec')
 
+# gensim后端加载.kv文件时的内存映射方式，多个进程共享同一份页缓存，为None时读入内存
+DEFAULT_WORDING_EMBEDDING_MMAP = 'r'
+
+# 各词向量后端的文件路径，memmap与h5由wordembedding/embedding_h5.py从词向量导出
+WORDING_EMBEDDING_BACKEND_PATH = {
+    'gensim': DEFAULT_WORDING_EMBEDDING_PATH,
+    'memmap': DEFAULT_WORDING_EMBEDDING_PATH,  # 文件前缀，对应.vocab与.f32
+    'h5': DEFAULT_WORDING_EMBEDDING_PATH + '.h5',
+}
+
+# h5词向量disk模式下按行缓存的最大词数，词向量矩阵为压缩分块存储时避免重复解压同一分块
+DEFAULT_H5_ROW_CACHE_SIZE = 50000
+
+# 三元组文档词向量的预计算结果路径，由wordembedding/doc_embedding.py离线生成，不存在时现场计算
+DEFAULT_DOC_EMBEDDING_PATH = os.path.join(HERE, 'data/word_embedding', 'triple_doc_embedding')
+
 # 文档迁移过滤阈值
 DEFAULT_WMD_THRESHOLD = 0.5
 
+# 文档迁移距离转换为得分的缩放系数，score = exp(-distance / WMD_SCORE_SCALE)
+WMD_SCORE_SCALE = 19.0
+
+# 得分高于DEFAULT_WMD_THRESHOLD所允许的最大文档迁移距离
+DEFAULT_WMD_MAX_DISTANCE = -WMD_SCORE_SCALE * math.log(DEFAULT_WMD_THRESHOLD)
+
+# 使用距离下界剪枝时的相对误差容忍度，wmdistance使用float32词向量计算距离，需留出其舍入误差的余量
+WMD_BOUND_TOLERANCE = 1e-4
+
 # 主语同义词词典路径
 DEFAULT_SUBJECT_SYNONYM = os.path.join(HERE, 'data/dictionary', 'subject_synonym.txt')
 
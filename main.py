@@ -1,13 +1,9 @@
 # -*- coding: utf-8 -*-
-from service.retrieval_service import RetrievalBot
-from service.template_service import TemplateBot
+from service.dispatch_service import DispatchBot
 
 if __name__ == '__main__':
-    template_bot = TemplateBot()
-    retrieval_bot = RetrievalBot()
+    dispatch_bot = DispatchBot()
     while 1:
         query = raw_input('请输入问句：')
-        answer = template_bot.reply(query)
-        if not answer:
-            answer = retrieval_bot.reply(query)
+        answer = dispatch_bot.reply(query)
         print answer
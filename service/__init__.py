@@ -1,8 +1,116 @@
 # -*- coding: utf-8 -*-
-from const import DEFAULT_WORDING_EMBEDDING_PATH
-from wordembedding.wordvector import load_embedding
+import os
+import threading
 
-wording_embedding = load_embedding(DEFAULT_WORDING_EMBEDDING_PATH)
+import numpy as np
+
+from config import EMBEDDING_BACKEND
+from const import WORDING_EMBEDDING_BACKEND_PATH, DEFAULT_WORDING_EMBEDDING_MMAP, DEFAULT_DOC_EMBEDDING_PATH, \
+    WMD_BOUND_TOLERANCE
+from utils import seg_client
+from utils.logger import BaseLogger
+from wordembedding.backend import load_backend
+from wordembedding.doc_embedding import DocEmbeddingStore, build_doc_embedding, doc_wmdistance
+
+_wording_embedding = None  # 词向量后端，第一次使用时加载
+_doc_embedding_store = None  # 三元组文档词向量的预计算库，第一次使用时加载
+_doc_embedding_loaded = False
+_embedding_lock = threading.Lock()
+logger = BaseLogger()
+
+
+def get_wording_embedding():
+    """
+    获取配置的词向量后端，第一次调用时加载
+    :return: EmbeddingBackend
+    """
+    global _wording_embedding
+    if _wording_embedding is None:
+        with _embedding_lock:
+            if _wording_embedding is None:
+                _wording_embedding = load_backend(EMBEDDING_BACKEND, WORDING_EMBEDDING_BACKEND_PATH[EMBEDDING_BACKEND],
+                                                  DEFAULT_WORDING_EMBEDDING_MMAP)
+    return _wording_embedding
+
+
+def get_doc_embedding_store():
+    """
+    获取三元组文档词向量的预计算库，第一次调用时加载，库不存在或与词向量不一致时返回None
+    :return: DocEmbeddingStore
+    """
+    global _doc_embedding_store, _doc_embedding_loaded
+    if not _doc_embedding_loaded:
+        embedding = get_wording_embedding()
+        with _embedding_lock:
+            if not _doc_embedding_loaded:
+                if os.path.exists(DEFAULT_DOC_EMBEDDING_PATH):
+                    try:
+                        store = DocEmbeddingStore(DEFAULT_DOC_EMBEDDING_PATH, embedding.vector_size)
+                        if store.matches(embedding):
+                            _doc_embedding_store = store
+                        else:
+                            logger.warn('@@@@@@@@@@@@@@@@@@@@@@ doc embedding is stale against current word embedding, '
+                                        'compute in place, path=%s', DEFAULT_DOC_EMBEDDING_PATH)
+                    except Exception, e:
+                        logger.exception(e)
+                        logger.error('@@@@@@@@@@@@@@@@@@@@@@ load doc embedding failed, path=%s',
+                                     DEFAULT_DOC_EMBEDDING_PATH)
+                _doc_embedding_loaded = True
+    return _doc_embedding_store
+
+
+def warm_up():
+    """
+    预先加载分词词典与词向量模型，避免首个请求承担加载耗时，服务启动或工作进程初始化时调用
+    """
+    seg_client.initialize()
+    get_wording_embedding()
+    get_doc_embedding_store()
+
+
+class LongestCommonSubstring(object):
+    """
+    计算问句与多个检索结果的最长公共子串，问句只预处理一次
+    预处理记录每个词在问句中出现的位置，动态规划时只计算两边词相同的位置，
+    复杂度与两者之间相同词的配对数成正比，而不是len(query) * len(retrieval_str)
+    """
+    def __init__(self, query):
+        """
+        :param query: 问句，词列表或字符串
+        """
+        self.query = query
+        self.positions = dict()  # 词 -> 在问句中出现的下标（升序）
+        for i, item in enumerate(query):
+            self.positions.setdefault(item, []).append(i)
+
+    def match(self, retrieval_str):
+        """
+        计算与检索结果的最长公共子串，结果与逐格动态规划的实现一致：
+        有多个最长子串时，返回在问句中结束位置最靠前的一个
+        :param retrieval_str: 检索结果，词列表或字符串
+        :return: (最长公共子串, 长度)
+        """
+        mmax = 0  # 最长匹配的长度
+        p = 0  # 最长匹配对应在query中的最后一位
+        prev = {}  # 以retrieval_str[j-1]结尾的公共后缀长度，key为问句下标
+        for item in retrieval_str:
+            cur = {}
+            for i in self.positions.get(item, ()):
+                length = prev.get(i - 1, 0) + 1
+                cur[i] = length
+                if length > mmax or (length == mmax and i + 1 < p):
+                    mmax = length
+                    p = i + 1
+            prev = cur
+        return self.query[p - mmax:p], mmax  # 返回最长子串及其长度
+
+    def match_batch(self, retrieval_strs):
+        """
+        批量计算与多个检索结果的最长公共子串
+        :param retrieval_strs: 检索结果列表
+        :return: 与retrieval_strs一一对应的(最长公共子串, 长度)列表
+        """
+        return [self.match(retrieval_str) for retrieval_str in retrieval_strs]
 
 
 def longest_common_substring(query, retrieval_str):
@@ -12,18 +120,7 @@ def longest_common_substring(query, retrieval_str):
     :param retrieval_str:检索结果
     :return: 最长公共子串长度
     """
-    # 生成0矩阵，为方便后续计算，比字符串长度多了一列
-    m = [[0 for i in range(len(retrieval_str) + 1)] for j in range(len(query) + 1)]
-    mmax = 0  # 最长匹配的长度
-    p = 0  # 最长匹配对应在query中的最后一位
-    for i in range(len(query)):
-        for j in range(len(retrieval_str)):
-            if query[i] == retrieval_str[j]:
-                m[i + 1][j + 1] = m[i][j] + 1
-                if m[i + 1][j + 1] > mmax:
-                    mmax = m[i + 1][j + 1]
-                    p = i + 1
-    return query[p - mmax:p], mmax  # 返回最长子串及其长度
+    return LongestCommonSubstring(query).match(retrieval_str)
 
 
 def calculate_wmd(words_1, words_2):
@@ -33,10 +130,107 @@ def calculate_wmd(words_1, words_2):
     :param words_2:
     :return:
     """
-    score = wording_embedding.wmdistance(words_1, words_2)
+    score = get_wording_embedding().wmdistance(words_1, words_2)
     return score
 
 
+def lookup_doc_embeddings(docs_words, doc_ids=None):
+    """
+    获取文档的DocEmbedding，优先读取预计算库，不在库中或已过期的文档现场计算
+    :param docs_words: 文档分词列表
+    :param doc_ids: 与docs_words一一对应的文档id
+    :return: 与docs_words一一对应的DocEmbedding，没有词在词向量中的为None
+    """
+    embedding = get_wording_embedding()
+    store = get_doc_embedding_store()
+    doc_embeddings = []
+    for idx, doc_words in enumerate(docs_words):
+        doc_embedding = None
+        if store is not None and doc_ids is not None:
+            doc_embedding = store.get(doc_ids[idx], doc_words)
+        if doc_embedding is None:
+            doc_embedding = build_doc_embedding(embedding, doc_words)
+        doc_embeddings.append(doc_embedding)
+    return doc_embeddings
+
+
+class WordMoverDistance(object):
+    """
+    计算问句与多个文档的文档迁移距离，问句的词向量与nBOW权重只计算一次
+    文档优先使用离线预计算的DocEmbedding（见wordembedding/doc_embedding.py），每个候选文档的计算只与问句有关
+    结果与wmdistance一致：去掉不在词向量中的词，任一方为空时距离为inf
+    """
+    def __init__(self, words):
+        """
+        :param words: 问句分词
+        """
+        self.words = words
+        self.embedding = get_wording_embedding()
+        self.query = build_doc_embedding(self.embedding, words)
+
+    def doc_embeddings(self, docs_words, doc_ids=None):
+        """
+        获取文档的DocEmbedding，不在预计算库中的文档现场计算
+        :param docs_words: 文档分词列表
+        :param doc_ids: 与docs_words一一对应的文档id
+        :return: 与docs_words一一对应的DocEmbedding，没有词在词向量中的为None
+        """
+        return lookup_doc_embeddings(docs_words, doc_ids)
+
+    def lower_bounds(self, doc_embeddings):
+        """
+        批量计算文档迁移距离的下界，取relaxed WMD（两侧各自只保留一个约束）与词向量质心距离中的较大者，
+        两者都不大于distance的结果，可以在计算精确距离之前剪枝
+        问句的词与所有文档的词之间的距离只计算一次
+        :param doc_embeddings: doc_embeddings的结果
+        :return: 与doc_embeddings一一对应的下界，为空的文档为inf
+        """
+        bounds = [float('inf')] * len(doc_embeddings)
+        if self.query is None:
+            return bounds
+        vocab_ids = dict()  # 所有文档的词 -> 列下标
+        vectors = []
+        columns = []
+        for doc_embedding in doc_embeddings:
+            if doc_embedding is None:
+                columns.append(None)
+                continue
+            for w, vector in zip(doc_embedding.words, doc_embedding.vectors):
+                if w not in vocab_ids:
+                    vocab_ids[w] = len(vectors)
+                    vectors.append(vector)
+            columns.append([vocab_ids[w] for w in doc_embedding.words])
+        if not vectors:
+            return bounds
+        vectors = np.array(vectors, dtype=np.float64)
+        query_vectors = self.query.vectors.astype(np.float64)
+        distances = np.sqrt(((query_vectors[:, None, :] - vectors[None, :, :]) ** 2).sum(axis=2))
+        for k, doc_embedding in enumerate(doc_embeddings):
+            if doc_embedding is None:
+                continue
+            sub_distances = distances[:, columns[k]]
+            relaxed_query = self.query.weights.dot(sub_distances.min(axis=1))  # 问句的每个词都移动到最近的文档词
+            relaxed_doc = doc_embedding.weights.dot(sub_distances.min(axis=0))  # 文档的每个词都移动到最近的问句词
+            centroid = np.linalg.norm(self.query.centroid - doc_embedding.centroid)
+            bounds[k] = max(relaxed_query, relaxed_doc, centroid)
+        return bounds
+
+    def distance(self, doc_embedding):
+        """
+        计算与文档的文档迁移距离
+        :param doc_embedding: DocEmbedding
+        :return: 文档迁移距离
+        """
+        return doc_wmdistance(self.query, doc_embedding)
+
+
+def exceeds_bound(lower_bound, limit):
+    """
+    下界是否确定超过limit，留有浮点误差的余量
+    """
+    return lower_bound > limit + WMD_BOUND_TOLERANCE * max(1.0, abs(limit))
+
+
 if __name__ == '__main__':
     qa = [u'你', u'是', u'谁']
     qb = [u'你', u'谁', u'啊']
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+from config import QUERY_DEGRADE_RESERVE
+from utils.tracer import NULL_TRACER
+
+
+class QueryContext(object):
+    """
+    单次问答请求的上下文
+    请求相关的状态都保存在context中并在各处理阶段间显式传递，bot实例本身不保存请求状态，
+    因此同一个bot可以被多个线程同时使用
+    """
+    def __init__(self, query, tracer=None, timeout=None, degrade_reserve=QUERY_DEGRADE_RESERVE):
+        """
+        :param query: 预处理后的问句
+        :param tracer: 记录各阶段耗时的Tracer
+        :param timeout: 请求的时间预算（秒），为空或0时不限制
+        :param degrade_reserve: 剩余时间低于该值（秒）时，各阶段跳过可选的处理步骤
+        """
+        self.query = query  # 预处理后的问句
+        self.tracer = tracer or NULL_TRACER  # 记录各阶段耗时
+        self.deadline = time.time() + timeout if timeout else None  # 截止时间
+        self.degrade_reserve = degrade_reserve
+        self.degraded_stages = []  # 因时间不足跳过了部分处理步骤的阶段
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        """
+        取消请求，各处理阶段检查到取消后跳过剩余的工作
+        """
+        self._cancel_event.set()
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def time_left(self):
+        """
+        :return: 距截止时间的剩余秒数，未设置截止时间时返回None
+        """
+        if self.deadline is None:
+            return None
+        return self.deadline - time.time()
+
+    def is_expired(self):
+        """
+        是否已超过截止时间
+        """
+        return self.deadline is not None and self.time_left() <= 0
+
+    def is_expiring(self):
+        """
+        剩余时间是否已不足，此时各阶段应跳过可选的处理步骤，返回目前得到的最好结果
+        """
+        return self.deadline is not None and self.time_left() < self.degrade_reserve
+
+    def mark_degraded(self, stage):
+        """
+        记录因时间不足而跳过处理步骤的阶段，降级得到的答案不写入缓存
+        :param stage: 阶段名称
+        """
+        self.degraded_stages.append(stage)
+        with self.tracer.span('degraded', stage=stage):
+            pass
+
+    def is_degraded(self):
+        return bool(self.degraded_stages)
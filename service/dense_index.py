@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+# 进程内的三元组稠密向量索引
+import threading
+
+import numpy as np
+
+from config import TRIPLE_CORE_NAME, SOLR_DEFAULT_ROWS, DENSE_INDEX_TYPE, DENSE_IVF_NLIST, DENSE_IVF_NPROBE, \
+    DENSE_MIN_SIMILARITY
+from service import get_wording_embedding, lookup_doc_embeddings
+from utils import seg_doc, str2unicode
+from utils.logger import BaseLogger
+from utils.solr_api import SolrAPIHandler
+from wordembedding.doc_embedding import DOC_INDEX_FIELD, build_doc_embedding
+
+LOAD_PAGE_SIZE = 1000  # 从solr分页加载三元组时每页的条数
+KMEANS_ITERATIONS = 10  # ivf聚类的迭代次数
+KMEANS_SEED = 0
+
+
+def normalize_rows(matrix):
+    """
+    按行归一化为单位向量，零向量保持不变
+    """
+    norms = np.linalg.norm(matrix, axis=1)
+    norms[norms == 0] = 1.0
+    return matrix / norms[:, None]
+
+
+def top_k(scores, k):
+    """
+    返回得分最高的k个下标，按得分降序，得分相同时下标小的在前
+    :param scores: 一维得分
+    :param k: 返回个数
+    :return: 下标数组
+    """
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.lexsort((candidates, -scores[candidates]))]
+
+
+def spherical_kmeans(vectors, nlist, iterations=KMEANS_ITERATIONS, seed=KMEANS_SEED):
+    """
+    对单位向量做球面k-means（以余弦相似度分配），用于ivf的粗聚类
+    :param vectors: 单位向量矩阵
+    :param nlist: 聚类数
+    :return: (聚类中心, 每个向量所属的聚类)
+    """
+    rs = np.random.RandomState(seed)
+    centers = vectors[rs.choice(len(vectors), nlist, replace=False)]
+    assign = np.zeros(len(vectors), dtype=np.int64)
+    for _ in xrange(iterations):
+        assign = vectors.dot(centers.T).argmax(axis=1)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, assign, vectors)
+        empty = np.bincount(assign, minlength=nlist) == 0
+        sums[empty] = centers[empty]  # 空聚类保留原中心
+        centers = normalize_rows(sums)
+    return centers, assign
+
+
+class DenseTripleIndex(BaseLogger):
+    """
+    以词向量的nBOW质心表示每个三元组，检索时计算问句质心与全部三元组的余弦相似度并取top-k，
+    不依赖solr的关键词命中，没有共同词的同义表述也能召回；接口与SolrAPIHandler.search_with_seg一致
+    index_type为ivf时先将三元组聚类，检索只计算与问句最相近的nprobe个聚类中的三元组，结果为近似top-k
+    """
+    def __init__(self, triple_core=None, index_type=DENSE_INDEX_TYPE, nlist=DENSE_IVF_NLIST, nprobe=DENSE_IVF_NPROBE,
+                 min_similarity=DENSE_MIN_SIMILARITY, field=DOC_INDEX_FIELD, **kwargs):
+        """
+        :param triple_core: 加载三元组的检索接口，为空时使用solr三元组core
+        :param index_type: flat或ivf
+        :param nlist: ivf的聚类数，0表示取三元组数的平方根
+        :param nprobe: ivf检索时访问的聚类数
+        :param min_similarity: 召回的最低余弦相似度
+        :param field: 计算质心所用的分词域
+        """
+        super(DenseTripleIndex, self).__init__(**kwargs)
+        self.debug('>>> init DenseTripleIndex <<<')
+        self.triple_core = triple_core or SolrAPIHandler(TRIPLE_CORE_NAME)
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_similarity = min_similarity
+        self.field = field
+        self._lock = threading.Lock()
+        self._state = ([], np.zeros((0, 0), dtype=np.float32), None)  # (三元组, 单位质心矩阵, ivf索引)，整体替换
+        self.load()
+
+    def _read_triples(self):
+        start = 0
+        while True:
+            docs = self.triple_core.search_raw('*:*', rows=LOAD_PAGE_SIZE, start=start)  # 查询语句不能转义
+            docs = list(docs) if docs else []
+            for doc in docs:
+                yield doc
+            if len(docs) < LOAD_PAGE_SIZE:
+                break
+            start += LOAD_PAGE_SIZE
+
+    def _build_ivf(self, matrix):
+        """
+        :return: (聚类中心, [每个聚类的三元组下标])
+        """
+        nlist = self.nlist or int(np.sqrt(len(matrix)))
+        nlist = max(1, min(nlist, len(matrix)))
+        centers, assign = spherical_kmeans(matrix, nlist)
+        lists = [np.flatnonzero(assign == idx) for idx in xrange(nlist)]
+        return centers, lists
+
+    def load(self):
+        """
+        加载全部三元组并重建索引，没有词在词向量中的三元组不参与检索
+        :return: 三元组数
+        """
+        with self._lock:
+            docs = list(self._read_triples())
+            docs_words = [str2unicode(doc.get(self.field, u'')).split() for doc in docs]
+            doc_embeddings = lookup_doc_embeddings(docs_words, [doc.get('id') for doc in docs])
+            triples, centroids = [], []
+            for doc, doc_embedding in zip(docs, doc_embeddings):
+                if doc_embedding is not None:
+                    triples.append(doc)
+                    centroids.append(doc_embedding.centroid)
+            if centroids:
+                matrix = normalize_rows(np.array(centroids, dtype=np.float32))
+            else:
+                matrix = np.zeros((0, get_wording_embedding().vector_size), dtype=np.float32)
+            ivf = self._build_ivf(matrix) if self.index_type == 'ivf' and len(matrix) else None
+            self._state = (triples, matrix, ivf)
+            self.info('load %s triples, index_type=%s, nlist=%s', len(triples), self.index_type,
+                      len(ivf[1]) if ivf else 0)
+        return len(triples)
+
+    def refresh(self):
+        """
+        重新加载三元组，加载失败时保留原有索引
+        :return: 是否加载成功
+        """
+        try:
+            self.load()
+        except Exception, e:
+            self.exception(e)
+            self.error('@@@@@@@@@@@@@@@@@@@@@@ refresh dense index failed, keep %s triples', len(self))
+            return False
+        return True
+
+    def embed_queries(self, queries):
+        """
+        计算问句的单位质心向量
+        :param queries: 问句列表
+        :return: 矩阵，没有词在词向量中的问句为零向量
+        """
+        embedding = get_wording_embedding()
+        vectors = np.zeros((len(queries), embedding.vector_size), dtype=np.float32)
+        for idx, query in enumerate(queries):
+            words, tags = seg_doc(query)
+            query_embedding = build_doc_embedding(embedding, [w.strip() for w in words if w.strip()])
+            if query_embedding is not None:
+                vectors[idx] = query_embedding.centroid
+        return normalize_rows(vectors)
+
+    def search_vectors(self, query_vectors, rows=SOLR_DEFAULT_ROWS):
+        """
+        批量检索余弦相似度最高的三元组
+        :param query_vectors: 单位向量矩阵，每行为一个问句
+        :param rows: 每个问句返回的三元组数
+        :return: 与query_vectors一一对应的[(三元组, 余弦相似度)]，不含相似度低于min_similarity的三元组
+        """
+        triples, matrix, ivf = self._state
+        results = [[] for _ in xrange(len(query_vectors))]
+        if not len(matrix):
+            return results
+        valid = np.flatnonzero(np.abs(query_vectors).sum(axis=1) > 0)  # 零向量的问句不检索
+        if ivf is None:
+            scores = query_vectors[valid].dot(matrix.T)  # 一次矩阵乘计算全部问句与全部三元组的相似度
+            for row, idx in enumerate(valid):
+                ranked = top_k(scores[row], rows)
+                results[idx] = [(triples[k], float(scores[row][k])) for k in ranked
+                                if scores[row][k] >= self.min_similarity]
+        else:
+            centers, lists = ivf
+            coarse = query_vectors[valid].dot(centers.T)
+            for row, idx in enumerate(valid):
+                probes = top_k(coarse[row], self.nprobe)
+                candidates = np.sort(np.concatenate([lists[k] for k in probes]))
+                scores = matrix[candidates].dot(query_vectors[idx])
+                ranked = top_k(scores, rows)
+                results[idx] = [(triples[candidates[k]], float(scores[k])) for k in ranked
+                                if scores[k] >= self.min_similarity]
+        return results
+
+    def search_batch_with_seg(self, queries, **kwargs):
+        """
+        批量检索，问句的向量化与相似度计算按批进行
+        :param queries: 问句列表
+        :return: 与queries一一对应的三元组列表，score为余弦相似度
+        """
+        rows = kwargs.get("rows", SOLR_DEFAULT_ROWS)
+        results = self.search_vectors(self.embed_queries(queries), rows)
+        return [[dict(doc, score=score) for doc, score in result] for result in results]
+
+    def search_with_seg(self, query, **kwargs):
+        """
+        检索与问句余弦相似度最高的三元组，参数与SolrAPIHandler.search_with_seg一致，query_fields等检索条件不生效
+        :param query: 问句
+        :return: 三元组列表，score为余弦相似度
+        """
+        return self.search_batch_with_seg([query], **kwargs)[0]
+
+    def __len__(self):
+        return len(self._state[0])
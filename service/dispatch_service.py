@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+import threading
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+from config import DISPATCH_WORKER_NUM, ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, TRACE_SAMPLE_RATE, TRACE_SAMPLE_PATH, \
+    QUERY_TIMEOUT
+from service.context import QueryContext
+from service.retrieval_service import RetrievalBot
+from service.template_service import TemplateBot
+from utils import normalize_query
+from utils.cache import LRUCache
+from utils.logger import BaseLogger
+from utils.tracer import Tracer, TraceSampler, NULL_TRACER
+
+
+class DispatchBot(BaseLogger):
+    """
+    同时启动模板问答与检索问答，模板答案优先，模板未得到答案时返回检索答案
+    """
+    def __init__(self, template_bot=None, retrieval_bot=None, worker_num=DISPATCH_WORKER_NUM,
+                 cache_size=ANSWER_CACHE_SIZE, cache_ttl=ANSWER_CACHE_TTL,
+                 trace_sample_rate=TRACE_SAMPLE_RATE, trace_sample_path=TRACE_SAMPLE_PATH, timeout=QUERY_TIMEOUT,
+                 **kwargs):
+        super(DispatchBot, self).__init__(**kwargs)
+        self.debug('>>> init DispatchBot <<<')
+        self.template_bot = template_bot or TemplateBot()
+        self.retrieval_bot = retrieval_bot or RetrievalBot()
+        self.pool = ThreadPool(worker_num)  # 执行检索问答的线程池
+        self.answer_cache = LRUCache(cache_size, ttl=cache_ttl)  # 以预处理后的问句为key缓存(答案, 答案来源)
+        self._cache_generation = 0  # flush_cache时加1，计算答案期间发生变化的答案不缓存
+        self._cache_lock = threading.Lock()
+        self.trace_sampler = TraceSampler(trace_sample_path, trace_sample_rate)  # 按比例将请求耗时写入文件
+        self.timeout = timeout  # 单次问答的默认时间预算（秒），为0时不限制
+
+    def dispatch(self, query, tracer=None, timeout=None):
+        """
+        并行执行模板问答与检索问答
+        :param query: 用户输入问句
+        :param tracer: 记录各阶段耗时的Tracer，为空时按采样比例决定是否追踪
+        :param timeout: 时间预算（秒），为空时使用默认值，时间不足时各阶段跳过可选步骤并返回目前得到的最好答案
+        :return: (答案, 答案来源)，答案来源为TEMPLATE/RETRIEVAL，未得到答案时为空
+        """
+        self.debug('[start DispatchBot dispatch]')
+        sampled = False
+        if tracer is None:
+            sampled = self.trace_sampler.should_sample()
+            tracer = Tracer() if sampled else NULL_TRACER
+        with tracer.span('normalize_query'):
+            normal_query = normalize_query(query)
+        answer, source = '', ''
+        with tracer.span('answer_cache'):
+            cached = self.answer_cache.get(normal_query) if normal_query else None
+        if cached is not None:
+            answer, source = cached
+            self.debug('got cached answer, query=%s', normal_query)
+        elif normal_query:
+            generation = self._cache_generation
+            if timeout is None:
+                timeout = self.timeout
+            template_context = QueryContext(normal_query, tracer=tracer, timeout=timeout)
+            retrieval_context = QueryContext(normal_query, tracer=tracer, timeout=timeout)
+            retrieval_result = self.pool.apply_async(self.retrieval_bot.reply, (normal_query, ),
+                                                     {'context': retrieval_context})
+            try:
+                answer = self.template_bot.reply(normal_query, context=template_context)  # 模板问答在当前线程执行
+            except Exception:
+                retrieval_context.cancel()
+                raise
+            if answer:  # 模板得到答案，取消检索问答
+                retrieval_context.cancel()
+                source = 'TEMPLATE'
+            else:
+                time_left = retrieval_context.time_left()
+                with tracer.span('wait_retrieval'):
+                    try:
+                        answer = retrieval_result.get(max(time_left, 0) if time_left is not None else None)
+                    except TimeoutError:  # 超过截止时间，取消检索问答
+                        retrieval_context.cancel()
+                        retrieval_context.mark_degraded('wait_retrieval')
+                if answer:
+                    source = 'RETRIEVAL'
+            degraded_stages = list(template_context.degraded_stages)
+            if source != 'TEMPLATE':  # 模板得到答案时检索问答已取消，不关心其是否降级
+                degraded_stages.extend(retrieval_context.degraded_stages)
+            if degraded_stages:  # 降级得到的答案不缓存
+                self.info('degraded answer, query=%s, stages=%s', normal_query, ','.join(degraded_stages))
+            else:
+                self._cache_answer(normal_query, (answer, source), generation)
+        else:
+            self.warn("@@@@@@@@@@@@@@@@@@@ unexpected value, query is None")
+        if sampled:
+            self.trace_sampler.write(normal_query, tracer.to_dict())
+        self.debug('source=%s, answer=%s', source, answer)
+        self.debug('[end DispatchBot dispatch]')
+        return answer, source
+
+    def dispatch_batch(self, queries):
+        """
+        批量问答，先对全部问句进行模板问答，再对模板未回答的问句进行检索问答
+        :param queries: 用户输入问句列表
+        :return: 与queries一一对应的(答案, 答案来源)列表
+        """
+        self.debug('[start DispatchBot dispatch_batch]')
+        normal_queries = [normalize_query(query) for query in queries]
+        results = dict()
+        for normal_query in normal_queries:
+            cached = self.answer_cache.get(normal_query) if normal_query else None
+            if cached is not None:
+                results[normal_query] = cached
+        pending_queries = list(set(q for q in normal_queries if q and q not in results))
+        if pending_queries:
+            generation = self._cache_generation
+            template_answers = self.template_bot.reply_batch(pending_queries)
+            retrieval_queries = []
+            for normal_query, answer in zip(pending_queries, template_answers):
+                if answer:
+                    results[normal_query] = (answer, 'TEMPLATE')
+                else:
+                    retrieval_queries.append(normal_query)
+            if retrieval_queries:
+                retrieval_answers = self.retrieval_bot.reply_batch(retrieval_queries)
+                for normal_query, answer in zip(retrieval_queries, retrieval_answers):
+                    results[normal_query] = (answer, 'RETRIEVAL' if answer else '')
+            for normal_query in pending_queries:
+                self._cache_answer(normal_query, results[normal_query], generation)
+        self.debug('[end DispatchBot dispatch_batch]')
+        return [results.get(normal_query, ('', '')) for normal_query in normal_queries]
+
+    def reply(self, query):
+        """
+        根据query返回答案
+        :param query: 用户输入问句
+        :return: 答案
+        """
+        answer, source = self.dispatch(query)
+        return answer
+
+    def refresh_templates(self):
+        """
+        重新加载问句模板、发生变化的主语同义词词典、实体词典及稠密向量索引，并清空依赖旧数据得到的答案缓存
+        :return: 是否加载成功
+        """
+        ret = self.template_bot.template_store.refresh()
+        try:
+            self.template_bot.entity_synonym.reload()
+        except Exception, e:
+            self.exception(e)
+            self.error('@@@@@@@@@@@@@@@@@@@@@@ reload synonyms failed')
+            ret = False
+        if self.template_bot.gazetteer is not None:
+            ret = self.template_bot.gazetteer.refresh() and ret
+        if self.retrieval_bot.engine == 'dense':
+            ret = self.retrieval_bot.retrieval_core.refresh() and ret
+        self.flush_cache()
+        return ret
+
+    def _cache_answer(self, normal_query, result, generation):
+        """
+        缓存答案，计算期间缓存已被清空时不缓存，避免用旧数据得到的答案在整个TTL内被返回
+        :param normal_query: 预处理后的问句
+        :param result: (答案, 答案来源)
+        :param generation: 开始计算答案时的_cache_generation
+        """
+        with self._cache_lock:
+            if generation == self._cache_generation:
+                self.answer_cache.set(normal_query, result)
+            else:
+                self.debug('cache flushed while answering, skip caching query=%s', normal_query)
+
+    def flush_cache(self):
+        """
+        清空答案缓存，知识图谱或模板更新后调用，正在计算的答案不再写入缓存
+        """
+        self.info('flush answer cache, stats=%s', self.answer_cache.stats())
+        with self._cache_lock:
+            self._cache_generation += 1
+            self.answer_cache.clear()
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        self.template_bot.close()
+
+
+if __name__ == '__main__':
+    bot = DispatchBot()
+    while 1:
+        _query = raw_input('请输入问句：')
+        _answer = bot.reply(_query)
+        print _answer
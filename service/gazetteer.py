@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# 进程内的实体词典
+import threading
+
+from config import TRIPLE_CORE_NAME
+from utils import seg_doc, str2unicode
+from utils.aho_corasick import AhoCorasick
+from utils.logger import BaseLogger
+from utils.solr_api import SolrAPIHandler
+
+LOAD_PAGE_SIZE = 1000  # 从solr分页加载实体时每页的条数
+
+
+class EntityGazetteer(BaseLogger):
+    """
+    由三元组库中attribute_name为name的三元组（实体名）及主语同义词构建按词匹配的Aho-Corasick自动机，
+    一次扫描找出句子分词中完整出现的实体
+    匹配规则与_sort_docs_by_subject一致：实体名（或其同义词）的全部分词连续出现在句子分词中，取分词数最多的实体
+    """
+    def __init__(self, triple_core=None, synonym_store=None, **kwargs):
+        """
+        :param triple_core: 三元组检索接口，为空时使用solr三元组core
+        :param synonym_store: 主语同义词库，同义词出现时匹配到对应的实体
+        """
+        super(EntityGazetteer, self).__init__(**kwargs)
+        self.debug('>>> init EntityGazetteer <<<')
+        self.triple_core = triple_core or SolrAPIHandler(TRIPLE_CORE_NAME)
+        self.synonym_store = synonym_store
+        self._lock = threading.Lock()
+        self._state = ([], AhoCorasick().build())  # (实体列表[(实体名, 分词数)], 自动机)，整体替换
+        self.load()
+
+    def _read_entities(self):
+        start = 0
+        while True:
+            docs = self.triple_core.search_raw('attribute_name:name', rows=LOAD_PAGE_SIZE, start=start)  # 查询语句不能转义
+            docs = list(docs) if docs else []
+            for doc in docs:
+                yield doc
+            if len(docs) < LOAD_PAGE_SIZE:
+                break
+            start += LOAD_PAGE_SIZE
+
+    def load(self):
+        """
+        加载全部实体并重建自动机
+        :return: 实体数
+        """
+        with self._lock:
+            entities = []
+            entity_ids = dict()  # 实体名 -> 下标
+            automaton = AhoCorasick()
+            for doc in self._read_entities():
+                name = str2unicode(doc.get('attribute_date', ''))
+                tokens = [w.strip() for w in str2unicode(doc.get('attribute_date_index', '')).split() if w.strip()]
+                if not name or not tokens or name in entity_ids:
+                    continue
+                entity_ids[name] = len(entities)
+                entities.append((name, len(tokens)))
+                automaton.add(tokens, entity_ids[name])
+            synonym_count = 0
+            if self.synonym_store is not None:
+                for name, tokens in self.synonym_store.iter_synonyms():
+                    if name in entity_ids and tokens:
+                        automaton.add(list(tokens), entity_ids[name])
+                        synonym_count += 1
+            self._state = (entities, automaton.build())
+            self.info('load %s entities, %s synonyms', len(entities), synonym_count)
+        return len(entities)
+
+    def refresh(self):
+        """
+        重新加载实体，加载失败时保留原有实体
+        :return: 是否加载成功
+        """
+        try:
+            self.load()
+        except Exception, e:
+            self.exception(e)
+            self.error('@@@@@@@@@@@@@@@@@@@@@@ refresh entities failed, keep %s entities', len(self))
+            return False
+        return True
+
+    def match_tokens(self, words):
+        """
+        找出分词中出现的实体，按实体的分词数降序排列，分词数相同时按出现位置排列
+        :param words: 句子分词
+        :return: [(实体名, 起始下标, 结束下标（不含）)]
+        """
+        entities, automaton = self._state
+        mentions = dict()  # 实体下标 -> 第一次出现的位置
+        for start, end, idx in automaton.iter_matches(words):
+            if idx not in mentions:
+                mentions[idx] = (start, end)
+        ranked = sorted(mentions, key=lambda x: (-entities[x][1], mentions[x][0], x))
+        return [(entities[idx][0], ) + mentions[idx] for idx in ranked]
+
+    def match(self, sentence):
+        """
+        返回句子中分词数最多的实体
+        :param sentence: 句子
+        :return: 实体名，未找到时返回空字符串
+        """
+        words, tags = seg_doc(sentence)
+        mentions = self.match_tokens([w.strip() for w in words if w.strip()])
+        return mentions[0][0] if mentions else ''
+
+    def __len__(self):
+        return len(self._state[0])
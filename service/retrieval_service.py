@@ -1,72 +1,123 @@
 # -*- coding: utf-8 -*-
 import json
+from collections import OrderedDict
 from math import exp
+from multiprocessing import TimeoutError
 
-from config import TRIPLE_CORE_NAME
-from const import DEFAULT_WMD_THRESHOLD
-from service import calculate_wmd
-from utils import normalize_query, seg_doc
+from config import TRIPLE_CORE_NAME, RETRIEVAL_ENGINE
+from const import DEFAULT_WMD_THRESHOLD, WMD_SCORE_SCALE, DEFAULT_WMD_MAX_DISTANCE
+from service import WordMoverDistance, exceeds_bound
+from service.context import QueryContext
+from service.scoring import get_scoring_executor
+from utils import normalize_query, seg_doc, seg_doc_with_search
 from utils.logger import BaseLogger
 from utils.solr_api import SolrAPIHandler
 
 
 class RetrievalBot(BaseLogger):
-    def __init__(self, **kwargs):
+    def __init__(self, triple_core=None, engine=RETRIEVAL_ENGINE, scorer=None, **kwargs):
+        """
+        :param triple_core: 三元组检索接口，为空时使用solr三元组core
+        :param engine: 召回方式，solr为triple_core的关键词检索，dense为由triple_core加载的进程内稠密向量索引
+        :param scorer: 计算文档迁移距离的ScoringExecutor，为空时使用进程内共享的实例
+        """
         super(RetrievalBot, self).__init__(**kwargs)
         self.debug('>>> init RetrievalService <<<')
-        self.query = ''
+        self.scorer = scorer or get_scoring_executor()
         self.query_fields = ['attribute_date_index', ]  # 检索域
         self.target_field = 'attribute_date'  # 目标域
-        self.triple_core = SolrAPIHandler(TRIPLE_CORE_NAME)  # solr三元组core
+        self.triple_core = triple_core or SolrAPIHandler(TRIPLE_CORE_NAME)  # solr三元组core
+        self.engine = engine
+        if engine == 'dense':
+            from service.dense_index import DenseTripleIndex
+            self.retrieval_core = DenseTripleIndex(self.triple_core)
+        else:
+            if engine != 'solr':
+                self.warn('@@@@@@@@@@@@@@@@@@@@@@ unexpected value, engine=%s, use solr', engine)
+                self.engine = 'solr'
+            self.retrieval_core = self.triple_core
 
-    def _is_similarity(self, query_words, doc_words):
+    def _is_similarity(self, wmd, docs, context):
         """
-        计算query_words与doc_words的相似度
-        :param query_words:
-        :param doc_words:
-        :return: 相似度得分
+        计算问句与一批文档的相似度
+        :param wmd: 问句的WordMoverDistance
+        :param docs: [(文档id, 文档分词, DocEmbedding)]
+        :param context: 请求上下文
+        :return: 与docs一一对应的相似度得分
         """
-        distance = calculate_wmd(query_words, doc_words)  # 计算问句与属性间的文档迁移距离
-        score = exp(-distance/19.0)
-        return score
+        distances = self.scorer.distances(wmd, docs, context.time_left())  # 计算问句与属性间的文档迁移距离
+        return [exp(-distance / WMD_SCORE_SCALE) for distance in distances]
 
-    def _sort_retrieval_docs(self, query, triple_docs):
+    def _sort_retrieval_docs(self, context, triple_docs):
         """
         对三元组进行重排
-        :param query:问句
+        :param context: 请求上下文
         :param triple_docs:检索得到的三元组
         :return:
         """
         self.debug('>>> start _sort_retrieval_docs <<<')
         filter_triple_docs = []
-        query_words, query_tags = seg_doc(query)
-        for doc_item in triple_docs:
-            target_field = self.query_fields[0]
-            attribute = doc_item.get(target_field, "")
-            attribute_words = attribute.strip().split()
-
+        with context.tracer.span('seg_doc'):
+            query_words, query_tags = seg_doc(context.query)
+        target_field = self.query_fields[0]
+        docs_words = [doc_item.get(target_field, "").strip().split() for doc_item in triple_docs]
+        doc_ids = [doc_item.get('id') for doc_item in triple_docs]
+        wmd = WordMoverDistance(query_words)
+        with context.tracer.span('doc_embeddings'):  # 优先读取预计算的文档词向量
+            doc_embeddings = wmd.doc_embeddings(docs_words, doc_ids)
+        with context.tracer.span('wmd_lower_bounds'):
+            bounds = wmd.lower_bounds(doc_embeddings)
+        # 距离下界已超过阈值的三元组得分不可能高于阈值
+        order = [idx for idx in range(len(triple_docs)) if not exceeds_bound(bounds[idx], DEFAULT_WMD_MAX_DISTANCE)]
+        for start in xrange(0, len(order), self.scorer.batch_size):  # 每轮计算一批，两轮之间检查取消与截止时间
+            if context.is_cancelled():  # 请求已取消，不再计算剩余三元组的得分
+                self.debug('query cancelled, skip remaining triple_docs')
+                break
+            if filter_triple_docs and context.is_expiring():  # 时间不足，跳过剩余三元组的文档迁移距离计算
+                self.debug('deadline nearly reached, skip remaining triple_docs')
+                context.mark_degraded('_sort_retrieval_docs')
+                break
+            batch = order[start:start + self.scorer.batch_size]
             # 需要一个分类器，判断问句与文档是否相关，目前使用word move distance
-            score = self._is_similarity(query_words, attribute_words)  # 计算问句与属性间的文档迁移距离
-            if score > DEFAULT_WMD_THRESHOLD:  # 过滤掉得分低的三元组
-                doc_item['score'] = score
-                filter_triple_docs.append(doc_item)
+            with context.tracer.span('calculate_wmd'):
+                try:
+                    scores = self._is_similarity(wmd, [(doc_ids[idx], docs_words[idx], doc_embeddings[idx])
+                                                       for idx in batch], context)
+                except TimeoutError:
+                    self.debug('deadline reached, skip remaining triple_docs')
+                    context.mark_degraded('_sort_retrieval_docs')
+                    break
+            for idx, score in zip(batch, scores):
+                if score > DEFAULT_WMD_THRESHOLD:  # 过滤掉得分低的三元组
+                    triple_docs[idx]['score'] = score
+                    filter_triple_docs.append(triple_docs[idx])
         filter_triple_docs.sort(key=lambda x: x['score'], reverse=False)  # 根据得分进行重排
         self.debug('>>> end _sort_retrieval_docs <<<')
         return filter_triple_docs
 
-    def retrieval_triple(self, query):
+    def retrieval_triple(self, context, triple_docs=None):
         """
         检索三元组，并进行重排
-        :param query: 问句
+        :param context: 请求上下文
+        :param triple_docs: 已批量召回的三元组，为空时检索
         :return:
         """
         self.debug('>>> start retrieval_triple <<<')
+        query = context.query
         triple_doc = {}
         self.debug('query=%s, query_fields=%s, target_field=%s',
                    query, json.dumps(self.query_fields), self.target_field)
-        triple_docs = self.triple_core.search_with_seg(query, query_fields=self.query_fields)  # 进行solr检索
-        if triple_docs:
-            sorted_triple_docs = self._sort_retrieval_docs(query, triple_docs)  # 过滤并重排检索得到的三元组
+        if triple_docs is None:
+            with context.tracer.span('%s.triple_search' % self.engine):
+                triple_docs = self.retrieval_core.search_with_seg(query, query_fields=self.query_fields)  # 召回三元组
+        if context.is_cancelled():
+            self.debug('query cancelled, skip _sort_retrieval_docs')
+        elif context.is_expired():
+            self.debug('deadline reached, skip _sort_retrieval_docs')
+            context.mark_degraded('retrieval_triple')
+        elif triple_docs:
+            with context.tracer.span('_sort_retrieval_docs'):
+                sorted_triple_docs = self._sort_retrieval_docs(context, triple_docs)  # 过滤并重排检索得到的三元组
             if sorted_triple_docs:  # 选取top1作为答案三元组
                 triple_doc = sorted_triple_docs[0]
         else:
@@ -74,15 +125,16 @@ class RetrievalBot(BaseLogger):
         self.debug('>>> end retrieval_triple <<<')
         return triple_doc
 
-    def get_answer(self, query):
+    def get_answer(self, context, triple_docs=None):
         """
         获取答案
-        :param query: 问句
+        :param context: 请求上下文
+        :param triple_docs: 已批量召回的三元组，为空时检索
         :return: 答案
         """
         self.debug('>>> start get_answer <<<')
         answer = ""
-        triple_doc = self.retrieval_triple(query)
+        triple_doc = self.retrieval_triple(context, triple_docs)
         if triple_doc:  # 若三元组存在选取target_field为最终答案
             answer = triple_doc.get(self.target_field, "")
         else:
@@ -90,24 +142,63 @@ class RetrievalBot(BaseLogger):
         self.debug('>>> end get_answer <<<')
         return answer
 
-    def reply(self, query):
+    def reply(self, query, context=None, timeout=None):
         """
         基于检索的方式，返回query的answer
         :param query: 用户输入问句
+        :param context: 请求上下文，为空时根据query新建
+        :param timeout: 时间预算（秒），仅在新建context时使用
         :return: 答案
         """
         answer = ""
-        self.query = normalize_query(query)  # 问句预处理
+        if context is None:
+            context = QueryContext(normalize_query(query), timeout=timeout)  # 问句预处理
         self.debug("[ start RetrievalBot reply ]")
-        self.debug("query=%s", self.query)
-        if self.query:
-            answer = self.get_answer(self.query)
+        self.debug("query=%s", context.query)
+        if context.query:
+            with context.tracer.span('RetrievalBot.get_answer'):
+                answer = self.get_answer(context)
         else:
             self.warn("@@@@@@@@@@@@@@@@@@@ unexpected value, query is None")
         self.debug("answer=%s", answer)
         self.debug("[ end RetrievalBot reply ]")
         return answer
 
+    def _search_batch(self, queries):
+        """
+        批量召回三元组，每个问句只分词一次，分词结果相同的问句只检索一次
+        :param queries: 预处理后的问句列表，无重复
+        :return: 与queries一一对应的三元组列表，各问句的三元组互不共享，重排时可以直接修改
+        """
+        queries_words = [tuple(seg_doc_with_search(query)) for query in queries]
+        words_docs = dict()  # 分词结果 -> 检索结果
+        for words in queries_words:
+            if words not in words_docs:
+                words_docs[words] = self.retrieval_core.search_words(words, query_fields=self.query_fields) or []
+        self.debug('queries=%s, solr searches=%s', len(queries), len(words_docs))
+        return [[dict(doc) for doc in words_docs[words]] for words in queries_words]
+
+    def reply_batch(self, queries):
+        """
+        批量返回答案，相同问句只检索一次
+        :param queries: 用户输入问句列表
+        :return: 与queries一一对应的答案列表
+        """
+        self.debug("[ start RetrievalBot reply_batch ]")
+        self.debug('batch size=%s', len(queries))
+        normal_queries = [normalize_query(query) for query in queries]
+        unique_queries = list(OrderedDict.fromkeys(normal_query for normal_query in normal_queries if normal_query))
+        if self.engine == 'dense':  # 稠密向量召回按批计算相似度
+            batch_docs = self.retrieval_core.search_batch_with_seg(unique_queries, query_fields=self.query_fields)
+        else:
+            batch_docs = self._search_batch(unique_queries)
+        answers = dict()
+        for normal_query, triple_docs in zip(unique_queries, batch_docs):
+            answers[normal_query] = self.get_answer(QueryContext(normal_query), triple_docs)
+        self.debug("[ end RetrievalBot reply_batch ]")
+        return [answers.get(normal_query, "") for normal_query in normal_queries]
+
+
 if __name__ == '__main__':
     bot = RetrievalBot()
     while 1:
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# 候选三元组文档迁移距离的多进程计算
+import signal
+import threading
+from multiprocessing import Pool, current_process
+
+from config import SCORING_PROCESSES, SCORING_CHUNK_SIZE, SCORING_MIN_CANDIDATES
+from service import WordMoverDistance, get_wording_embedding, get_doc_embedding_store
+from utils.logger import BaseLogger
+
+_scoring_executor = None  # 进程内共享的ScoringExecutor，第一次使用时创建
+_executor_lock = threading.Lock()
+
+
+def _init_worker():
+    """
+    工作进程初始化：忽略SIGINT交由主进程处理，并加载词向量（存在导出的.kv文件时内存映射）与文档词向量库
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    get_wording_embedding()
+    get_doc_embedding_store()
+
+
+def _score_chunk(task):
+    """
+    在工作进程中计算问句与一组文档的文档迁移距离
+    :param task: (问句分词, [(文档id, 文档分词)])
+    :return: 与文档一一对应的距离
+    """
+    words, items = task
+    wmd = WordMoverDistance(words)
+    doc_embeddings = wmd.doc_embeddings([doc_words for doc_id, doc_words in items],
+                                        [doc_id for doc_id, doc_words in items])
+    return [wmd.distance(doc_embedding) for doc_embedding in doc_embeddings]
+
+
+class ScoringExecutor(BaseLogger):
+    """
+    持久的进程池，将候选文档分块交给工作进程计算文档迁移距离后按原顺序合并，计算不占用请求线程的GIL
+    processes为0、当前进程为守护进程（不能再创建子进程）或候选数较少时在当前线程计算
+    """
+    def __init__(self, processes=SCORING_PROCESSES, chunk_size=SCORING_CHUNK_SIZE,
+                 min_candidates=SCORING_MIN_CANDIDATES, **kwargs):
+        """
+        :param processes: 工作进程数，0表示不使用进程池
+        :param chunk_size: 每个工作进程一次计算的文档数
+        :param min_candidates: 候选数达到该值时才交给进程池，过少时进程间通信的开销大于收益
+        """
+        super(ScoringExecutor, self).__init__(**kwargs)
+        self.debug('>>> init ScoringExecutor <<<')
+        self.chunk_size = max(1, chunk_size)
+        self.min_candidates = min_candidates
+        self.pool = None
+        if processes > 0:
+            if current_process().daemon:
+                self.warn('@@@@@@@@@@@@@@@@@@@@@@ daemonic process can not create scoring pool, score in thread')
+            else:
+                get_wording_embedding()  # 在fork之前加载，工作进程与主进程共享词向量
+                self.pool = Pool(processes, initializer=_init_worker)
+        self.processes = processes if self.pool is not None else 0
+
+    @property
+    def batch_size(self):
+        """
+        一轮计算的文档数，调用方在两轮之间判断剪枝与截止时间
+        """
+        return self.processes * self.chunk_size if self.pool is not None else 1
+
+    def distances(self, wmd, docs, timeout=None):
+        """
+        计算问句与一组文档的文档迁移距离
+        :param wmd: 问句的WordMoverDistance
+        :param docs: [(文档id, 文档分词, DocEmbedding)]
+        :param timeout: 等待进程池的最长时间（秒），超时抛出multiprocessing.TimeoutError
+        :return: 与docs一一对应的距离
+        """
+        if self.pool is None or len(docs) < self.min_candidates:
+            return [wmd.distance(doc_embedding) for doc_id, doc_words, doc_embedding in docs]
+        items = [(doc_id, doc_words) for doc_id, doc_words, doc_embedding in docs]
+        tasks = [(wmd.words, items[start:start + self.chunk_size]) for start in xrange(0, len(items), self.chunk_size)]
+        results = self.pool.map_async(_score_chunk, tasks).get(max(timeout, 0) if timeout is not None else None)
+        return [distance for result in results for distance in result]
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+
+def get_scoring_executor():
+    """
+    获取进程内共享的ScoringExecutor，第一次调用时创建进程池，需在创建其他线程池之前调用
+    :return: ScoringExecutor
+    """
+    global _scoring_executor
+    if _scoring_executor is None:
+        with _executor_lock:
+            if _scoring_executor is None:
+                _scoring_executor = ScoringExecutor()
+    return _scoring_executor
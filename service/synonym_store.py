@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# 主语同义词库
+import os
+import threading
+
+from const import DEFAULT_SUBJECT_SYNONYM
+from utils import seg_doc, load_entity_synonym
+from utils.logger import BaseLogger
+
+
+class SynonymStore(BaseLogger):
+    """
+    加载时对每个同义词分词一次，问答时直接使用分词结果计算与问句的匹配度
+    文件变化后调用reload重新加载，已分过词的同义词不再重复分词
+    """
+    def __init__(self, path=DEFAULT_SUBJECT_SYNONYM, **kwargs):
+        """
+        :param path: 同义词词典路径，每行为"主语,同义词"
+        """
+        super(SynonymStore, self).__init__(**kwargs)
+        self.debug('>>> init SynonymStore <<<')
+        self.path = path
+        self._lock = threading.Lock()
+        self._file_stat = None  # 已加载文件的(大小, 修改时间)
+        self._tokens = dict()   # 同义词 -> 分词结果(tuple)，reload时复用
+        self._synonyms = dict()  # 主语 -> [(同义词, 分词结果)]
+        self.reload()
+
+    def _segment(self, synonym):
+        tokens = self._tokens.get(synonym)
+        if tokens is None:
+            words, tags = seg_doc(synonym)
+            tokens = tuple(w.strip() for w in words if w.strip())
+            self._tokens[synonym] = tokens
+        return tokens
+
+    def reload(self):
+        """
+        文件发生变化时重新加载，只对新增的同义词分词
+        :return: 是否重新加载
+        """
+        with self._lock:
+            stat = os.stat(self.path)
+            file_stat = (stat.st_size, stat.st_mtime)
+            if file_stat == self._file_stat:
+                return False
+            synonyms = dict()
+            used_tokens = set()
+            for key, values in load_entity_synonym(self.path).items():
+                synonyms[key] = [(value, self._segment(value)) for value in values]
+                used_tokens.update(values)
+            for synonym in set(self._tokens) - used_tokens:  # 清理已删除的同义词
+                del self._tokens[synonym]
+            self._synonyms = synonyms
+            self._file_stat = file_stat
+            self.info('load %s subjects, %s synonyms, path=%s', len(synonyms), len(self._tokens), self.path)
+        return True
+
+    def get(self, key, default=None):
+        """
+        :return: 主语的同义词列表
+        """
+        if key not in self._synonyms:
+            return default
+        return [synonym for synonym, tokens in self._synonyms[key]]
+
+    def best_overlap(self, key, matcher):
+        """
+        计算主语的各个同义词与问句的最大匹配度
+        :param key: 主语
+        :param matcher: 问句分词的LongestCommonSubstring
+        :return: 最长公共子串长度 / 同义词分词数的最大值，主语没有同义词时返回None
+        """
+        entries = self._synonyms.get(key)
+        if not entries:
+            return None
+        best = 0.0
+        for synonym, tokens in entries:
+            if tokens:
+                sub_string, length = matcher.match(tokens)
+                best = max(best, length / float(len(tokens)))
+                if best >= 1.0:  # 同义词完整出现在问句中，不会有更高的分数
+                    break
+        return best
+
+    def iter_synonyms(self):
+        """
+        :return: 迭代器，元素为(主语, 同义词分词结果)
+        """
+        for key, entries in self._synonyms.items():
+            for synonym, tokens in entries:
+                yield key, tokens
+
+    def __contains__(self, key):
+        return key in self._synonyms
+
+    def __len__(self):
+        return len(self._synonyms)
@@ -1,34 +1,63 @@
 # -*- coding: utf-8 -*-
 import json
-import re
+from itertools import groupby
 from math import exp
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
 
-from config import TEMPLATE_CORE_NAME, TRIPLE_CORE_NAME
-from const import TRIPLE_MATCH_THRESHOLD, DEFAULT_SUBJECT_SYNONYM, DEFAULT_WMD_THRESHOLD, DEFAULT_TEMPLATE_PRIORITY
-from service import longest_common_substring, calculate_wmd
-from utils import str2unicode, normalize_query, seg_doc, load_entity_synonym, unicode2str
+from config import TRIPLE_CORE_NAME, TEMPLATE_WORKER_NUM, TEMPLATE_ANSWER_MODE, ENTITY_GAZETTEER_ENABLED
+from const import TRIPLE_MATCH_THRESHOLD, DEFAULT_WMD_THRESHOLD, DEFAULT_TEMPLATE_PRIORITY, WMD_SCORE_SCALE, \
+    DEFAULT_WMD_MAX_DISTANCE
+from service import LongestCommonSubstring, WordMoverDistance, exceeds_bound
+from service.context import QueryContext
+from service.gazetteer import EntityGazetteer
+from service.scoring import get_scoring_executor
+from service.synonym_store import SynonymStore
+from service.template_store import TemplateStore
+from utils import str2unicode, normalize_query, seg_doc, unicode2str
 from utils.logger import BaseLogger
 from utils.neo4j_api import KnowledgeDBAPI
 from utils.solr_api import SolrAPIHandler
 
 
 class TemplateBot(BaseLogger):
-    def __init__(self, **kwargs):
+    def __init__(self, template_core=None, triple_core=None, knowledge_db=None, template_store=None,
+                 synonym_store=None, gazetteer=None, worker_num=TEMPLATE_WORKER_NUM, answer_mode=TEMPLATE_ANSWER_MODE,
+                 scorer=None, **kwargs):
+        """
+        :param template_core: 问句模板检索接口，用于加载模板，为空时使用solr问句模板core
+        :param triple_core: 三元组检索接口，为空时使用solr三元组core
+        :param knowledge_db: 知识图谱查询接口，为空时连接配置中的neo4j
+        :param template_store: 问句模板库，为空时从template_core或配置中的模板来源加载
+        :param synonym_store: 主语同义词库，为空时加载默认的同义词词典
+        :param gazetteer: 实体词典，为空且配置开启时从triple_core加载
+        :param worker_num: 并行匹配主语/宾语及并行查询知识库的线程数
+        :param answer_mode: 知识库查询方式，sequential按优先级逐个查询，concurrent按优先级分组并行查询，
+                            两者都在得到结果后停止；all查询全部三元组
+        :param scorer: 计算文档迁移距离的ScoringExecutor，为空时使用进程内共享的实例
+        """
         super(TemplateBot, self).__init__(**kwargs)
         self.debug('>>> init TemplateBot <<<')
-        self.query = ''
-        self.template_core = SolrAPIHandler(TEMPLATE_CORE_NAME)  # solr问句模板core
-        self.triple_core = SolrAPIHandler(TRIPLE_CORE_NAME)      # solr三元组core
-        self.knowledge_db = KnowledgeDBAPI()                     # 生物学科知识图谱
-        self.entity_synonym = load_entity_synonym(DEFAULT_SUBJECT_SYNONYM)
+        self.scorer = scorer or get_scoring_executor()  # 先于线程池创建，工作进程在fork时不带其他线程
+        self.template_store = template_store or TemplateStore(template_core=template_core)  # 预编译的问句模板库
+        self.triple_core = triple_core or SolrAPIHandler(TRIPLE_CORE_NAME)          # solr三元组core
+        self.knowledge_db = knowledge_db or KnowledgeDBAPI()                        # 生物学科知识图谱
+        self.entity_synonym = synonym_store or SynonymStore()  # 预先分词的主语同义词库
+        if gazetteer is None and ENTITY_GAZETTEER_ENABLED:
+            gazetteer = EntityGazetteer(triple_core=self.triple_core, synonym_store=self.entity_synonym)
+        self.gazetteer = gazetteer  # 进程内的实体词典，用于匹配主语
+        self.pool = ThreadPool(worker_num)  # 并行匹配主语/宾语及并行查询知识库的线程池
+        self.answer_mode = answer_mode
 
-    def _match_predicate(self):
+    def _match_predicate(self, context):
         """
         基于模板匹配谓语
+        :param context: 请求上下文
         :return:返回匹配到的谓语
         """
         self.debug('>>> start _match_predicate <<<')
-        template_docs = self.template_core.search_with_seg(self.query, query_fields=['key_index'])
+        with context.tracer.span('template_store.search'):
+            template_docs = self.template_store.search(context.query)
         match_template_docs = []
         if template_docs:
             for tmp_item in template_docs:
@@ -37,8 +66,8 @@ class TemplateBot(BaseLogger):
                 priority = tmp_item.get('priority', DEFAULT_TEMPLATE_PRIORITY)       # 模板优先级，（1为精确匹配）
                 missing_tuple = tmp_item.get('missing_tuple', '')  # 缺失的三元祖
 
-                pattern = re.compile(ur'%s' % pattern_str)
-                is_match = pattern.match(str2unicode(self.query))
+                with context.tracer.span('template_regex'):
+                    is_match = tmp_item['regex'].match(str2unicode(context.query))
                 if is_match:  # 模板匹配，将其添加到match_template_docs中
                     doc = {'pattern': pattern_str, 'predicates': predicates,
                            'priority': priority, 'missing_tuple': missing_tuple}
@@ -57,30 +86,30 @@ class TemplateBot(BaseLogger):
         self.debug(">>> end _match_predicate <<<")
         return match_template_docs
 
-    def _sort_docs_by_subject(self, sentence, triple_docs):
+    def _sort_docs_by_subject(self, sentence, triple_docs, context):
         """
         基于最长公共子串进行排序
         :param sentence:
         :param triple_docs:
+        :param context: 请求上下文
         :return:
         """
         self.debug('>>> start _sort_docs_by_subject <<<')
-        words, tags = seg_doc(sentence)
+        with context.tracer.span('seg_doc'):
+            words, tags = seg_doc(sentence)
         _words = [w.strip() for w in words if w.strip()]
+        matcher = LongestCommonSubstring(_words)  # 问句分词只预处理一次
         chosen_triple_docs = []
         for doc_item in triple_docs:
             item_str = doc_item.get('attribute_date', "")
             item_index = doc_item.get("attribute_date_index", "")
             item_words = [w.strip() for w in item_index.split()]
 
-            sub_string, length = longest_common_substring(_words, item_words)  # 计算_words与item_words的最长公共子串
+            sub_string, length = matcher.match(item_words)  # 计算_words与item_words的最长公共子串
             scores = [len(sub_string) / float(len(item_words)), ]
-            if item_str in self.entity_synonym:  # 若target_sentence在主语拓展库中，计算扩展主语与sentence的匹配度
-                for extend_str in self.entity_synonym[item_str]:
-                    _words, _tags = seg_doc(extend_str)
-                    extend_str_words = [w.strip() for w in _words if w.strip()]
-                    sub_string, length = longest_common_substring(_words, extend_str_words)
-                    scores.append(len(sub_string) / float(len(extend_str_words)))
+            synonym_score = self.entity_synonym.best_overlap(item_str, matcher)  # 扩展主语与sentence的最大匹配度
+            if synonym_score is not None:
+                scores.append(synonym_score)
             doc_item['score'] = max(scores)  # 选取target_sentence及扩展主语与sentence的最大匹配分数作为最后分数
             doc_item['length'] = len(item_words)
             if doc_item['score'] >= TRIPLE_MATCH_THRESHOLD:  # 匹配度高于阈值选取该三元组
@@ -93,129 +122,296 @@ class TemplateBot(BaseLogger):
         self.debug('>>> end _sort_docs_by_subject <<<')
         return chosen_triple_docs
 
-    def _sort_docs_by_object(self, sentence, triple_docs):
+    def _sort_docs_by_object(self, sentence, triple_docs, context, top1=False):
         """
         基于文档迁移距离对triple_docs进行重排
+        先批量计算文档迁移距离的下界，下界已超过阈值（或top1时已超过当前最小距离）的三元组不再计算精确距离
         :param sentence:
         :param triple_docs:
+        :param context: 请求上下文
+        :param top1: 是否只需要保证返回结果的第一个与完整计算一致
         :return:
         """
         self.debug('>>> start _sort_docs_by_object <<<')
-        words, tags = seg_doc(sentence)
+        with context.tracer.span('seg_doc'):
+            words, tags = seg_doc(sentence)
         _words = [w.strip() for w in words if w.strip()]
-        match_triple_docs = list()  # 满足匹配阈值的triple_docs
-        for doc_item in triple_docs:
-            item_str = doc_item.get("attribute_date", "")
-            item_index = doc_item.get("attribute_date_index", "")
-            item_words = [w.strip() for w in item_index.split()]
-            distance = calculate_wmd(_words, item_words)  # 计算文档迁移距离
-            score = exp(-distance / 19.0)
-            doc_item['score'] = score
-            if doc_item['score'] > DEFAULT_WMD_THRESHOLD:  # 过滤掉距离大于阈值的三元组
-                self.debug('choose item_str=%s, score=%s', item_str, doc_item['score'])
-                match_triple_docs.append(doc_item)
-            else:
-                self.debug("filter item_str=%s, score=%s", item_str, doc_item['score'])
-        if match_triple_docs:  # 按score降序排序
-            match_triple_docs.sort(key=lambda x: x['score'], reverse=True)
+        docs_words = [[w.strip() for w in doc_item.get("attribute_date_index", "").split()]
+                      for doc_item in triple_docs]
+        doc_ids = [doc_item.get('id') for doc_item in triple_docs]
+        wmd = WordMoverDistance(_words)
+        with context.tracer.span('doc_embeddings'):  # 优先读取预计算的文档词向量
+            doc_embeddings = wmd.doc_embeddings(docs_words, doc_ids)
+        with context.tracer.span('wmd_lower_bounds'):
+            bounds = wmd.lower_bounds(doc_embeddings)
+        # 下界小的先计算，尽早得到最小距离；下界已超过阈值的三元组得分不可能高于阈值
+        order = [idx for idx in sorted(range(len(triple_docs)), key=lambda x: bounds[x])
+                 if not exceeds_bound(bounds[idx], DEFAULT_WMD_MAX_DISTANCE)]
+        self.debug('prune %s triple_docs by lower bound', len(triple_docs) - len(order))
+        match_triple_docs = list()  # 满足匹配阈值的(下标, triple_doc)
+        min_distance = float('inf')
+        for start in xrange(0, len(order), self.scorer.batch_size):  # 每轮计算一批，两轮之间剪枝并检查截止时间
+            batch = order[start:start + self.scorer.batch_size]
+            if top1:
+                batch = [idx for idx in batch if not exceeds_bound(bounds[idx], min_distance)]
+                if not batch:
+                    self.debug('prune the rest triple_docs, min_distance=%s', min_distance)
+                    break  # 按下界升序遍历，剩余三元组的下界都不小于当前下界
+            if match_triple_docs and context.is_expiring():  # 时间不足，跳过剩余三元组的文档迁移距离计算
+                self.debug('deadline nearly reached, skip remaining triple_docs')
+                context.mark_degraded('_sort_docs_by_object')
+                break
+            with context.tracer.span('calculate_wmd'):
+                try:  # 计算文档迁移距离
+                    distances = self.scorer.distances(wmd, [(doc_ids[idx], docs_words[idx], doc_embeddings[idx])
+                                                            for idx in batch], context.time_left())
+                except TimeoutError:
+                    self.debug('deadline reached, skip remaining triple_docs')
+                    context.mark_degraded('_sort_docs_by_object')
+                    break
+            for idx, distance in zip(batch, distances):
+                doc_item = triple_docs[idx]
+                item_str = doc_item.get("attribute_date", "")
+                score = exp(-distance / WMD_SCORE_SCALE)
+                doc_item['score'] = score
+                if doc_item['score'] > DEFAULT_WMD_THRESHOLD:  # 过滤掉距离大于阈值的三元组
+                    self.debug('choose item_str=%s, score=%s', item_str, doc_item['score'])
+                    match_triple_docs.append((idx, doc_item))
+                    min_distance = min(min_distance, distance)
+                else:
+                    self.debug("filter item_str=%s, score=%s", item_str, doc_item['score'])
+        # 按score降序排序，score相同时保持检索顺序
+        match_triple_docs = [doc_item for idx, doc_item in sorted(match_triple_docs,
+                                                                  key=lambda x: (-x[1]['score'], x[0]))]
         self.debug('>>> end _sort_docs_by_object <<<')
         return match_triple_docs
 
-    def _match_retrieval_docs(self, sentence, triple_docs, missing_triple):
+    def _match_retrieval_docs(self, sentence, triple_docs, missing_triple, context):
         """
         对检索得到的三元组进行排序和过滤
         :param sentence:
         :param triple_docs:
         :param missing_triple:
+        :param context: 请求上下文
         :return:
         """
         self.debug('>>> start _match_retrieval_docs <<<')
         chosen_triple_docs = []
         if missing_triple == 'object':    # 缺失元组为object，则排序方式为_sort_docs_by_subject
-            chosen_triple_docs = self._sort_docs_by_subject(sentence, triple_docs)
+            with context.tracer.span('_sort_docs_by_subject'):
+                chosen_triple_docs = self._sort_docs_by_subject(sentence, triple_docs, context)
         elif missing_triple == 'subject':  # 缺失元组为subject，则排序方式为_sort_docs_by_object
-            chosen_triple_docs = self._sort_docs_by_object(sentence, triple_docs)
+            with context.tracer.span('_sort_docs_by_object'):
+                chosen_triple_docs = self._sort_docs_by_object(sentence, triple_docs, context, top1=True)
         else:
             self.warn('@@@@@@@@@@@@@@@@@@@@@@ unexpected value, missing_triple=%s', missing_triple)
         self.debug('>>> end _match_retrieval_docs <<<')
         return chosen_triple_docs
 
-    def _match_subject_and_object(self, sentence, missing_triple):
+    def _match_subject_and_object(self, sentence, missing_triple, context):
         """
         匹配sentence中包含的主语或宾语
         :param sentence:
         :param missing_triple:
+        :param context: 请求上下文
         :return:
         """
         self.debug('>>> start _match_subject_and_object <<<')
         self.debug('sentence=%s, missing_triple=%s', sentence, missing_triple)
         triple_subject = ""
         triple_object = ""
-        extend_condition = ""
-        if missing_triple == 'object':   # 若缺失元组为object，设置solr附加查询条件
-            extend_condition = '+(attribute_name: name)'
-        triple_docs = self.triple_core.search_with_seg(sentence, query_fields=["attribute_date_index"],
-                                                       rows=50, extend_condition=extend_condition)
-        if triple_docs:
-            sorted_triple_docs = self._match_retrieval_docs(sentence, triple_docs, missing_triple)
-            if sorted_triple_docs:  # 选取sorted_triple_docs的top1作为结果
-                ret = sorted_triple_docs[0].get("attribute_date", '')
-                if missing_triple == 'object':
-                    triple_subject = ret
-                elif missing_triple == 'subject':
-                    triple_object = ret
-                self.debug("got triple_subject=%s, triple_object=%s", triple_subject, triple_object)
+        if missing_triple == 'object' and self.gazetteer is not None:  # 先在实体词典中查找完整出现的主语
+            with context.tracer.span('gazetteer.match'):
+                triple_subject = self.gazetteer.match(sentence)
+        if triple_subject:
+            self.debug("got triple_subject=%s from gazetteer", triple_subject)
+        elif context.is_cancelled():  # 请求已取消，线程池中的任务不再检索solr
+            self.debug('query cancelled, skip solr search, sentence=%s', sentence)
+        else:  # 实体词典未找到时使用solr检索
+            extend_condition = ""
+            if missing_triple == 'object':   # 若缺失元组为object，设置solr附加查询条件
+                extend_condition = '+(attribute_name: name)'
+            with context.tracer.span('solr.triple_search'):
+                triple_docs = self.triple_core.search_with_seg(sentence, query_fields=["attribute_date_index"],
+                                                               rows=50, extend_condition=extend_condition)
+            if triple_docs:
+                sorted_triple_docs = self._match_retrieval_docs(sentence, triple_docs, missing_triple, context)
+                if sorted_triple_docs:  # 选取sorted_triple_docs的top1作为结果
+                    ret = sorted_triple_docs[0].get("attribute_date", '')
+                    if missing_triple == 'object':
+                        triple_subject = ret
+                    elif missing_triple == 'subject':
+                        triple_object = ret
+                    self.debug("got triple_subject=%s, triple_object=%s", triple_subject, triple_object)
+                else:
+                    self.warn('@@@@@@@@@@@@@@@@@@@@@@@@ unexpected value, sorted_triple_docs is None')
             else:
-                self.warn('@@@@@@@@@@@@@@@@@@@@@@@@ unexpected value, sorted_triple_docs is None')
-        else:
-            self.warn("@@@@@@@@@@@@@@@@@@@@@@@@@@ unexpected value, triple_docs is None")
+                self.warn("@@@@@@@@@@@@@@@@@@@@@@@@@@ unexpected value, triple_docs is None")
         self.debug(">>> end _match_subject_and_object <<<")
         return triple_subject, triple_object
 
-    def get_triple(self):
+    def _resolve_subject_and_object(self, keys, context):
+        """
+        并行匹配多个title的主语或宾语，第一个在当前线程执行，其余提交到线程池
+        :param keys: 去重后的(title, missing_tuple)列表
+        :param context: 请求上下文
+        :return: {(title, missing_tuple): (triple_subject, triple_object)}
+        """
+        def resolve(key):
+            with context.tracer.span('_match_subject_and_object'):
+                return self._match_subject_and_object(key[0], key[1], context)
+
+        async_results = [(key, self.pool.apply_async(resolve, (key, ))) for key in keys[1:]]
+        ret = dict()
+        if keys:
+            ret[keys[0]] = resolve(keys[0])
+        for key, async_result in async_results:
+            time_left = context.time_left()
+            try:
+                ret[key] = async_result.get(max(time_left, 0) if time_left is not None else None)
+            except TimeoutError:  # 超过截止时间，放弃尚未完成的匹配
+                self.debug('deadline reached, skip title=%s, missing_tuple=%s', key[0], key[1])
+                context.mark_degraded('_resolve_subject_and_object')
+                ret[key] = ('', '')
+        return ret
+
+    def get_triple(self, context, resolved=None):
         """
-        获取与问句相关的三元组
+        获取与问句相关的三元组，相同的(title, missing_tuple)只匹配一次，不同的并行匹配
+        :param context: 请求上下文
+        :param resolved: 主语/宾语匹配结果缓存，key为(title, missing_tuple)，批量问答时在多个问句间共享
         :return: 三元组(subject, predicate, object)，其中有一个值是缺失的
         """
         self.debug('>>> start get_triple <<<')
-        template_docs = self._match_predicate()
+        with context.tracer.span('_match_predicate'):
+            template_docs = self._match_predicate(context)
         triple_docs = list()
         if template_docs:
+            # 按优先级升序处理模板（稳定排序，同优先级保持检索顺序）
+            template_docs = [doc for doc in template_docs if doc.get('missing_tuple', '') in ['subject', 'object']]
+            template_docs.sort(key=lambda x: x.get('priority', DEFAULT_TEMPLATE_PRIORITY))
+            keys = []  # 去重后的(title, missing_tuple)，title为模板框定的部分，用于检索可能的主语或宾语
+            for doc in template_docs:
+                key = (doc.get('title', ''), doc.get('missing_tuple', ''))
+                if key not in keys:
+                    keys.append(key)
+            if context.is_cancelled():  # 请求已取消，不再匹配主语或宾语
+                self.debug('query cancelled, skip templates')
+                keys = []
+                template_docs = []
+            elif keys and (context.is_expired() or (len(keys) > 1 and context.is_expiring())):
+                # 时间不足，只保留优先级最高的模板对应的title
+                self.debug('deadline nearly reached, skip lower-priority templates')
+                context.mark_degraded('get_triple')
+                keys = keys[:0] if context.is_expired() else keys[:1]
+                template_docs = [doc for doc in template_docs
+                                 if (doc.get('title', ''), doc.get('missing_tuple', '')) in keys]
+
+            pending_keys = [key for key in keys if resolved is None or key not in resolved]
+            key_results = self._resolve_subject_and_object(pending_keys, context)
+            if resolved is not None:
+                resolved.update(key_results)
+                key_results = resolved
             for doc in template_docs:  # 遍历匹配到的template_docs，生成查询三元组
                 missing_tuple = doc.get('missing_tuple', '')  # 缺失三元组
-                title = doc.get('title', '')  # 模板框定的title部分，用于检索可能的主语或宾语
+                title = doc.get('title', '')
                 predicates = doc.get('predicates', [])  # 匹配模板对应的谓语
                 priority = doc.get('priority', DEFAULT_TEMPLATE_PRIORITY)  # 模板优先级
-
-                if missing_tuple in ['subject', 'object']:  # 缺失元组为主语或宾语
-                    triple_subject, triple_object = self._match_subject_and_object(title, missing_tuple)
-                    triple_doc = {'subject': triple_subject, 'predicate': predicates,
-                                  'object': triple_object, 'priority': priority}
-                    triple_docs.append(triple_doc)
+                triple_subject, triple_object = key_results[(title, missing_tuple)]
+                triple_doc = {'subject': triple_subject, 'predicate': predicates,
+                              'object': triple_object, 'priority': priority}
+                triple_docs.append(triple_doc)
         else:
             self.warn('@@@@@@@@@@@@@@@@@@@@@@@@@ unexpected value, template_docs=[]')
         self.debug('>>> end get_triple <<<')
         return triple_docs
 
-    def get_answer(self, triple_docs):
+    def _search_sequential(self, triple_docs, context, short_circuit=True):
+        """
+        按优先级顺序逐个查询知识库
+        :param triple_docs: 按优先级升序排列的三元组
+        :param context: 请求上下文
+        :param short_circuit: 是否在得到第一个结果后停止，为False时查询全部三元组
+        :return: (知识库查询结果, 三元组)列表
+        """
+        ret_docs = []
+        for triple_doc in triple_docs:
+            if context.is_cancelled():  # 请求已取消，不再查询知识库
+                self.debug('query cancelled, skip remaining triple_docs')
+                break
+            if ret_docs and (short_circuit or context.is_expiring()):  # 已有的结果即为最终答案
+                self.debug('got answer, skip lower-priority triple_docs')
+                break
+            if context.is_expired():
+                self.debug('deadline reached, skip remaining triple_docs')
+                context.mark_degraded('get_answer')
+                break
+            tmp_ret = self.knowledge_db.search(triple_doc=triple_doc, context=context)
+            if tmp_ret:
+                ret_docs.append((tmp_ret, triple_doc))
+        return ret_docs
+
+    def _search_concurrent(self, triple_docs, context):
+        """
+        按优先级分组，同一优先级的三元组并行查询知识库，得到结果后不再查询更低优先级的三元组
+        :param triple_docs: 按优先级升序排列的三元组
+        :param context: 请求上下文
+        :return: (知识库查询结果, 三元组)列表
+        """
+        for priority, level_docs in groupby(triple_docs, key=lambda x: x['priority']):
+            if context.is_cancelled():
+                self.debug('query cancelled, skip remaining triple_docs')
+                break
+            if context.is_expired():
+                self.debug('deadline reached, skip remaining triple_docs')
+                context.mark_degraded('get_answer')
+                break
+            async_results = [(triple_doc, self.pool.apply_async(self.knowledge_db.search, (),
+                                                                {'triple_doc': triple_doc, 'context': context}))
+                             for triple_doc in level_docs]
+            for triple_doc, async_result in async_results:  # 按顺序取第一个非空结果，无需等待之后的查询
+                time_left = context.time_left()
+                try:
+                    tmp_ret = async_result.get(max(time_left, 0) if time_left is not None else None)
+                except TimeoutError:
+                    self.debug('deadline reached, skip remaining triple_docs')
+                    context.mark_degraded('get_answer')
+                    return []
+                if tmp_ret:
+                    return [(tmp_ret, triple_doc)]
+        return []
+
+    def get_answer(self, triple_docs, context):
         """
         根据匹配到的三元组检索知识库，并返回最终答案
         :param triple_docs: 检索得到的三元组
+        :param context: 请求上下文
         :return: 知识库查询结果
         """
         self.debug('>>> start get_answer <<<')
         ret_docs = []
-        ret = []
         if triple_docs:
-            for triple_doc in triple_docs:
-                tmp_ret = self.knowledge_db.search(triple_doc=triple_doc)
-                if tmp_ret:
-                    ret_docs.append((tmp_ret, triple_doc))
-            if ret_docs:  # 按优先级升序排列
-                ret_docs.sort(key=lambda x: x[1]['priority'], reverse=False)
+            # 按优先级升序查询（稳定排序），最终答案取优先级最高的第一个非空结果
+            triple_docs = sorted(triple_docs, key=lambda x: x['priority'])
+            if self.answer_mode == 'concurrent':
+                ret_docs = self._search_concurrent(triple_docs, context)
+            else:
+                ret_docs = self._search_sequential(triple_docs, context, short_circuit=self.answer_mode != 'all')
         else:
             self.warn('@@@@@@@@@@@@@@@@@@@ unexpected value, triple_docs is None')
-        if ret_docs:
+        answer = self._format_answer(ret_docs)
+        self.debug('>>> end get_answer <<<')
+        return answer
+
+    def _format_answer(self, ret_docs):
+        """
+        选取优先级最高的知识库查询结果生成答案
+        :param ret_docs: (知识库查询结果, 三元组)列表
+        :return: 答案
+        """
+        ret = []
+        if ret_docs:  # 按优先级升序排列
+            ret_docs.sort(key=lambda x: x[1]['priority'], reverse=False)
             _doc, _doc_info = ret_docs[0]
             for key in _doc.keys():
                 _subject = _doc_info.get("subject", "")
@@ -228,23 +424,27 @@ class TemplateBot(BaseLogger):
                 ret.append(value)
         else:
             self.warn('@@@@@@@@@@@@@@@@@@@ unexpected value, ret_docs is None')
-        self.debug('>>> end get_answer <<<')
         return "\n".join(ret)
 
-    def reply(self, query):
+    def reply(self, query, context=None, timeout=None):
         """
         根据query返回答案
         :param query: 用户输入问句
+        :param context: 请求上下文，为空时根据query新建
+        :param timeout: 时间预算（秒），仅在新建context时使用
         :return: 答案
         """
         answer = ""
-        self.query = normalize_query(query)
+        if context is None:
+            context = QueryContext(normalize_query(query), timeout=timeout)
         self.debug("[start TemplateBot reply]")
-        self.debug('query=%s', self.query)
+        self.debug('query=%s', context.query)
 
-        if self.query:
-            triple_docs = self.get_triple()  # 与问句可能相关的三元组
-            answer = self.get_answer(triple_docs)
+        if context.query:
+            with context.tracer.span('TemplateBot.get_triple'):
+                triple_docs = self.get_triple(context)  # 与问句可能相关的三元组
+            with context.tracer.span('TemplateBot.get_answer'):
+                answer = self.get_answer(triple_docs, context)
         else:
             self.warn("@@@@@@@@@@@@@@@@@@@ unexpected value, query is None")
 
@@ -252,6 +452,42 @@ class TemplateBot(BaseLogger):
         self.debug("[end TemplateBot reply]")
         return answer
 
+    def reply_batch(self, queries):
+        """
+        批量返回答案，相同问句只处理一次，相同的主语/宾语匹配在问句间共享，知识库按批查询
+        :param queries: 用户输入问句列表
+        :return: 与queries一一对应的答案列表
+        """
+        self.debug("[start TemplateBot reply_batch]")
+        self.debug('batch size=%s', len(queries))
+        normal_queries = [normalize_query(query) for query in queries]
+        resolved = dict()  # 批内共享的主语/宾语匹配结果
+        query_triple_docs = dict()  # 问句 -> 三元组列表
+        for normal_query in normal_queries:
+            if normal_query and normal_query not in query_triple_docs:
+                query_triple_docs[normal_query] = self.get_triple(QueryContext(normal_query), resolved=resolved)
+
+        batch_queries = []  # 与batch_triple_docs一一对应的问句
+        batch_triple_docs = []
+        for normal_query, triple_docs in query_triple_docs.items():
+            for triple_doc in triple_docs:
+                batch_queries.append(normal_query)
+                batch_triple_docs.append(triple_doc)
+        query_ret_docs = dict((normal_query, []) for normal_query in query_triple_docs)
+        for normal_query, triple_doc, tmp_ret in zip(batch_queries, batch_triple_docs,
+                                                     self.knowledge_db.search_batch(batch_triple_docs)):
+            if tmp_ret:
+                query_ret_docs[normal_query].append((tmp_ret, triple_doc))
+
+        answers = dict((normal_query, self._format_answer(ret_docs))
+                       for normal_query, ret_docs in query_ret_docs.items())
+        self.debug("[end TemplateBot reply_batch]")
+        return [answers.get(normal_query, "") for normal_query in normal_queries]
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
 
 if __name__ == '__main__':
     bot = TemplateBot()
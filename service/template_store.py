@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+# 进程内的问句模板库
+import math
+import re
+import sre_constants
+import sre_parse
+import threading
+from collections import defaultdict
+
+from pymongo import MongoClient
+
+from config import TEMPLATE_CORE_NAME, TEMPLATE_STORE_SOURCE, MONGODB_HOST, MONGODB_PORT, MONGODB_DBNAME, \
+    MONGODB_BIOLOGY_TEMPLATE
+from const import DEFAULT_TEMPLATE_PRIORITY
+from utils import seg_doc_with_search, str2unicode
+from utils.aho_corasick import AhoCorasick
+from utils.logger import BaseLogger
+from utils.solr_api import SolrAPIHandler
+
+LOAD_PAGE_SIZE = 1000  # 从solr分页加载模板时每页的条数
+
+
+def _collect_literals(sub_pattern, literals):
+    """
+    收集sre_parse解析结果中必须出现的连续字面量，可选或有分支的部分视为断开
+    :param sub_pattern: sre_parse解析得到的子模式
+    :param literals: 收集结果
+    """
+    run = []
+    for op, av in sub_pattern:
+        if op == sre_constants.LITERAL:
+            run.append(unichr(av))
+            continue
+        if run:
+            literals.append(u''.join(run))
+            run = []
+        if op == sre_constants.SUBPATTERN:  # 分组必须出现
+            _collect_literals(av[1], literals)
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1:  # 至少出现一次的重复
+            _collect_literals(av[2], literals)
+    if run:
+        literals.append(u''.join(run))
+
+
+def required_literals(pattern_str):
+    """
+    提取正则表达式的任意匹配都必然包含的字面量
+    :param pattern_str: 正则表达式
+    :return: 字面量列表，无法提取时返回空列表（此时不能用字面量过滤该模板）
+    """
+    parsed = sre_parse.parse(str2unicode(pattern_str))
+    if parsed.pattern.flags & sre_constants.SRE_FLAG_IGNORECASE:
+        return []
+    literals = []
+    _collect_literals(parsed, literals)
+    return literals
+
+
+class TemplateStore(BaseLogger):
+    """
+    启动时一次性加载全部问句模板并预编译正则表达式，匹配谓语时不再访问solr；模板更新后调用refresh重新加载
+    检索时先用Aho-Corasick自动机一次扫描问句，找出模板中必须出现的字面量，只有字面量全部出现的模板才可能匹配，
+    因此检索的开销取决于问句长度和可能匹配的模板数，而不是模板总数
+    """
+    def __init__(self, template_core=None, template_collection=None, source=TEMPLATE_STORE_SOURCE, **kwargs):
+        """
+        :param template_core: 问句模板检索接口，source为solr时使用，为空时使用solr问句模板core
+        :param template_collection: 问句模板collection，source为mongodb时使用，为空时连接配置中的mongodb
+        :param source: 模板来源，solr或mongodb
+        """
+        super(TemplateStore, self).__init__(**kwargs)
+        self.debug('>>> init TemplateStore <<<')
+        self.template_core = template_core
+        self.template_collection = template_collection
+        self.source = source
+        self._lock = threading.Lock()  # 保证同一时间只有一个线程在重新加载
+        self._state = ([], {}, AhoCorasick().build(), [])  # 索引整体替换，保证读取时的一致性
+        self.load()
+
+    def _read_solr(self):
+        if self.template_core is None:
+            self.template_core = SolrAPIHandler(TEMPLATE_CORE_NAME)
+        start = 0
+        while True:
+            docs = self.template_core.search_raw('*:*', rows=LOAD_PAGE_SIZE, start=start)  # 查询语句不能转义
+            docs = list(docs) if docs else []
+            for doc in docs:
+                yield doc
+            if len(docs) < LOAD_PAGE_SIZE:
+                break
+            start += LOAD_PAGE_SIZE
+
+    def _read_mongodb(self):
+        if self.template_collection is None:
+            client = MongoClient(MONGODB_HOST, MONGODB_PORT)
+            self.template_collection = client.get_database(MONGODB_DBNAME).get_collection(MONGODB_BIOLOGY_TEMPLATE)
+        for doc in self.template_collection.find():
+            yield doc
+
+    def _compile(self, doc):
+        """
+        将原始模板转换为预编译的模板
+        :param doc: solr或mongodb中的模板
+        :return: 模板，正则表达式不合法时返回None
+        """
+        pattern_str = doc.get('pattern', '')
+        try:
+            pattern = re.compile(ur'%s' % pattern_str)
+        except re.error, e:
+            self.warn('@@@@@@@@@@@@@@@@@@@@@@ invalid pattern=%s, error=%s', pattern_str, e)
+            return None
+        key_index = doc.get('key_index', [])
+        if not isinstance(key_index, list):
+            key_index = key_index.split()
+        return {'pattern': pattern_str,
+                'regex': pattern,
+                'literals': sorted(set(required_literals(pattern_str)), key=len, reverse=True),
+                'predicates': doc.get('predicates', []),
+                'priority': doc.get('priority', DEFAULT_TEMPLATE_PRIORITY),
+                'missing_tuple': doc.get('missing_tuple', ''),
+                'key_index': set(str2unicode(w).strip() for w in key_index if w.strip())}
+
+    def load(self):
+        """
+        加载全部模板并重建索引
+        :return: 模板数
+        """
+        with self._lock:
+            self.debug('start load templates, source=%s', self.source)
+            if self.source == 'mongodb':
+                docs = self._read_mongodb()
+            else:
+                docs = self._read_solr()
+            templates = []
+            key_df = defaultdict(int)          # 关键词 -> 包含该关键词的模板数
+            automaton = AhoCorasick()          # 以每个模板最长的必需字面量为关键词，值为模板下标
+            unfiltered = []                    # 没有必需字面量的模板，每次都需要检查
+            for doc in docs:
+                template = self._compile(doc)
+                if template:
+                    for word in template['key_index']:
+                        key_df[word] += 1
+                    if template['literals']:
+                        automaton.add(template['literals'][0], len(templates))
+                    else:
+                        unfiltered.append(len(templates))
+                    templates.append(template)
+            self._state = (templates, dict(key_df), automaton.build(), unfiltered)
+            self.info('load %s templates, source=%s', len(templates), self.source)
+        return len(templates)
+
+    def refresh(self):
+        """
+        重新加载模板，加载失败时保留原有模板
+        :return: 是否加载成功
+        """
+        try:
+            self.load()
+        except Exception, e:
+            self.exception(e)
+            self.error('@@@@@@@@@@@@@@@@@@@@@@ refresh templates failed, keep %s templates', len(self))
+            return False
+        return True
+
+    @staticmethod
+    def _prefilter(query, templates, automaton, unfiltered):
+        """
+        一次扫描问句，返回必需字面量全部出现在问句中的模板下标
+        """
+        candidates = set(unfiltered)
+        for start, end, idx in automaton.iter_matches(query):
+            if idx not in candidates and all(literal in query for literal in templates[idx]['literals'][1:]):
+                candidates.add(idx)
+        return candidates
+
+    def search(self, query):
+        """
+        检索可能与问句匹配、且key_index与问句分词有交集的模板，按命中关键词的idf之和降序排列，分数相同时保持加载顺序
+        :param query: 问句
+        :return: 模板列表
+        """
+        templates, key_df, automaton, unfiltered = self._state
+        query = str2unicode(query)
+        candidates = self._prefilter(query, templates, automaton, unfiltered)
+        if not candidates:
+            return []
+        words = set(w.strip() for w in seg_doc_with_search(query) if w.strip())
+        scores = dict()
+        for idx in candidates:
+            hit_words = words & templates[idx]['key_index']
+            if hit_words:
+                scores[idx] = sum(math.log(float(len(templates)) / key_df[word]) + 1.0 for word in hit_words)
+        return [templates[idx] for idx in sorted(scores, key=lambda x: (-scores[x], x))]
+
+    def __len__(self):
+        return len(self._state[0])
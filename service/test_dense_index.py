@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# 进程内稠密向量索引：python -m unittest service.test_dense_index
+import random
+import unittest
+
+import numpy as np
+from gensim.models.keyedvectors import WordEmbeddingsKeyedVectors
+
+import service
+from benchmark.fakes import FakeSolrAPIHandler
+from service.dense_index import DenseTripleIndex, normalize_rows
+from wordembedding.doc_embedding import DOC_INDEX_FIELD
+
+VOCABULARY = [u'w%s' % idx for idx in xrange(60)]
+
+
+def synthetic_embedding(size=16):
+    rs = np.random.RandomState(0)
+    embedding = WordEmbeddingsKeyedVectors(size)
+    embedding.add(VOCABULARY, rs.randn(len(VOCABULARY), size).astype(np.float32))
+    return embedding
+
+
+def random_triples(num):
+    rs = random.Random(0)
+    return [{'id': str(idx), DOC_INDEX_FIELD: u' '.join(rs.sample(VOCABULARY, rs.randint(1, 5)))}
+            for idx in xrange(num)]
+
+
+class DenseTripleIndexTest(unittest.TestCase):
+    def setUp(self):
+        # 用小规模的合成词向量代替配置的词向量，不使用预计算库
+        self._embedding = (service._wording_embedding, service._doc_embedding_store, service._doc_embedding_loaded)
+        service._wording_embedding = synthetic_embedding()
+        service._doc_embedding_store, service._doc_embedding_loaded = None, True
+        self.triple_core = FakeSolrAPIHandler('triple', random_triples(300))
+
+    def tearDown(self):
+        service._wording_embedding, service._doc_embedding_store, service._doc_embedding_loaded = self._embedding
+
+    def assertSameResults(self, results_1, results_2):
+        # 批量与单条的矩阵乘累加顺序不同，相似度只在float32精度内一致
+        self.assertEqual(len(results_1), len(results_2))
+        for result_1, result_2 in zip(results_1, results_2):
+            self.assertEqual([doc['id'] for doc, score in result_1], [doc['id'] for doc, score in result_2])
+            for (_, score_1), (_, score_2) in zip(result_1, result_2):
+                self.assertAlmostEqual(score_1, score_2, places=5)
+
+    def test_ivf_full_probe_matches_flat(self):
+        flat = DenseTripleIndex(self.triple_core, index_type='flat', min_similarity=-1.0)
+        ivf = DenseTripleIndex(self.triple_core, index_type='ivf', nlist=8, nprobe=8, min_similarity=-1.0)
+        self.assertEqual(len(ivf._state[2][1]), 8)
+        query_vectors = normalize_rows(np.random.RandomState(1).randn(20, 16).astype(np.float32))
+        self.assertSameResults(flat.search_vectors(query_vectors, rows=10), ivf.search_vectors(query_vectors, rows=10))
+
+    def test_batch_matches_single(self):
+        rs = random.Random(1)
+        queries = [u' '.join(rs.sample(VOCABULARY, rs.randint(1, 4))) for _ in xrange(10)]
+        queries += [u'', u'不在词向量中']  # 没有词在词向量中的问句不召回
+        for index_type in ('flat', 'ivf'):
+            index = DenseTripleIndex(self.triple_core, index_type=index_type, nlist=8, nprobe=2)
+            results = index.search_batch_with_seg(queries, rows=5)
+            self.assertSameResults([[(doc, doc['score']) for doc in result] for result in results],
+                                   [[(doc, doc['score']) for doc in index.search_with_seg(query, rows=5)]
+                                    for query in queries])
+            self.assertEqual(results[-2:], [[], []])
+            self.assertTrue(any(results))
+
+
+if __name__ == '__main__':
+    unittest.main()
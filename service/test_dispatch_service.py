@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# 问答调度的答案缓存：python -m unittest service.test_dispatch_service
+import unittest
+
+from service.dispatch_service import DispatchBot
+
+
+class StubBot(object):
+    def __init__(self, answer, on_reply=None):
+        self.answer = answer
+        self.on_reply = on_reply
+        self.calls = 0
+
+    def reply(self, query, context=None):
+        self.calls += 1
+        if self.on_reply is not None:
+            self.on_reply()
+        return self.answer
+
+    def reply_batch(self, queries):
+        return [self.reply(query) for query in queries]
+
+    def close(self):
+        pass
+
+
+class DispatchBotCacheTest(unittest.TestCase):
+    def build(self, on_reply=None):
+        self.template_bot = StubBot(u'答案', on_reply)
+        bot = DispatchBot(self.template_bot, StubBot(''), worker_num=1, cache_size=10, trace_sample_rate=0, timeout=0)
+        self.addCleanup(bot.pool.close)
+        return bot
+
+    def test_cache_answer(self):
+        bot = self.build()
+        self.assertEqual(bot.dispatch(u'细胞是什么'), (u'答案', 'TEMPLATE'))
+        self.assertEqual(bot.dispatch(u'细胞是什么'), (u'答案', 'TEMPLATE'))
+        self.assertEqual(self.template_bot.calls, 1)
+
+    def test_flush_during_dispatch_skips_cache(self):
+        holder = []
+        bot = self.build(on_reply=lambda: holder[0].flush_cache())  # 计算答案期间数据更新
+        holder.append(bot)
+        bot.dispatch(u'细胞是什么')
+        self.assertEqual(len(bot.answer_cache), 0)
+        bot.dispatch(u'细胞是什么')
+        self.assertEqual(self.template_bot.calls, 2)
+
+    def test_flush_during_dispatch_batch_skips_cache(self):
+        holder = []
+        bot = self.build(on_reply=lambda: holder[0].flush_cache())
+        holder.append(bot)
+        self.assertEqual(bot.dispatch_batch([u'细胞是什么']), [(u'答案', 'TEMPLATE')])
+        self.assertEqual(len(bot.answer_cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
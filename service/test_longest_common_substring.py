@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# 最长公共子串：python -m unittest service.test_longest_common_substring
+import random
+import unittest
+
+from service import LongestCommonSubstring, longest_common_substring
+
+
+def table_lcs(query, retrieval_str):
+    """
+    逐格动态规划的实现，作为对照
+    """
+    m = [[0 for i in range(len(retrieval_str) + 1)] for j in range(len(query) + 1)]
+    mmax = 0
+    p = 0
+    for i in range(len(query)):
+        for j in range(len(retrieval_str)):
+            if query[i] == retrieval_str[j]:
+                m[i + 1][j + 1] = m[i][j] + 1
+                if m[i + 1][j + 1] > mmax:
+                    mmax = m[i + 1][j + 1]
+                    p = i + 1
+    return query[p - mmax:p], mmax
+
+
+class LongestCommonSubstringTest(unittest.TestCase):
+    def test_random_strings(self):
+        rs = random.Random(0)
+        for _ in xrange(500):
+            query = u''.join(rs.choice(u'abc') for _ in xrange(rs.randint(0, 15)))
+            retrieval_strs = [u''.join(rs.choice(u'abcd') for _ in xrange(rs.randint(0, 15))) for _ in xrange(5)]
+            expected = [table_lcs(query, retrieval_str) for retrieval_str in retrieval_strs]
+            self.assertEqual(LongestCommonSubstring(query).match_batch(retrieval_strs), expected)
+
+    def test_word_lists(self):
+        rs = random.Random(1)
+        words = [u'细胞', u'细胞核', u'的', u'功能', u'结构']
+        for _ in xrange(200):
+            query = [rs.choice(words) for _ in xrange(rs.randint(0, 8))]
+            retrieval_str = [rs.choice(words) for _ in xrange(rs.randint(0, 8))]
+            self.assertEqual(longest_common_substring(query, retrieval_str), table_lcs(query, retrieval_str))
+
+    def test_ties_end_earliest_in_query(self):
+        # ab与cd都是最长公共子串，返回在问句中结束位置最靠前的一个，与在检索结果中的位置无关
+        self.assertEqual(longest_common_substring(u'abxcd', u'cdyab'), (u'ab', 2))
+        self.assertEqual(longest_common_substring(u'aa', u'a'), (u'a', 1))
+
+    def test_empty(self):
+        self.assertEqual(longest_common_substring(u'', u'abc'), (u'', 0))
+        self.assertEqual(longest_common_substring(u'abc', u''), (u'', 0))
+        self.assertEqual(longest_common_substring(u'abc', u'xyz'), (u'', 0))
+        self.assertEqual(LongestCommonSubstring([]).match_batch([]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
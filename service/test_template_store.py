@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# 进程内问句模板库：python -m unittest service.test_template_store
+import random
+import re
+import unittest
+
+import service.template_store
+from benchmark.fakes import FakeSolrAPIHandler
+from service.template_store import TemplateStore, required_literals
+
+TEMPLATES = [{'pattern': u'(.+)的定义', 'key_index': u'定义'},
+             {'pattern': u'(.+)的(定义|概念)', 'key_index': u'定义 概念'},
+             {'pattern': u'(.+)是什么', 'key_index': u'什么'},
+             {'pattern': u'细胞(.*)', 'key_index': [u'细胞']},
+             {'pattern': u'(.+)的定义域', 'key_index': u'定义'},
+             {'pattern': u'(.+)的结构', 'key_index': u'结构'}]
+
+
+class RawOnlySolrAPIHandler(FakeSolrAPIHandler):
+    """
+    加载模板必须使用不转义的查询语句
+    """
+    def search_index(self, query_str, **kwargs):
+        raise AssertionError('query_str=%s should not be escaped' % query_str)
+
+
+def random_pattern(rs):
+    parts = []
+    for _ in xrange(rs.randint(1, 4)):
+        kind = rs.randint(0, 4)
+        word = u''.join(rs.choice(u'abc') for _ in xrange(rs.randint(1, 2)))
+        if kind == 0:
+            parts.append(word)
+        elif kind == 1:
+            parts.append(u'(%s|%s)' % (word, rs.choice(u'abc')))
+        elif kind == 2:
+            parts.append(u'(%s)?' % word)
+        elif kind == 3:
+            parts.append(u'(%s)+' % word)
+        else:
+            parts.append(u'(.*)')
+    return u''.join(parts)
+
+
+class TemplateStoreTest(unittest.TestCase):
+    def build(self, docs):
+        return TemplateStore(template_core=RawOnlySolrAPIHandler('template', docs), source='solr')
+
+    def test_load_pages(self):
+        page_size = service.template_store.LOAD_PAGE_SIZE
+        service.template_store.LOAD_PAGE_SIZE = 2
+        try:
+            store = self.build(TEMPLATES + [{'pattern': u'(.+', 'key_index': u'定义'}])  # 不合法的正则表达式被跳过
+        finally:
+            service.template_store.LOAD_PAGE_SIZE = page_size
+        self.assertEqual(len(store), len(TEMPLATES))
+
+    def test_rank_by_idf_then_load_order(self):
+        store = self.build(TEMPLATES)
+        patterns = [template['pattern'] for template in store.search(u'细胞的定义是什么')]
+        # 什么、细胞只出现在一个模板中，idf高于定义；同分的模板保持加载顺序；定义域不可能匹配
+        self.assertEqual(patterns, [u'(.+)是什么', u'细胞(.*)', u'(.+)的定义', u'(.+)的(定义|概念)'])
+        self.assertEqual(store.search(u'线粒体的功能'), [])
+
+    def test_required_literals(self):
+        self.assertEqual(required_literals(u'(.+)的(定义|概念)'), [u'的'])
+        self.assertEqual(required_literals(u'细胞(核)?的(结构)+'), [u'细胞', u'的', u'结构'])
+        self.assertEqual(required_literals(u'(?i)abc'), [])
+
+    def test_prefilter_keeps_every_match(self):
+        rs = random.Random(0)
+        docs = [{'pattern': random_pattern(rs), 'key_index': u'a'} for _ in xrange(300)]
+        store = self.build(docs)
+        templates, key_df, automaton, unfiltered = store._state
+        for _ in xrange(300):
+            query = u''.join(rs.choice(u'abcd') for _ in xrange(rs.randint(0, 12)))
+            candidates = store._prefilter(query, templates, automaton, unfiltered)
+            matched = set(idx for idx, template in enumerate(templates) if re.search(template['regex'], query))
+            self.assertTrue(matched <= candidates, query)
+
+
+if __name__ == '__main__':
+    unittest.main()
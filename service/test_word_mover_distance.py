@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# 文档迁移距离及其下界：python -m unittest service.test_word_mover_distance
+import random
+import unittest
+
+import numpy as np
+from gensim.models.keyedvectors import WordEmbeddingsKeyedVectors
+
+import service
+from const import WMD_BOUND_TOLERANCE
+from service import WordMoverDistance, exceeds_bound
+from wordembedding.doc_embedding import build_doc_embedding, doc_wmdistance
+
+VOCABULARY = [u'w%s' % idx for idx in xrange(30)]
+
+
+def synthetic_embedding(size=8):
+    rs = np.random.RandomState(0)
+    embedding = WordEmbeddingsKeyedVectors(size)
+    embedding.add(VOCABULARY, rs.randn(len(VOCABULARY), size).astype(np.float32))
+    return embedding
+
+
+def random_words(rs):
+    # 含重复词与不在词向量中的词
+    return [rs.choice(VOCABULARY + [u'oov']) for _ in xrange(rs.randint(0, 6))]
+
+
+class WordMoverDistanceTest(unittest.TestCase):
+    def setUp(self):
+        self._embedding = (service._wording_embedding, service._doc_embedding_store, service._doc_embedding_loaded)
+        service._wording_embedding = self.embedding = synthetic_embedding()
+        service._doc_embedding_store, service._doc_embedding_loaded = None, True
+
+    def tearDown(self):
+        service._wording_embedding, service._doc_embedding_store, service._doc_embedding_loaded = self._embedding
+
+    def test_doc_wmdistance_matches_wmdistance(self):
+        rs = random.Random(0)
+        pairs = [([u'w1'], [u'w1']), ([u'w1', u'w1'], [u'w1']), ([u'oov'], [u'w1']), ([], [u'w2'])]
+        pairs += [(random_words(rs), random_words(rs)) for _ in xrange(200)]
+        for words_1, words_2 in pairs:
+            expected = self.embedding.wmdistance(words_1, words_2)
+            distance = doc_wmdistance(build_doc_embedding(self.embedding, words_1),
+                                      build_doc_embedding(self.embedding, words_2))
+            if np.isinf(expected):
+                self.assertTrue(np.isinf(distance), (words_1, words_2))
+            else:
+                self.assertAlmostEqual(distance, expected, places=5, msg=(words_1, words_2))
+
+    def test_lower_bounds_not_exceed_distance(self):
+        rs = random.Random(1)
+        for _ in xrange(50):
+            wmd = WordMoverDistance(random_words(rs))
+            doc_embeddings = wmd.doc_embeddings([random_words(rs) for _ in xrange(10)])
+            bounds = wmd.lower_bounds(doc_embeddings)
+            self.assertEqual(len(bounds), len(doc_embeddings))
+            for bound, doc_embedding in zip(bounds, doc_embeddings):
+                distance = wmd.distance(doc_embedding)
+                if np.isinf(distance):
+                    continue
+                self.assertFalse(exceeds_bound(bound, distance), (bound, distance))
+                self.assertLessEqual(bound, distance + WMD_BOUND_TOLERANCE * max(1.0, distance))
+
+    def test_exceeds_bound(self):
+        self.assertFalse(exceeds_bound(1.0, 1.0))
+        self.assertFalse(exceeds_bound(1.0 + WMD_BOUND_TOLERANCE / 2, 1.0))
+        self.assertTrue(exceeds_bound(1.1, 1.0))
+        self.assertTrue(exceeds_bound(float('inf'), 1.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
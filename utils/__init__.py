@@ -45,7 +45,7 @@ def load_entity_synonym(path):
             if len(line_list) == 2:
                 key = line_list[0]
                 value = line_list[1]
-                if key in synonyms.keys():
+                if key in synonyms:
                     synonyms[key].append(value)
                 else:
                     synonyms[key] = [value, ]
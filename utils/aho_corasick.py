@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# Aho-Corasick多模式匹配自动机，一次扫描找出文本中出现的全部关键词
+from collections import deque
+
+
+class AhoCorasick(object):
+    """
+    关键词可以是字符串（按字符匹配）或词列表（按词匹配），扫描的文本类型需与关键词一致
+    用法：依次add关键词，build后调用iter_matches
+    """
+    def __init__(self):
+        self._goto = [{}]     # 状态 -> {字符/词: 下一状态}
+        self._fail = [0]      # 状态 -> 失配时跳转的状态
+        self._keys = [[]]     # 状态 -> 以该状态结束的关键词[(关键词长度, 关键词对应的值)]
+        self._output = [[]]   # 状态 -> 合并后缀状态后的全部关键词，build时由_keys重新生成
+        self._built = False
+
+    def add(self, key, value):
+        """
+        添加关键词
+        :param key: 关键词，字符串或词列表，不能为空
+        :param value: 关键词对应的值，匹配时返回
+        """
+        if not key:
+            return
+        state = 0
+        for item in key:
+            next_state = self._goto[state].get(item)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][item] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._keys.append([])
+            state = next_state
+        self._keys[state].append((len(key), value))
+        self._built = False
+
+    def build(self):
+        """
+        按广度优先计算失配跳转，并将后缀状态的输出合并到当前状态，build后继续add再build不会产生重复输出
+        """
+        self._output = [list(keys) for keys in self._keys]
+        queue = deque(self._goto[0].values())
+        for state in queue:
+            self._fail[state] = 0
+        while queue:
+            state = queue.popleft()
+            for item, next_state in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and item not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(item, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+                queue.append(next_state)
+        self._built = True
+        return self
+
+    def iter_matches(self, seq):
+        """
+        扫描文本，返回全部关键词的出现位置
+        :param seq: 字符串或词列表
+        :return: 迭代器，元素为(起始下标, 结束下标（不含）, 关键词对应的值)
+        """
+        if not self._built:
+            self.build()
+        state = 0
+        for idx, item in enumerate(seq):
+            while state and item not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(item, 0)
+            for length, value in self._output[state]:
+                yield idx + 1 - length, idx + 1, value
+
+    def __len__(self):
+        return len(self._goto) - 1
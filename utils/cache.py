@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    线程安全的LRU缓存，支持过期时间
+    """
+    def __init__(self, max_size, ttl=None):
+        """
+        :param max_size: 最大缓存条数，超出时淘汰最久未使用的条目
+        :param ttl: 过期时间（秒），为None或0时不过期
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (过期时间, value)，按使用时间由远到近排列
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None or (item[0] is not None and item[0] < time.time()):  # 未命中或已过期
+                self.misses += 1
+                return default
+            self._data[key] = item  # 重新插入，标记为最近使用
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        expire_at = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (expire_at, value)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._data), 'max_size': self.max_size, 'ttl': self.ttl,
+                    'hits': self.hits, 'misses': self.misses}
+
+    def __len__(self):
+        return len(self._data)
@@ -9,98 +9,152 @@ from config import NEO4J_HOST_PORT, NEO4J_USER, NEO4J_PWD, NEO4J_URL, MONGODB_HO
 from const import CYPER_SUBJECT_TEMPLATE, CYPER_OBJECT_TEMPLATE
 from utils import str2unicode
 from utils.logger import BaseLogger
+from utils.tracer import get_tracer
 
 
 class KnowledgeDBAPI(BaseLogger):
-    def __init__(self):
+    def __init__(self, graph=None, property_collection=None):
+        """
+        :param graph: 图数据库连接，为空时连接配置中的neo4j
+        :param property_collection: 关系属性库，为空时连接配置中的mongodb
+        """
         super(KnowledgeDBAPI, self).__init__()
-        self.debug('start init neo4j, host_port=%s, url=%s',
-                   NEO4J_HOST_PORT, NEO4J_URL)
-        authenticate(NEO4J_HOST_PORT, NEO4J_USER, NEO4J_PWD)
-        self.graph = Graph(NEO4J_URL)
-        self.debug('start connected mongodb, host=%s, port=%s, db_name=%s, collection_name=%s',
-                   MONGODB_HOST, MONGODB_PORT, MONGODB_DBNAME, MONGODB_BIOLOGY_PROPERTY)
-        client = MongoClient(MONGODB_HOST, MONGODB_PORT)
-        db = client.get_database(MONGODB_DBNAME)
-        self.property_collection = db.get_collection(MONGODB_BIOLOGY_PROPERTY)
-
-    def query_node_property(self, triple_subject, triple_predicate, triple_object):
+        if graph is None:
+            self.debug('start init neo4j, host_port=%s, url=%s',
+                       NEO4J_HOST_PORT, NEO4J_URL)
+            authenticate(NEO4J_HOST_PORT, NEO4J_USER, NEO4J_PWD)
+            graph = Graph(NEO4J_URL)
+        self.graph = graph
+        if property_collection is None:
+            self.debug('start connected mongodb, host=%s, port=%s, db_name=%s, collection_name=%s',
+                       MONGODB_HOST, MONGODB_PORT, MONGODB_DBNAME, MONGODB_BIOLOGY_PROPERTY)
+            client = MongoClient(MONGODB_HOST, MONGODB_PORT)
+            db = client.get_database(MONGODB_DBNAME)
+            property_collection = db.get_collection(MONGODB_BIOLOGY_PROPERTY)
+        self.property_collection = property_collection
+
+    def _node_property_conditions(self, triple_subject, triple_predicate, triple_object):
         """
-        根据三元组查询节点的属性
+        生成查询节点属性的cypher语句，按顺序执行直到得到结果
         :param triple_subject: 三元组--主语
         :param triple_predicate: 三元组--谓语
         :param triple_object: 三元组--宾语
-        :return:
+        :return: cypher语句列表
         """
-        self.debug('>>> start search_node_info <<<')
-        ret = {}
-        self.debug('search node with triple_subject=%s, triple_predicate=%s, triple_object=%s',
-                   triple_subject, triple_predicate, triple_object)
+        conditions = []
         if triple_subject and triple_predicate:  # 缺失宾语的情况
             condition_template = CYPER_SUBJECT_TEMPLATE['node_property']
-            condition = condition_template % (triple_subject, triple_predicate, triple_predicate)
-            self.debug('condition=%s', condition)
-            try:
-                knowledge_search_result = self.graph.run(condition).data()
-                ret = self._normalize_knowledge_doc(knowledge_search_result)
-            except Exception, e:
-                self.error('knowledge db query failed, query=%s', condition)
-            if not ret:  # 若检索triple_subject未得到答案，检索与triple_subject节点的同等关系节点
-                self.debug("start search %s's equal nodes", triple_subject)
-                condition_template = CYPER_SUBJECT_TEMPLATE['equal_node_property']
-                condition = condition_template % (triple_subject, triple_predicate, triple_predicate)
-                self.debug('condition=%s', condition)
-                try:
-                    knowledge_search_result = self.graph.run(condition).data()
-                    ret = self._normalize_knowledge_doc(knowledge_search_result)
-                except Exception, e:
-                    self.error('knowledge db query failed, query=%s', condition)
+            conditions.append(condition_template % (triple_subject, triple_predicate, triple_predicate))
+            # 若检索triple_subject未得到答案，检索与triple_subject节点的同等关系节点
+            condition_template = CYPER_SUBJECT_TEMPLATE['equal_node_property']
+            conditions.append(condition_template % (triple_subject, triple_predicate, triple_predicate))
         elif triple_object and triple_predicate:  # 缺失主语的情况(根据节点属性查询节点名，是否全文检索更合适)
             condition_template = CYPER_OBJECT_TEMPLATE['node_name']
-            condition = condition_template % (triple_predicate, triple_object, triple_predicate)
-            self.debug('condition=%s', condition)
-            try:
-                knowledge_search_result = self.graph.run(condition).data()
-                ret = self._normalize_knowledge_doc(knowledge_search_result)
-            except Exception, e:
-                self.error('knowledge db query failed, query=%s', condition)
+            conditions.append(condition_template % (triple_predicate, triple_object, triple_predicate))
         else:
             self.warn("@@@@@@@@@@@@@@ can't handle (triple_subject=%s, triple_predicate=%s, triple_object=%s)",
                       triple_subject, triple_predicate, triple_object)
+        return conditions
+
+    def _node_relation_conditions(self, triple_subject, triple_predicate, triple_object, query_property):
+        """
+        生成查询节点链接节点的cypher语句
+        :param triple_subject: 三元组--主语
+        :param triple_predicate: 三元组--谓语
+        :param triple_object: 三元组--宾语
+        :param query_property:主语或宾语属性值（name或其他属性值）
+        :return: cypher语句列表
+        """
+        conditions = []
+        if triple_subject and triple_predicate:  # 缺失宾语的情况
+            condition_template = CYPER_SUBJECT_TEMPLATE['node_relation_property']
+            conditions.append(condition_template % (triple_subject, triple_predicate, query_property, triple_predicate))
+        elif triple_object and triple_predicate:  # 缺失主语的情况
+            condition_template = CYPER_OBJECT_TEMPLATE['node_relation_property']
+            conditions.append(condition_template % (triple_predicate, triple_object, query_property, triple_predicate))
+        return conditions
+
+    def _run_condition(self, condition, context=None):
+        """
+        执行单条cypher语句
+        :param condition: cypher语句
+        :param context: 请求上下文
+        :return: 查询结果
+        """
+        self.debug('condition=%s', condition)
+        knowledge_search_result = []
+        try:
+            with get_tracer(context).span('neo4j.run'):
+                knowledge_search_result = self.graph.run(condition).data()
+        except Exception, e:
+            self.error('knowledge db query failed, query=%s', condition)
+        return knowledge_search_result
+
+    def _run_conditions(self, conditions, context=None):
+        """
+        在一个事务中批量执行cypher语句，所有语句只需一次网络往返
+        :param conditions: cypher语句列表
+        :param context: 请求上下文
+        :return: 与conditions一一对应的查询结果
+        """
+        self.debug('>>> start _run_conditions <<<')
+        results = []
+        if conditions:
+            self.debug('batch run conditions, size=%s', len(conditions))
+            try:
+                with get_tracer(context).span('neo4j.batch_run', size=len(conditions)):
+                    tx = self.graph.begin()
+                    cursors = [tx.run(condition) for condition in conditions]
+                    tx.commit()
+                results = [cursor.data() for cursor in cursors]
+            except Exception, e:  # 任意一条语句失败会导致整个事务失败，此时逐条执行
+                self.error('knowledge db batch query failed, size=%s', len(conditions))
+                results = [self._run_condition(condition, context) for condition in conditions]
+        self.debug('>>> end _run_conditions <<<')
+        return results
+
+    def query_node_property(self, triple_subject, triple_predicate, triple_object, context=None):
+        """
+        根据三元组查询节点的属性
+        :param triple_subject: 三元组--主语
+        :param triple_predicate: 三元组--谓语
+        :param triple_object: 三元组--宾语
+        :param context: 请求上下文
+        :return:
+        """
+        self.debug('>>> start search_node_info <<<')
+        ret = {}
+        self.debug('search node with triple_subject=%s, triple_predicate=%s, triple_object=%s',
+                   triple_subject, triple_predicate, triple_object)
+        conditions = self._node_property_conditions(triple_subject, triple_predicate, triple_object)
+        for idx, condition in enumerate(conditions):
+            if idx > 0 and context is not None and context.is_expiring():  # 时间不足，跳过同等关系节点的查询
+                self.debug('deadline nearly reached, skip fallback condition=%s', condition)
+                context.mark_degraded('query_node_property')
+                break
+            ret = self._normalize_knowledge_doc(self._run_condition(condition, context))
+            if ret:
+                break
         self.debug('>>> end search_node_info <<<')
         return ret
 
-    def query_node_relation(self, triple_subject, triple_predicate, triple_object, query_property):
+    def query_node_relation(self, triple_subject, triple_predicate, triple_object, query_property, context=None):
         """
         根据三元组查询节点的链接节点（或节点的某个属性值）
         :param triple_subject: 三元组--主语
         :param triple_predicate: 三元组--谓语
         :param triple_object: 三元组--宾语
         :param query_property:主语或宾语属性值（name或其他属性值）
+        :param context: 请求上下文
         :return:
         """
         self.debug('>>> start search_neighbors_info <<<')
         knowledge_search_result = {}
         self.debug('search node with triple_subject=%s, triple_predicate=%s, triple_object=%s',
                    triple_subject, triple_predicate, triple_object)
-        if triple_subject and triple_predicate:  # 缺失宾语的情况
-            condition_template = CYPER_SUBJECT_TEMPLATE['node_relation_property']
-            condition = condition_template % (triple_subject, triple_predicate, query_property, triple_predicate)
-            self.debug('condition=%s', condition)
-            try:
-                knowledge_search_result = self.graph.run(condition).data()
-            except Exception, e:
-                self.error('knowledge db query failed, query=%s', condition)
-
-        elif triple_object and triple_predicate:  # 缺失宾语的情况
-            condition_template = CYPER_OBJECT_TEMPLATE['node_relation_property']
-            condition = condition_template % (triple_predicate, triple_object, query_property, triple_predicate)
-            self.debug('condition=%s', condition)
-            try:
-                knowledge_search_result = self.graph.run(condition).data()
-            except Exception, e:
-                self.error('knowledge db query failed, query=%s', condition)
-
+        for condition in self._node_relation_conditions(triple_subject, triple_predicate, triple_object,
+                                                        query_property):
+            knowledge_search_result = self._run_condition(condition, context)
         ret = self._normalize_knowledge_doc(knowledge_search_result)
         self.debug('>>> end search_neighbors_info <<<')
         return ret
@@ -109,7 +163,7 @@ class KnowledgeDBAPI(BaseLogger):
         """
         根据三元组查询节点
         :param triple_doc: 三元组信息
-        :param kwargs: 扩展信息（关联节点属性描述）
+        :param kwargs: 扩展信息（关联节点属性描述，请求上下文）
         :return:
         """
         self.debug('>>> start search_with_triple <<<')
@@ -119,11 +173,13 @@ class KnowledgeDBAPI(BaseLogger):
             triple_object = str2unicode(triple_doc.get('object', ""))         # 宾语
             triple_predicates = triple_doc.get('predicate', [])               # 谓语（关系属性）
             query_property = kwargs.get("query_property", 'name')             # 用于查询关联节点的属性值，默认为name
+            context = kwargs.get("context")                                   # 请求上下文
             self.debug('triple_subject=%s, triple_predicates=%s, triple_object=%s, query_property=%s',
                        triple_subject, json.dumps(triple_predicates, ensure_ascii=False), triple_object, query_property)
 
             # 查询关系属性库确定关系属性的类型（数据关系还是对象关系）
-            predicate_docs = self.property_collection.find({'uri': {'$in': triple_predicates}})
+            with get_tracer(context).span('mongo.predicate_lookup'):
+                predicate_docs = list(self.property_collection.find({'uri': {'$in': triple_predicates}}))
             for predicate_item in predicate_docs:  # 遍历谓语关系并检索neo4j
                 predicate_type = predicate_item.get('type', '')
                 predicate_value = str(predicate_item.get('uri', ''))
@@ -131,9 +187,10 @@ class KnowledgeDBAPI(BaseLogger):
 
                 tmp_ret = {}
                 if predicate_type == 'data':  # 谓语为数据关系
-                    tmp_ret = self.query_node_property(triple_subject, predicate_value, triple_object)
+                    tmp_ret = self.query_node_property(triple_subject, predicate_value, triple_object, context)
                 elif predicate_type == 'object':  # 谓语为对象关系
-                    tmp_ret = self.query_node_relation(triple_subject, predicate_value, triple_object, query_property)
+                    tmp_ret = self.query_node_relation(triple_subject, predicate_value, triple_object, query_property,
+                                                       context)
                 else:
                     self.warn('@@@@@@@@@@@@@@@@@@@@@@@@ unexpected value, predicate_type is None')
                 ret = dict(ret, **tmp_ret)
@@ -142,6 +199,66 @@ class KnowledgeDBAPI(BaseLogger):
         self.debug('>>> end search_with_triple <<<')
         return ret
 
+    def search_batch(self, triple_docs, **kwargs):
+        """
+        批量查询三元组，关系属性库只查询一次，每一轮的cypher语句去重后在一个事务中执行
+        :param triple_docs: 三元组列表
+        :param kwargs: 扩展信息（关联节点属性描述）
+        :return: 与triple_docs一一对应的查询结果
+        """
+        self.debug('>>> start search_batch <<<')
+        query_property = kwargs.get("query_property", 'name')  # 用于查询关联节点的属性值，默认为name
+        all_predicates = set()
+        for triple_doc in triple_docs:
+            if triple_doc:
+                all_predicates.update(triple_doc.get('predicate', []))
+        predicate_docs = []
+        if all_predicates:  # 一次查询关系属性库确定所有谓语的类型
+            predicate_docs = list(self.property_collection.find({'uri': {'$in': list(all_predicates)}}))
+
+        steps = []  # 查询步骤(三元组下标, 按顺序执行直到得到结果的cypher语句)
+        for idx, triple_doc in enumerate(triple_docs):
+            if not triple_doc:
+                self.warn('@@@@@@@@@@@@@@@@@@@@ unexpected value, triple_doc is None')
+                continue
+            triple_subject = str2unicode(triple_doc.get('subject', ""))
+            triple_object = str2unicode(triple_doc.get('object', ""))
+            triple_predicates = triple_doc.get('predicate', [])
+            for predicate_item in predicate_docs:  # 与search_with_triple相同，按关系属性库的顺序遍历谓语
+                if predicate_item.get('uri', '') not in triple_predicates:
+                    continue
+                predicate_type = predicate_item.get('type', '')
+                predicate_value = str(predicate_item.get('uri', ''))
+                conditions = []
+                if predicate_type == 'data':  # 谓语为数据关系
+                    conditions = self._node_property_conditions(triple_subject, predicate_value, triple_object)
+                elif predicate_type == 'object':  # 谓语为对象关系
+                    conditions = self._node_relation_conditions(triple_subject, predicate_value, triple_object,
+                                                                query_property)
+                else:
+                    self.warn('@@@@@@@@@@@@@@@@@@@@@@@@ unexpected value, predicate_type is None')
+                steps.append((idx, conditions))
+
+        step_rets = [{} for _ in steps]
+        pending = [i for i, (idx, conditions) in enumerate(steps) if conditions]
+        round_idx = 0
+        while pending:  # 每一轮执行各步骤的第round_idx条语句，未得到结果的步骤进入下一轮
+            conditions = list(set(steps[i][1][round_idx] for i in pending))
+            condition_results = dict(zip(conditions, self._run_conditions(conditions)))
+            next_pending = []
+            for i in pending:
+                step_rets[i] = self._normalize_knowledge_doc(condition_results[steps[i][1][round_idx]])
+                if not step_rets[i] and round_idx + 1 < len(steps[i][1]):
+                    next_pending.append(i)
+            pending = next_pending
+            round_idx += 1
+
+        rets = [{} for _ in triple_docs]
+        for (idx, conditions), step_ret in zip(steps, step_rets):
+            rets[idx] = dict(rets[idx], **step_ret)
+        self.debug('>>> end search_batch <<<')
+        return rets
+
     def search_with_query(self, query_str):
         """
         根据查询问句进行查询
@@ -175,7 +292,7 @@ class KnowledgeDBAPI(BaseLogger):
                     if value:
                         if key not in ret.keys():
                             if isinstance(value, list):
-                                ret[key] = value
+                                ret[key] = list(value)  # 复制，批量查询时同一查询结果会被多个三元组共享
                             else:
                                 ret[key] = [value]
                         else:
@@ -188,17 +305,18 @@ class KnowledgeDBAPI(BaseLogger):
         self.debug('>>> end _normalize_knowledge_doc <<<')
         return ret
 
-    def search(self, triple_doc={}, query_str=""):
+    def search(self, triple_doc={}, query_str="", context=None):
         """
         知识图谱查询接口
         :param triple_doc: 查询三元组
         :param query_str: 查询问句
+        :param context: 请求上下文
         :return: 查询结果（字典形式）
         """
         self.debug('>>> start search <<<')
         answer = {}
         if triple_doc:
-            answer = self.search_with_triple(triple_doc)
+            answer = self.search_with_triple(triple_doc, context=context)
         elif query_str:
             answer = self.search_with_query(query_str)
         else:
@@ -1,25 +1,96 @@
 # -*- coding: utf-8 -*-
 # 自然语言处理工具包
 import json
+import marshal
+import os
+import threading
 
 import jieba
 import jieba.posseg as pseg
 
-from config import CUSTOM_DICTIONARY_PATH
+from config import CUSTOM_DICTIONARY_PATH, JIEBA_CACHE_PATH
 from utils.logger import BaseLogger
 
 
 class JiebaClient(BaseLogger):
-    def __init__(self, custom_dict_path=CUSTOM_DICTIONARY_PATH):
+    def __init__(self, custom_dict_path=CUSTOM_DICTIONARY_PATH, cache_path=JIEBA_CACHE_PATH):
+        """
+        词典在第一次分词或调用initialize时才加载
+        :param custom_dict_path: 自定义词典路径
+        :param cache_path: 加载自定义词典后的分词器词典缓存路径，为空时不使用缓存
+        """
         super(JiebaClient, self).__init__()
+        self.custom_dict_path = custom_dict_path
+        self.cache_path = cache_path
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    def _cache_key(self):
+        """
+        缓存的校验信息，自定义词典或jieba版本变化后缓存失效
+        """
+        stat = os.stat(self.custom_dict_path)
+        return [jieba.__version__, os.path.abspath(self.custom_dict_path), stat.st_size, int(stat.st_mtime)]
+
+    def _load_cache(self):
+        """
+        从缓存恢复加载自定义词典后的词频表及词性表
+        :return: 是否成功加载
+        """
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return False
         try:
-            jieba.load_userdict(custom_dict_path)
-            self.debug("init JiebaClient, with custom_dict_path=%s", custom_dict_path)
+            with open(self.cache_path, 'rb') as fr:
+                key, freq, total, word_tag_tab = marshal.load(fr)
+            if key != self._cache_key():
+                self.debug('jieba cache is stale, cache_path=%s', self.cache_path)
+                return False
         except Exception, e:
             self.exception(e)
-            self.error('@@@@@@@@@@@@@@@@@@@@@@@@@@@ loading custom_dictionary failed')
+            self.warn('@@@@@@@@@@@@@@@@@@@@@@@@@@@ loading jieba cache failed, cache_path=%s', self.cache_path)
+            return False
+        with jieba.dt.lock:
+            jieba.dt.FREQ = freq
+            jieba.dt.total = total
+            jieba.dt.initialized = True
+        jieba.dt.user_word_tag_tab.update(word_tag_tab)
+        return True
+
+    def _dump_cache(self):
+        tmp_path = '%s.%s.tmp' % (self.cache_path, os.getpid())
+        try:
+            with open(tmp_path, 'wb') as fw:
+                marshal.dump([self._cache_key(), jieba.dt.FREQ, jieba.dt.total, jieba.dt.user_word_tag_tab], fw)
+            os.rename(tmp_path, self.cache_path)  # 先写临时文件再重命名，避免多个进程读到写了一半的缓存
+            self.debug('dump jieba cache, cache_path=%s', self.cache_path)
+        except Exception, e:
+            self.exception(e)
+            self.warn('@@@@@@@@@@@@@@@@@@@@@@@@@@@ dumping jieba cache failed, cache_path=%s', self.cache_path)
+
+    def initialize(self):
+        """
+        加载jieba词典及自定义词典，优先从缓存加载
+        """
+        if self._initialized:
+            return
+        with self._lock:
+            if self._initialized:
+                return
+            try:
+                if self._load_cache():
+                    self.debug("init JiebaClient from cache, cache_path=%s", self.cache_path)
+                else:
+                    jieba.load_userdict(self.custom_dict_path)
+                    self.debug("init JiebaClient, with custom_dict_path=%s", self.custom_dict_path)
+                    if self.cache_path:
+                        self._dump_cache()
+            except Exception, e:
+                self.exception(e)
+                self.error('@@@@@@@@@@@@@@@@@@@@@@@@@@@ loading custom_dictionary failed')
+            self._initialized = True
 
     def seg(self, sentence):
+        self.initialize()
         words = list()
         tags = list()
         for item in pseg.cut(sentence):
@@ -28,6 +99,7 @@ class JiebaClient(BaseLogger):
         return words, tags
 
     def seg_for_search(self, sentence):
+        self.initialize()
         words = list()
         for item in jieba.cut_for_search(sentence):
             words.append(item)
@@ -36,6 +36,22 @@ class SolrAPIHandler(BaseLogger):
         self.debug('>>> end search_index <<<')
         return docs
 
+    def search_raw(self, query_str, **kwargs):
+        """
+        不转义，直接执行程序生成的查询语句，如加载全部文档的*:*或field:value
+        :param query_str: solr查询语句
+        :return: 检索结果
+        """
+        self.debug('>>> start search_raw <<<')
+        docs = None
+        if self.solr_client:
+            self.debug("query_str=%s, kwargs=%s", query_str, json.dumps(kwargs, ensure_ascii=False))
+            docs = self.solr_client.search(query_str, **kwargs)
+        else:
+            self.warn('@@@@@@@@@@@@@@@@@@@@@@ solr_client is None')
+        self.debug('>>> end search_raw <<<')
+        return docs
+
     def _escape_str(self, query_str):
         self.debug('>>> start _escape_str <<<')
         escape_query = query_str
@@ -66,7 +82,22 @@ class SolrAPIHandler(BaseLogger):
         self.debug(">>> start search_with_seg <<<")
         docs = None
         if self.solr_client:
-            words = seg_doc_with_search(query)
+            docs = self.search_words(seg_doc_with_search(query), **kwargs)
+        else:
+            self.warn('@@@@@@@@@@@@@@@@@@@@@@ solr_client is None')
+        self.debug(">>> end search_with_seg <<<")
+        return docs
+
+    def search_words(self, words, **kwargs):
+        """
+        以问句的分词结果检索，批量检索时调用方先对全部问句分词，分词结果相同的问句只检索一次
+        :param words: seg_doc_with_search的分词结果
+        :return: 检索结果
+        """
+        self.debug(">>> start search_words <<<")
+        docs = None
+        if self.solr_client:
+            words = list(words)
             normal_words = [w.strip() for w in self._escape_words(words) if w.strip()]
             query_fields = kwargs.get("query_fields", [])
             search_fields = kwargs.get("search_fields", SOLR_DEFAULT_RETURN_FIELDS)
@@ -91,7 +122,7 @@ class SolrAPIHandler(BaseLogger):
                           json.dumps(words))
         else:
             self.warn('@@@@@@@@@@@@@@@@@@@@@@ solr_client is None')
-        self.debug(">>> end search_with_seg <<<")
+        self.debug(">>> end search_words <<<")
         return docs
 
 if __name__ == "__main__":
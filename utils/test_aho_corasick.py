@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# 多模式匹配自动机：python -m unittest utils.test_aho_corasick
+import random
+import re
+import unittest
+
+from utils.aho_corasick import AhoCorasick
+
+
+def regex_matches(keys, text):
+    """
+    用正则逐个关键词扫描（前瞻断言可以找出重叠的出现位置），作为自动机的对照
+    """
+    matches = []
+    for value, key in enumerate(keys):
+        for is_match in re.finditer(u'(?=%s)' % re.escape(key), text):
+            matches.append((is_match.start(), is_match.start() + len(key), value))
+    return sorted(matches)
+
+
+def brute_force_matches(keys, seq):
+    matches = []
+    for value, key in enumerate(keys):
+        for start in xrange(len(seq) - len(key) + 1):
+            if seq[start:start + len(key)] == key:
+                matches.append((start, start + len(key), value))
+    return sorted(matches)
+
+
+def build_automaton(keys):
+    automaton = AhoCorasick()
+    for value, key in enumerate(keys):
+        automaton.add(key, value)
+    return automaton.build()
+
+
+class AhoCorasickTest(unittest.TestCase):
+    def test_overlapping_and_suffix_keys(self):
+        keys = [u'细胞', u'细胞核', u'胞核', u'核', u'细胞细胞', u'细胞']  # 重叠、互为后缀及重复的关键词
+        text = u'细胞核与细胞细胞核的细胞质'
+        self.assertEqual(sorted(build_automaton(keys).iter_matches(text)), regex_matches(keys, text))
+
+    def test_random_strings(self):
+        rs = random.Random(0)
+        for _ in xrange(200):
+            keys = [u''.join(rs.choice(u'abc') for _ in xrange(rs.randint(1, 4))) for _ in xrange(rs.randint(1, 8))]
+            text = u''.join(rs.choice(u'abcd') for _ in xrange(rs.randint(0, 30)))
+            self.assertEqual(sorted(build_automaton(keys).iter_matches(text)), regex_matches(keys, text))
+
+    def test_word_keys(self):
+        keys = [[u'细胞', u'核'], [u'核'], [u'细胞'], [u'细胞', u'核', u'膜']]
+        seq = [u'细胞', u'核', u'膜', u'与', u'细胞', u'核']
+        self.assertEqual(sorted(build_automaton(keys).iter_matches(seq)), brute_force_matches(keys, seq))
+
+    def test_add_after_build(self):
+        keys = [u'ab', u'b', u'abc', u'bc']
+        automaton = build_automaton(keys[:2])
+        text = u'abcabc'
+        self.assertEqual(sorted(automaton.iter_matches(text)), regex_matches(keys[:2], text))
+        for value, key in enumerate(keys[2:], 2):
+            automaton.add(key, value)
+        automaton.build()
+        automaton.build()  # 重复build结果不变
+        self.assertEqual(sorted(automaton.iter_matches(text)), regex_matches(keys, text))
+
+    def test_empty(self):
+        automaton = AhoCorasick().build()
+        self.assertEqual(list(automaton.iter_matches(u'细胞')), [])
+        self.assertEqual(list(build_automaton([u'细胞']).iter_matches(u'')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# LRU缓存：python -m unittest utils.test_cache
+import threading
+import unittest
+
+import utils.cache
+from utils.cache import LRUCache
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class LRUCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self._time = utils.cache.time
+        utils.cache.time = self.clock
+
+    def tearDown(self):
+        utils.cache.time = self._time
+
+    def test_evict_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)  # a成为最近使用
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(len(cache), 2)
+
+    def test_set_existing_key_refreshes(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('a', 10)
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 10)
+        self.assertIsNone(cache.get('b'))
+
+    def test_ttl_expiry(self):
+        cache = LRUCache(10, ttl=5)
+        cache.set('a', 1)
+        self.clock.now += 4.9
+        self.assertEqual(cache.get('a'), 1)
+        self.clock.now += 0.2
+        self.assertEqual(cache.get('a', 'expired'), 'expired')
+        cache.set('a', 2)  # 重新设置后重新计算过期时间
+        self.clock.now += 4.9
+        self.assertEqual(cache.get('a'), 2)
+
+    def test_no_ttl_and_zero_size(self):
+        cache = LRUCache(10, ttl=0)
+        cache.set('a', 1)
+        self.clock.now += 1e9
+        self.assertEqual(cache.get('a'), 1)
+        disabled = LRUCache(0)
+        disabled.set('a', 1)
+        self.assertIsNone(disabled.get('a'))
+        self.assertEqual(len(disabled), 0)
+
+    def test_stats_and_clear(self):
+        cache = LRUCache(10)
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('b')
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (1, 1, 1))
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def test_thread_safety(self):
+        cache = LRUCache(50)
+        errors = []
+
+        def worker(offset):
+            try:
+                for i in xrange(2000):
+                    key = (offset + i) % 200
+                    cache.set(key, key)
+                    value = cache.get(key)
+                    self.assertTrue(value is None or value == key)
+            except Exception, e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(idx * 37, )) for idx in xrange(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(cache), 50)
+        stats = cache.stats()
+        self.assertEqual(stats['hits'] + stats['misses'], 8 * 2000)
+
+
+if __name__ == '__main__':
+    unittest.main()
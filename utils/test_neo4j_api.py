@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# 知识库批量查询：python -m unittest utils.test_neo4j_api
+import unittest
+
+from benchmark.fakes import FakeGraph, FakeCollection
+from utils.neo4j_api import KnowledgeDBAPI
+
+NODES = [{'id': 1, 'properties': {'name': u'细胞', 'definition': [u'生命活动的基本单位', u'由细胞膜包围']}},
+         {'id': 2, 'properties': {'name': u'细胞', 'definition': [u'生物体的结构单位']}},
+         {'id': 3, 'properties': {'name': u'细胞核', 'definition': [u'细胞的控制中心']}}]
+PROPERTIES = [{'uri': 'definition', 'type': 'data'}]
+
+
+class KnowledgeDBAPITest(unittest.TestCase):
+    def setUp(self):
+        self.knowledge_db = KnowledgeDBAPI(graph=FakeGraph(NODES, []), property_collection=FakeCollection(PROPERTIES))
+
+    def test_search_batch_shared_condition(self):
+        # 两个三元组生成相同的cypher语句，查询结果有多行且属性值为列表
+        triple_doc = {'subject': u'细胞', 'predicate': ['definition'], 'object': ''}
+        expected = {'definition': [u'生命活动的基本单位', u'由细胞膜包围', u'生物体的结构单位']}
+        rets = self.knowledge_db.search_batch([triple_doc, dict(triple_doc), triple_doc])
+        self.assertEqual(rets, [expected, expected, expected])
+        self.assertEqual(NODES[0]['properties']['definition'], [u'生命活动的基本单位', u'由细胞膜包围'])
+
+    def test_search_batch_matches_search(self):
+        triple_docs = [{'subject': u'细胞', 'predicate': ['definition'], 'object': ''},
+                       {'subject': u'细胞核', 'predicate': ['definition'], 'object': ''},
+                       {'subject': u'细胞', 'predicate': ['definition'], 'object': ''},
+                       {}]
+        expected = [self.knowledge_db.search(triple_doc) for triple_doc in triple_docs]
+        self.assertEqual(self.knowledge_db.search_batch(triple_docs), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
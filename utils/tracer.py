@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# 问答流程各阶段的耗时追踪
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from utils import str2unicode
+
+
+class Tracer(object):
+    """
+    记录单次请求各处理阶段的耗时（wall-clock），可在多个线程间共享
+    """
+    def __init__(self):
+        self.start_time = time.time()
+        self.spans = []  # 按结束时间排列的阶段记录
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **tags):
+        """
+        记录with代码块的耗时
+        :param name: 阶段名称
+        :param tags: 附加信息
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            end = time.time()
+            span = {'name': name, 'thread': threading.current_thread().name,
+                    'start_ms': round((start - self.start_time) * 1000, 3),
+                    'duration_ms': round((end - start) * 1000, 3)}
+            if tags:
+                span['tags'] = tags
+            with self._lock:
+                self.spans.append(span)
+
+    def summary(self):
+        """
+        按阶段名称汇总调用次数与总耗时
+        :return: {name: {'count': 调用次数, 'total_ms': 总耗时}}
+        """
+        ret = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            item = ret.setdefault(span['name'], {'count': 0, 'total_ms': 0.0})
+            item['count'] += 1
+            item['total_ms'] = round(item['total_ms'] + span['duration_ms'], 3)
+        return ret
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda x: x['start_ms'])
+        return {'elapsed_ms': round((time.time() - self.start_time) * 1000, 3),
+                'spans': spans, 'summary': self.summary()}
+
+
+class NullTracer(object):
+    """
+    不记录任何信息的tracer，未开启追踪时使用
+    """
+    @contextmanager
+    def span(self, name, **tags):
+        yield
+
+    def summary(self):
+        return {}
+
+    def to_dict(self):
+        return {}
+
+
+NULL_TRACER = NullTracer()
+
+
+def get_tracer(context):
+    """
+    获取请求上下文中的tracer，context为空时返回NULL_TRACER
+    """
+    if context is None:
+        return NULL_TRACER
+    return context.tracer
+
+
+class TraceSampler(object):
+    """
+    按比例采样请求，并将trace以json行的形式追加写入文件
+    """
+    def __init__(self, path, rate):
+        self.path = path
+        self.rate = rate
+        self._lock = threading.Lock()
+
+    def should_sample(self):
+        return self.rate > 0 and random.random() < self.rate
+
+    def write(self, query, trace):
+        doc = {'query': str2unicode(query), 'time': time.strftime("%Y-%m-%d %H:%M:%S"), 'trace': trace}
+        line = json.dumps(doc, ensure_ascii=False)
+        if isinstance(line, unicode):
+            line = line.encode('utf-8')
+        with self._lock:
+            with open(self.path, 'a') as fw:
+                fw.write(line)
+                fw.write('\n')
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+# 问答服务的HTTP入口
+import json
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from multiprocessing.pool import ThreadPool
+
+from config import WEB_HOST, WEB_PORT, WEB_WORKER_NUM
+from service import warm_up
+from service.dispatch_service import DispatchBot
+from utils import str2unicode
+from utils.logger import BaseLogger
+from utils.tracer import Tracer
+
+
+class QAService(BaseLogger):
+    def __init__(self, **kwargs):
+        super(QAService, self).__init__(**kwargs)
+        self.debug('>>> init QAService <<<')
+        self.dispatch_bot = DispatchBot()  # 进程内共享的问答机器人
+
+    def reply(self, query, trace=False, timeout=None):
+        """
+        并行执行模板问答与检索问答，模板答案优先
+        :param query: 用户输入问句
+        :param trace: 是否在结果中返回各阶段耗时
+        :param timeout: 时间预算（秒），为空时使用默认值
+        :return: 答案信息，source为答案来源（TEMPLATE/RETRIEVAL）
+        """
+        tracer = Tracer() if trace else None
+        answer, source = self.dispatch_bot.dispatch(query, tracer=tracer, timeout=timeout)
+        doc = {'query': str2unicode(query), 'answer': str2unicode(answer), 'source': source}
+        if tracer:
+            doc['trace'] = tracer.to_dict()
+        return doc
+
+
+class QARequestHandler(BaseHTTPRequestHandler):
+    server_version = 'KnowledgeGraphQA/1.0'
+
+    def _send_json(self, code, doc):
+        body = json.dumps(doc, ensure_ascii=False)
+        if isinstance(body, unicode):
+            body = body.encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_params(self):
+        """
+        读取请求参数，GET读取url参数，POST读取json或表单
+        :return: 参数字典
+        """
+        url = urlparse.urlparse(self.path)
+        params = dict((k, v[0]) for k, v in urlparse.parse_qs(url.query).items())
+        if self.command == 'POST':
+            length = int(self.headers.getheader('Content-Length') or 0)
+            body = self.rfile.read(length) if length else ''
+            content_type = self.headers.getheader('Content-Type') or ''
+            if body and 'json' in content_type:
+                params.update(json.loads(body))
+            elif body:
+                params.update((k, v[0]) for k, v in urlparse.parse_qs(body).items())
+        return url.path, params
+
+    def _dispatch(self):
+        try:
+            path, params = self._read_params()
+        except ValueError:
+            self._send_json(400, {'error': 'invalid request body'})
+            return
+        if path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        elif path == '/cache/stats':
+            self._send_json(200, self.server.qa_service.dispatch_bot.answer_cache.stats())
+        elif path == '/cache/flush':
+            if self.command != 'POST':
+                self._send_json(405, {'error': 'method not allowed'})
+                return
+            self.server.qa_service.dispatch_bot.flush_cache()
+            self._send_json(200, {'status': 'ok'})
+        elif path == '/templates/refresh':
+            if self.command != 'POST':
+                self._send_json(405, {'error': 'method not allowed'})
+                return
+            if self.server.qa_service.dispatch_bot.refresh_templates():
+                self._send_json(200, {'status': 'ok'})
+            else:
+                self._send_json(500, {'error': 'refresh templates failed'})
+        elif path == '/qa':
+            query = params.get('query', '')
+            if not query:
+                self._send_json(400, {'error': 'missing query'})
+                return
+            try:
+                timeout = float(params['timeout']) if params.get('timeout') else None
+            except ValueError:
+                self._send_json(400, {'error': 'invalid timeout'})
+                return
+            try:
+                trace = str(params.get('trace', '')).lower() in ('1', 'true')
+                doc = self.server.qa_service.reply(query, trace=trace, timeout=timeout)
+            except Exception, e:
+                self.server.qa_service.exception(e)
+                self._send_json(500, {'query': str2unicode(query), 'error': 'internal error'})
+                return
+            self._send_json(200, doc)
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_GET(self):
+        self._dispatch()
+
+    def do_POST(self):
+        self._dispatch()
+
+    def log_message(self, format, *args):
+        self.server.qa_service.info('%s - %s', self.address_string(), format % args)
+
+
+class ThreadPoolHTTPServer(ThreadingMixIn, HTTPServer):
+    """
+    使用固定大小的线程池处理请求，避免每个请求新建线程
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, server_address, handler_class, qa_service, worker_num=WEB_WORKER_NUM):
+        HTTPServer.__init__(self, server_address, handler_class)
+        self.qa_service = qa_service
+        self.pool = ThreadPool(worker_num)
+
+    def process_request(self, request, client_address):
+        self.pool.apply_async(self.process_request_thread, (request, client_address))
+
+    def server_close(self):
+        HTTPServer.server_close(self)
+        self.pool.close()
+        self.pool.join()
+
+
+def run(host=WEB_HOST, port=WEB_PORT, worker_num=WEB_WORKER_NUM):
+    qa_service = QAService()
+    warm_up()  # 启动时加载词典与词向量，避免首个请求承担加载耗时
+    server = ThreadPoolHTTPServer((host, port), QARequestHandler, qa_service, worker_num=worker_num)
+    qa_service.info('start QA web service, host=%s, port=%s, worker_num=%s', host, port, worker_num)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        qa_service.dispatch_bot.close()
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+# 词向量后端：gensim、numpy内存映射与h5，统一提供词向量查询及文档迁移距离、质心距离
+import codecs
+import os
+
+import numpy as np
+
+from utils import str2unicode, unicode2str
+from utils.logger import BaseLogger
+from wordembedding.doc_embedding import build_doc_embedding, doc_wmdistance
+
+MEMMAP_VOCAB_SUFFIX = '.vocab'  # 内存映射后端的词表文件，每行一个词
+MEMMAP_MATRIX_SUFFIX = '.f32'   # 内存映射后端的词向量文件，按行存储的float32矩阵
+
+
+def gather_rows(W, indexes):
+    """
+    按编号一次读取词向量矩阵中的多行
+    :param W: 词向量矩阵，可以是内存映射
+    :param indexes: 编号列表，-1表示不在词向量中
+    :return: (float32矩阵，不在词向量中的词为零向量, 不在词向量中的掩码)
+    """
+    indexes = np.array(indexes, dtype=np.int64)
+    oov_mask = indexes < 0
+    matrix = np.zeros((len(indexes), W.shape[1]), dtype=np.float32)
+    if not oov_mask.all():
+        matrix[~oov_mask] = W[indexes[~oov_mask]]
+    return matrix, oov_mask
+
+
+class EmbeddingBackend(BaseLogger):
+    """
+    词向量后端的接口，子类实现vector_size、__contains__与__getitem__，
+    文档迁移距离与质心距离基于词向量计算，与具体的存储方式无关
+    """
+    vector_size = 0
+
+    def __contains__(self, word):
+        raise NotImplementedError
+
+    def __getitem__(self, word):
+        """
+        :return: float32词向量，词不存在时抛出KeyError
+        """
+        raise NotImplementedError
+
+    def lookup(self, words):
+        """
+        批量查询词向量
+        :param words: 词列表，utf-8字符串或unicode
+        :return: (float32矩阵，不在词向量中的词为零向量, 不在词向量中的掩码)
+        """
+        matrix = np.zeros((len(words), self.vector_size), dtype=np.float32)
+        oov_mask = np.ones(len(words), dtype=np.bool_)
+        for idx, word in enumerate(words):
+            if word in self:
+                matrix[idx] = self[word]
+                oov_mask[idx] = False
+        return matrix, oov_mask
+
+    def wmdistance(self, words_1, words_2):
+        """
+        计算两个文档的文档迁移距离，结果与KeyedVectors.wmdistance一致
+        :param words_1: 文档1的分词
+        :param words_2: 文档2的分词
+        :return: 文档迁移距离
+        """
+        return doc_wmdistance(build_doc_embedding(self, words_1), build_doc_embedding(self, words_2))
+
+    def centroid_distance(self, words_1, words_2):
+        """
+        计算两个文档的nBOW词向量质心之间的欧氏距离，是文档迁移距离的下界
+        :return: 质心距离，任一方没有词向量时为inf
+        """
+        embedding_1 = build_doc_embedding(self, words_1)
+        embedding_2 = build_doc_embedding(self, words_2)
+        if embedding_1 is None or embedding_2 is None:
+            return float('inf')
+        return float(np.linalg.norm(embedding_1.centroid - embedding_2.centroid))
+
+
+class GensimBackend(EmbeddingBackend):
+    """
+    gensim的KeyedVectors，wordvector.export_keyed_vectors导出的文件可以内存映射加载
+    """
+    def __init__(self, path, mmap=None, **kwargs):
+        """
+        :param path: gensim格式或word2vec格式的词向量文件
+        :param mmap: 大数组的内存映射方式，如'r'，存在path.kv时加载该文件
+        """
+        super(GensimBackend, self).__init__(**kwargs)
+        # 导入gensim较慢，仅在使用该后端时导入
+        from wordembedding.wordvector import KEYED_VECTORS_SUFFIX, load_embedding
+        if mmap and os.path.exists(path + KEYED_VECTORS_SUFFIX):
+            path += KEYED_VECTORS_SUFFIX
+        elif mmap:
+            self.warn('@@@@@@@@@@@@@@@@@@@@@@ %s not found, embedding is not memory-mapped, '
+                      'run wordvector.export_keyed_vectors to share it between processes', path + KEYED_VECTORS_SUFFIX)
+        self.model = load_embedding(path, mmap)
+        self.vector_size = self.model.vector_size
+        self.info('load gensim embedding, vocab_len=%s, path=%s', len(self.model.vocab), path)
+
+    def __contains__(self, word):
+        return word in self.model
+
+    def __getitem__(self, word):
+        return self.model[word]
+
+    def lookup(self, words):
+        matrix = np.zeros((len(words), self.vector_size), dtype=np.float32)
+        oov_mask = np.array([word not in self.model for word in words], dtype=np.bool_)
+        if not oov_mask.all():
+            matrix[~oov_mask] = self.model[[word for word, oov in zip(words, oov_mask) if not oov]]
+        return matrix, oov_mask
+
+
+class MemmapBackend(EmbeddingBackend):
+    """
+    以numpy.memmap只读打开float32词向量矩阵，只有词表读入内存，多个进程共享同一份页缓存
+    文件由embedding_h5.memmap_export生成
+    """
+    def __init__(self, path, **kwargs):
+        """
+        :param path: 文件前缀，词表为path.vocab，矩阵为path.f32
+        """
+        super(MemmapBackend, self).__init__(**kwargs)
+        with codecs.open(path + MEMMAP_VOCAB_SUFFIX, 'r', 'utf-8') as f:
+            words = [line.rstrip(u'\n') for line in f]
+        self.word2id = dict((word, idx) for idx, word in enumerate(words))
+        matrix_path = path + MEMMAP_MATRIX_SUFFIX
+        self.vector_size = os.path.getsize(matrix_path) / np.dtype(np.float32).itemsize / max(len(words), 1)
+        self.W = np.memmap(matrix_path, dtype=np.float32, mode='r', shape=(len(words), self.vector_size))
+        self.info('load memmap embedding, vocab_len=%s, vector_size=%s, path=%s', len(words), self.vector_size, path)
+
+    def __contains__(self, word):
+        return str2unicode(word) in self.word2id
+
+    def __getitem__(self, word):
+        return np.asarray(self.W[self.word2id[str2unicode(word)]])
+
+    def lookup(self, words):
+        return gather_rows(self.W, [self.word2id.get(str2unicode(word), -1) for word in words])
+
+
+class H5Backend(EmbeddingBackend):
+    """
+    embedding_h5导出的h5词向量，通过H5EmbeddingManager按需从磁盘读取，
+    在线服务时使用layout='lookup'导出，按行内存映射读取，否则按行解压并缓存
+    """
+    def __init__(self, path, mode='disk', **kwargs):
+        """
+        :param path: h5文件路径
+        :param mode: disk按需读取，in-memory全部读入内存
+        """
+        super(H5Backend, self).__init__(**kwargs)
+        from wordembedding.embedding import H5EmbeddingManager  # h5py仅在使用该后端时导入
+        self.manager = H5EmbeddingManager(path, mode=mode)
+        self.vector_size = self.manager.W.shape[1]
+
+    def __contains__(self, word):
+        return unicode2str(word) in self.manager.word2id
+
+    def __getitem__(self, word):
+        return np.asarray(self.manager.row(self.manager.word2id[unicode2str(word)]), dtype=np.float32)
+
+    def lookup(self, words):
+        return self.manager.lookup(words)
+
+
+def load_backend(backend, path, mmap=None):
+    """
+    加载词向量后端
+    :param backend: gensim、memmap或h5
+    :param path: gensim为词向量文件，memmap为文件前缀，h5为h5文件
+    :param mmap: gensim后端的内存映射方式
+    :return: EmbeddingBackend
+    """
+    if backend == 'memmap':
+        return MemmapBackend(path)
+    if backend == 'h5':
+        return H5Backend(path)
+    if backend != 'gensim':
+        raise ValueError('unknown embedding backend: %s' % backend)
+    return GensimBackend(path, mmap)
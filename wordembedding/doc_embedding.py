@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+# 三元组文档词向量的离线预计算与内存映射存储
+import json
+import os
+import shutil
+import zlib
+from collections import namedtuple
+
+import numpy as np
+from pyemd import emd
+
+from config import HERE, TRIPLE_CORE_NAME
+from const import DEFAULT_WORDING_EMBEDDING_PATH, DEFAULT_DOC_EMBEDDING_PATH
+from utils import str2unicode
+from utils.logger import BaseLogger
+
+LOAD_PAGE_SIZE = 1000  # 从solr分页读取三元组时每页的条数
+DOC_INDEX_FIELD = 'attribute_date_index'  # 计算文档迁移距离所用的分词域
+CHECK_SAMPLE_SIZE = 1000  # 加载时与当前词向量比对的词数
+
+# words: 在词向量中的词（去重并排序），weights: 词频/词数（nBOW），
+# vectors: 词向量(float32)，centroid: 按weights加权的词向量质心
+DocEmbedding = namedtuple('DocEmbedding', ['words', 'weights', 'vectors', 'centroid'])
+
+
+def doc_fingerprint(words):
+    """
+    分词结果的指纹，用于判断预计算结果是否与当前文档一致
+    :param words: 分词列表
+    :return: crc32
+    """
+    return zlib.crc32(u' '.join(str2unicode(w) for w in words).encode('utf-8')) & 0xffffffff
+
+
+def build_doc_embedding(embedding, words):
+    """
+    计算文档的nBOW权重与词向量质心，与wmdistance一致，去掉不在词向量中的词
+    :param embedding: 词向量模型，有lookup时（EmbeddingBackend）一次批量读取文档的全部词向量
+    :param words: 分词列表
+    :return: DocEmbedding，没有词在词向量中时返回None
+    """
+    counts = dict()
+    for w in words:
+        counts[w] = counts.get(w, 0) + 1
+    vocab = sorted(counts)  # 与wmdistance中Dictionary的编号顺序一致
+    if hasattr(embedding, 'lookup'):
+        vectors, oov_mask = embedding.lookup(vocab)
+        vocab = [w for w, oov in zip(vocab, oov_mask) if not oov]
+        vectors = vectors[~oov_mask]
+    else:  # gensim的KeyedVectors等没有批量查询的词向量
+        vocab = [w for w in vocab if w in embedding]
+        vectors = np.array([embedding[w] for w in vocab], dtype=np.float32)
+    if not vocab:
+        return None
+    counts = np.array([counts[w] for w in vocab], dtype=np.float64)
+    weights = counts / counts.sum()
+    return DocEmbedding(vocab, weights, vectors, weights.dot(vectors))
+
+
+def doc_wmdistance(embedding_1, embedding_2):
+    """
+    计算两个文档的文档迁移距离，结果与KeyedVectors.wmdistance一致
+    :param embedding_1: 文档1的DocEmbedding
+    :param embedding_2: 文档2的DocEmbedding
+    :return: 文档迁移距离，任一方为None时为inf
+    """
+    if embedding_1 is None or embedding_2 is None:
+        return float('inf')
+    vocab = list(embedding_1.words)  # 与wmdistance中Dictionary的编号顺序一致：文档1的词在前，文档2新增的词在后
+    vocab_ids = dict((w, idx) for idx, w in enumerate(vocab))
+    columns = []
+    for w in embedding_2.words:
+        if w not in vocab_ids:
+            vocab_ids[w] = len(vocab)
+            vocab.append(w)
+        columns.append(vocab_ids[w])
+    if len(vocab) == 1:
+        return 0.0
+    # 与wmdistance一致，使用float32词向量计算距离，只填充文档1的词与文档2的词之间的距离
+    rows = range(len(embedding_1.words))
+    vectors_1 = np.asarray(embedding_1.vectors, dtype=np.float32)
+    vectors_2 = np.asarray(embedding_2.vectors, dtype=np.float32)
+    distances = np.sqrt(((vectors_1[:, None, :] - vectors_2[None, :, :]) ** 2).sum(axis=2))
+    if distances.sum() == 0.0:
+        return float('inf')
+    distance_matrix = np.zeros((len(vocab), len(vocab)), dtype=np.float64)
+    distance_matrix[np.ix_(columns, rows)] = distances.T
+    distance_matrix[np.ix_(rows, columns)] = distances
+    weights_1 = np.zeros(len(vocab), dtype=np.float64)
+    weights_1[:len(embedding_1.words)] = embedding_1.weights
+    weights_2 = np.zeros(len(vocab), dtype=np.float64)
+    weights_2[columns] = embedding_2.weights
+    return emd(weights_1, weights_2, distance_matrix)
+
+
+def export_doc_embedding(embedding, docs, output=DEFAULT_DOC_EMBEDDING_PATH, embedding_path=''):
+    """
+    预计算全部文档的DocEmbedding并保存为numpy文件，按文档id排序，查询时内存映射读取
+    文件：doc_ids、fingerprints、offsets（每个文档的词在token_ids中的区间）、token_ids、weights、centroids、
+    vocab、vectors（文档中出现的词及其词向量），以及meta.json
+    :param embedding: 词向量模型
+    :param docs: 三元组文档
+    :param output: 输出目录，写入临时目录后整体替换
+    :param embedding_path: 词向量路径，记录在meta.json中
+    :return: 文档数
+    """
+    rows = dict()  # 文档id -> (指纹, DocEmbedding)
+    for doc in docs:
+        doc_id = doc.get('id')
+        if doc_id is None:
+            continue
+        words = str2unicode(doc.get(DOC_INDEX_FIELD, u'')).split()
+        rows[str2unicode(unicode(doc_id))] = (doc_fingerprint(words), build_doc_embedding(embedding, words))
+    doc_ids = sorted(rows)
+    vocab_ids = dict()
+    vocab, vectors = [], []
+    fingerprints, offsets, token_ids, weights, centroids = [], [0], [], [], []
+    for doc_id in doc_ids:
+        fingerprint, doc_embedding = rows[doc_id]
+        fingerprints.append(fingerprint)
+        if doc_embedding is None:
+            centroids.append(np.zeros(embedding.vector_size, dtype=np.float32))
+        else:
+            for w, vector in zip(doc_embedding.words, doc_embedding.vectors):
+                if w not in vocab_ids:
+                    vocab_ids[w] = len(vocab)
+                    vocab.append(w)
+                    vectors.append(vector)
+                token_ids.append(vocab_ids[w])
+            weights.extend(doc_embedding.weights)
+            centroids.append(doc_embedding.centroid)
+        offsets.append(len(token_ids))
+    arrays = {'doc_ids': np.array(doc_ids, dtype=np.unicode_),
+              'fingerprints': np.array(fingerprints, dtype=np.uint32),
+              'offsets': np.array(offsets, dtype=np.int64),
+              'token_ids': np.array(token_ids, dtype=np.int32),
+              'weights': np.array(weights, dtype=np.float64),
+              'centroids': np.array(centroids, dtype=np.float32).reshape(len(doc_ids), embedding.vector_size),
+              'vocab': np.array(vocab, dtype=np.unicode_),
+              'vectors': np.array(vectors, dtype=np.float32).reshape(len(vocab), embedding.vector_size)}
+    tmp_output = output + '.tmp'
+    if os.path.exists(tmp_output):
+        shutil.rmtree(tmp_output)
+    os.makedirs(tmp_output)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_output, name + '.npy'), array)
+    with open(os.path.join(tmp_output, 'meta.json'), 'w') as f:
+        json.dump({'embedding_path': embedding_path,
+                   'vector_size': embedding.vector_size,
+                   'doc_count': len(doc_ids),
+                   'vocab_len': len(vocab)}, f)
+    if os.path.exists(output):
+        shutil.rmtree(output)
+    os.rename(tmp_output, output)
+    return len(doc_ids)
+
+
+class DocEmbeddingStore(BaseLogger):
+    """
+    export_doc_embedding生成的文档词向量库，数组以内存映射方式打开，多个进程共享同一份页缓存
+    文档内容与预计算时不一致（指纹不同）或不在库中时返回None，由调用方现场计算
+    """
+    def __init__(self, path=DEFAULT_DOC_EMBEDDING_PATH, vector_size=None, **kwargs):
+        """
+        :param path: export_doc_embedding的输出目录
+        :param vector_size: 当前词向量的维数，与库中不一致时拒绝加载
+        """
+        super(DocEmbeddingStore, self).__init__(**kwargs)
+        self.debug('>>> init DocEmbeddingStore <<<')
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        if vector_size is not None and self.meta['vector_size'] != vector_size:
+            raise ValueError('vector_size mismatch, store=%s, embedding=%s' % (self.meta['vector_size'], vector_size))
+        for name in ('doc_ids', 'fingerprints', 'offsets', 'token_ids', 'weights', 'centroids', 'vocab', 'vectors'):
+            setattr(self, name, np.load(os.path.join(path, name + '.npy'), mmap_mode='r'))
+        self.info('load %s docs, %s words, path=%s', len(self.doc_ids), len(self.vocab), path)
+
+    def get(self, doc_id, words):
+        """
+        :param doc_id: 文档id
+        :param words: 文档当前的分词，用于校验指纹
+        :return: DocEmbedding，不在库中、已过期或没有词在词向量中时返回None
+        """
+        if doc_id is None or not len(self.doc_ids):
+            return None
+        doc_id = str2unicode(unicode(doc_id))
+        row = int(np.searchsorted(self.doc_ids, doc_id))
+        if row >= len(self.doc_ids) or self.doc_ids[row] != doc_id:
+            return None
+        if self.fingerprints[row] != doc_fingerprint(words):
+            self.debug('stale doc embedding, doc_id=%s', doc_id)
+            return None
+        start, end = self.offsets[row], self.offsets[row + 1]
+        if start == end:
+            return None
+        token_ids = np.asarray(self.token_ids[start:end])
+        return DocEmbedding([self.vocab[idx] for idx in token_ids],
+                            np.asarray(self.weights[start:end]),
+                            self.vectors[token_ids],
+                            np.asarray(self.centroids[row], dtype=np.float64))
+
+    def matches(self, embedding, sample_size=CHECK_SAMPLE_SIZE):
+        """
+        抽样比对库中保存的词向量与当前词向量，词向量重新训练后即使维数相同，预计算结果也已失效
+        :param embedding: 当前的词向量后端
+        :param sample_size: 比对的词数，在词表中均匀抽取
+        :return: 是否一致
+        """
+        if not len(self.vocab):
+            return True
+        rows = np.unique(np.linspace(0, len(self.vocab) - 1, min(sample_size, len(self.vocab))).astype(np.int64))
+        vectors, oov_mask = embedding.lookup([self.vocab[row] for row in rows])
+        return not oov_mask.any() and np.array_equal(vectors, self.vectors[rows])
+
+    def __contains__(self, doc_id):
+        doc_id = str2unicode(unicode(doc_id))
+        row = int(np.searchsorted(self.doc_ids, doc_id))
+        return row < len(self.doc_ids) and self.doc_ids[row] == doc_id
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+
+def iter_triple_docs():
+    from utils.solr_api import SolrAPIHandler
+    triple_core = SolrAPIHandler(TRIPLE_CORE_NAME)
+    start = 0
+    while True:
+        docs = triple_core.search_raw('*:*', rows=LOAD_PAGE_SIZE, start=start)  # 查询语句不能转义
+        docs = list(docs) if docs else []
+        for doc in docs:
+            yield doc
+        if len(docs) < LOAD_PAGE_SIZE:
+            break
+        start += LOAD_PAGE_SIZE
+
+
+if __name__ == '__main__':
+    # 三元组库或词向量更新后重新生成
+    from wordembedding.wordvector import load_embedding
+    _model = load_embedding(DEFAULT_WORDING_EMBEDDING_PATH)
+    _count = export_doc_embedding(_model, iter_triple_docs(), DEFAULT_DOC_EMBEDDING_PATH,
+                                  os.path.relpath(DEFAULT_WORDING_EMBEDDING_PATH, HERE))
+    print 'export %s docs to %s' % (_count, DEFAULT_DOC_EMBEDDING_PATH)
@@ -8,31 +8,131 @@ import copy
 import math
 
 from config import HERE
+from const import DEFAULT_H5_ROW_CACHE_SIZE
+from utils import unicode2str
+from utils.cache import LRUCache
 from utils.logger import BaseLogger
+from wordembedding.vocab import VOCAB_DATASETS, PackedVocab
+
+
+def memmap_dataset(h5_path, dset):
+    """
+    连续且未压缩存储的h5数据集直接内存映射文件中的数据，读取不经过h5py
+    :param h5_path: h5文件路径
+    :param dset: h5py数据集
+    :return: numpy.memmap，分块或压缩存储时为None
+    """
+    if dset.chunks is not None or dset.compression is not None or not dset.size:
+        return None
+    offset = dset.id.get_offset()
+    if offset is None:
+        return None
+    return np.memmap(h5_path, dtype=dset.dtype, mode='r', offset=offset, shape=dset.shape)
 
 
 class H5EmbeddingManager(BaseLogger):
-    def __init__(self, h5_path, mode='disk', **kwargs):
+    def __init__(self, h5_path, mode='disk', cache_size=DEFAULT_H5_ROW_CACHE_SIZE, **kwargs):
+        """
+        :param h5_path: embedding_h5.export_data_h5导出的h5文件
+        :param mode: disk按需读取，in-memory全部读入内存
+        :param cache_size: disk模式下压缩分块存储时按行缓存的最大词数
+        """
         super(H5EmbeddingManager, self).__init__(**kwargs)
         self.mode = mode
+        self.row_cache = None
         f = h5py.File(h5_path, 'r')
         if mode == 'disk':
-            self.W = f['embedding']
+            # 连续且未压缩存储（layout='lookup'）时直接内存映射；压缩分块存储时每次读取一行都要解压整个分块，按行缓存
+            self.W = memmap_dataset(h5_path, f['embedding'])
+            if self.W is None:
+                self.W = f['embedding']
+                self.row_cache = LRUCache(cache_size)
         elif mode == 'in-memory':
             self.W = f['embedding'][:]
         message = "load mode=%s, embedding data type=%s, shape=%s" % (self.mode, type(self.W), self.W.shape)
         self.info(message)
-        words_flatten = f['words_flatten'][0]
-        self.id2word = words_flatten.split('\n')
-        assert len(self.id2word) == f.attrs['vocab_len'], "%s != %s" % (len(self.id2word), f.attrs['vocab_len'])
-        self.word2id = dict(izip(self.id2word, range(len(self.id2word))))
-        del words_flatten
+        if all(name in f for name in VOCAB_DATASETS):
+            # 紧凑词表，未压缩时内存映射，不生成每个词的python对象；id2word不再生成，使用word(index)
+            arrays = [memmap_dataset(h5_path, f[name]) for name in VOCAB_DATASETS]
+            arrays = [f[name][:] if array is None else array for name, array in zip(VOCAB_DATASETS, arrays)]
+            self.word2id = PackedVocab(*arrays)
+            self.id2word = None
+            assert len(self.word2id) == f.attrs['vocab_len'], "%s != %s" % (len(self.word2id), f.attrs['vocab_len'])
+        else:
+            words_flatten = f['words_flatten'][0]
+            self.id2word = words_flatten.split('\n')
+            assert len(self.id2word) == f.attrs['vocab_len'], "%s != %s" % (len(self.id2word), f.attrs['vocab_len'])
+            self.word2id = dict(izip(self.id2word, range(len(self.id2word))))
+            del words_flatten
+
+    def word(self, index):
+        """
+        :param index: 词的编号
+        :return: utf-8字符串
+        """
+        if self.id2word is None:
+            return self.word2id.word(index)
+        return self.id2word[index]
+
+    def row(self, index):
+        """
+        读取一个词的词向量
+        :param index: 词的编号
+        :return: 词向量的副本，调用方可以原地修改
+        """
+        if self.row_cache is None:
+            return np.array(self.W[index])
+        vec = self.row_cache.get(index)
+        if vec is None:
+            vec = self.W[index]
+            vec.flags.writeable = False  # 缓存中的词向量共享给所有调用方，不允许原地修改
+            self.row_cache.set(index, vec)
+        return vec.copy()
+
+    def rows(self, indexes):
+        """
+        按编号批量读取词向量，压缩分块存储时先查缓存，未命中的词一次读取
+        :param indexes: 升序且不重复的编号
+        :return: float32矩阵，与indexes一一对应
+        """
+        if self.row_cache is None:
+            return np.asarray(self.W[indexes], dtype=np.float32)
+        indexes = [int(index) for index in indexes]
+        matrix = np.zeros((len(indexes), self.W.shape[1]), dtype=np.float32)
+        missing = []
+        for k, index in enumerate(indexes):
+            vec = self.row_cache.get(index)
+            if vec is None:
+                missing.append(k)
+            else:
+                matrix[k] = vec
+        if missing:
+            vecs = self.W[[indexes[k] for k in missing]]  # h5py的列表下标需升序，一次读取所有未命中的词
+            for k, vec in izip(missing, vecs):
+                vec.flags.writeable = False
+                self.row_cache.set(indexes[k], vec)
+                matrix[k] = vec
+        return matrix
+
+    def lookup(self, tokens):
+        """
+        批量查询词向量，编号排序去重后一次读取
+        :param tokens: 词列表，utf-8字符串或unicode
+        :return: (float32矩阵，每行为一个词的词向量，不在词表中的词为零向量, 不在词表中的掩码)
+        """
+        indexes = np.array([self.word2id.get(unicode2str(token), -1) for token in tokens], dtype=np.int64)
+        oov_mask = indexes < 0
+        matrix = np.zeros((len(indexes), self.W.shape[1]), dtype=np.float32)
+        if not oov_mask.all():
+            unique_indexes, inverse = np.unique(indexes[~oov_mask], return_inverse=True)
+            matrix[~oov_mask] = self.rows(unique_indexes)[inverse]
+        return matrix, oov_mask
 
     def __getitem__(self, item):
         item_type = type(item)
-        if item_type is str:
-            index = self.word2id[item]
-            embs = self.W[index]
+        if item_type is str or item_type is unicode:
+            index = self.word2id[unicode2str(item)]
+            embs = self.row(index)
             return embs
         else:
             raise RuntimeError("don't support type: %s" % type(item))
@@ -48,11 +148,11 @@ class H5EmbeddingManager(BaseLogger):
         for i, word in enumerate(words[1:], 1):
             if word in word2id:
                 _id = word2id[word]
-                vec = W[_id]
+                vec = self.row(_id)
                 vec /= np.linalg.norm(vec)
             elif word.capitalize() in word2id:
                 _id = word2id[word.capitalize()]
-                vec = W[_id]
+                vec = self.row(_id)
                 vec /= np.linalg.norm(vec)
             else:
                 vec = np.random.normal(0, 1.0, 300)
@@ -95,7 +195,7 @@ class H5EmbeddingManager(BaseLogger):
         else:
             nonzero_ids = in_vocab.nonzero()[0]
             for i in nonzero_ids:
-                emb = W[word_ids[i]]
+                emb = self.row(word_ids[i])
                 W2V[i][:] = emb[:dim_size]
         # logger.debug("%s words is not in google word2vec, and it is random "
         #              "initialized: %s" % (len(oov_set), oov_set))
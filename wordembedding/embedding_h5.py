@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import codecs
 import os
 import zipfile
 
@@ -9,11 +10,18 @@ import pandas as pd
 import csv
 
 from config import HERE
+from wordembedding.backend import MEMMAP_VOCAB_SUFFIX, MEMMAP_MATRIX_SUFFIX
+from wordembedding.vocab import pack_vocab
+from wordembedding.wordvector import load_embedding
 
 FUNCTION_WORDS = ['PADDING', 'OOV_WORD']
 
 
-def export_data_h5(vocabulary, embedding_matrix, output='embedding.h5'):
+def export_data_h5(vocabulary, embedding_matrix, output='embedding.h5', layout='compressed'):
+    # layout为compressed时词向量矩阵压缩分块存储，文件最小；
+    # 为lookup时词向量矩阵与紧凑词表连续且不压缩存储，H5EmbeddingManager的disk模式直接内存映射读取，适合在线服务
+    if layout not in ('compressed', 'lookup'):
+        raise ValueError('unknown h5 layout: %s' % layout)
     f = h5py.File(output, "w")
     compress_option = dict(compression="gzip", compression_opts=9, shuffle=True)
     words_flatten = '\n'.join(vocabulary)
@@ -22,8 +30,12 @@ def export_data_h5(vocabulary, embedding_matrix, output='embedding.h5'):
     dt = h5py.special_dtype(vlen=str)
     _dset_vocab = f.create_dataset('words_flatten', (1, ), dtype=dt, **compress_option)
     _dset_vocab[...] = [words_flatten]
-    _dset = f.create_dataset('embedding', embedding_matrix.shape, dtype=embedding_matrix.dtype, **compress_option)
+    embedding_option = compress_option if layout == 'compressed' else dict()
+    _dset = f.create_dataset('embedding', embedding_matrix.shape, dtype=embedding_matrix.dtype, **embedding_option)
     _dset[...] = embedding_matrix
+    # 紧凑词表，读取时二分查找，不需要拆分words_flatten；words_flatten保留给旧的读取代码
+    for name, array in pack_vocab(vocabulary).items():
+        f.create_dataset(name, data=array, **embedding_option)
     f.flush()
     f.close()
 
@@ -42,7 +54,7 @@ def glove_export(embedding_file):
             export_data_h5(vocabulary, np.array(embeddings, dtype=np.float32), output=name + ".h5")
 
 
-def w2v_export(embedding_file):
+def w2v_export(embedding_file, layout='compressed'):
     try:
         model = KeyedVectors.load(embedding_file)
     except Exception, e:
@@ -51,7 +63,19 @@ def w2v_export(embedding_file):
     embeddings = []
     for word in vocabulary:
         embeddings.append(model[word])
-    export_data_h5(vocabulary, np.array(embeddings, dtype=np.float32), output=embedding_file + ".h5")
+    export_data_h5(vocabulary, np.array(embeddings, dtype=np.float32), output=embedding_file + ".h5", layout=layout)
+
+
+def memmap_export(embedding_file):
+    # 保存为词表与float32矩阵，供MemmapBackend以numpy.memmap只读打开
+    model = load_embedding(embedding_file)
+    vocabulary = model.index2word
+    with codecs.open(embedding_file + MEMMAP_VOCAB_SUFFIX, 'w', 'utf-8') as f:
+        for word in vocabulary:
+            f.write(word + u'\n')
+    embeddings = np.array([model[word] for word in vocabulary], dtype=np.float32)
+    embeddings.tofile(embedding_file + MEMMAP_MATRIX_SUFFIX)
+    print len(vocabulary), embeddings.shape
 
 
 def txt_export(embedding_file):
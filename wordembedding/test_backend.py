@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# 词向量后端加载train_embedding保存的模型：python -m unittest wordembedding.test_backend
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from gensim.models import word2vec
+
+from wordembedding.backend import load_backend
+from wordembedding.wordvector import export_keyed_vectors
+
+SENTENCES = [[u'自然', u'语言', u'处理'], [u'语言', u'模型', u'训练'], [u'自然', u'科学', u'研究']] * 20
+
+
+class GensimBackendTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'word_embedding.vec')
+        # 与train_embedding相同，保存完整的Word2Vec
+        self.model = word2vec.Word2Vec(SENTENCES, size=8, window=2, min_count=1, seed=1, workers=1)
+        self.model.save(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_load_word2vec_save(self):
+        backend = load_backend('gensim', self.path)
+        self.assertEqual(backend.vector_size, 8)
+        self.assertIn(u'自然', backend)
+        self.assertNotIn(u'不存在', backend)
+        self.assertTrue((backend[u'语言'] == self.model.wv[u'语言']).all())
+        self.assertEqual(backend.wmdistance([u'自然', u'语言'], [u'语言', u'模型']),
+                         self.model.wv.wmdistance([u'自然', u'语言'], [u'语言', u'模型']))
+
+    def test_lookup(self):
+        backend = load_backend('gensim', self.path)
+        matrix, oov_mask = backend.lookup([u'模型', u'不存在', u'自然'])
+        self.assertEqual(list(oov_mask), [False, True, False])
+        self.assertTrue((matrix[0] == self.model.wv[u'模型']).all())
+        self.assertFalse(matrix[1].any())
+        self.assertTrue((matrix[2] == self.model.wv[u'自然']).all())
+
+    def test_mmap_exported_keyed_vectors(self):
+        export_keyed_vectors(self.path)
+        backend = load_backend('gensim', self.path, 'r')
+        self.assertIsInstance(backend.model.vectors, np.memmap)
+        self.assertTrue((backend[u'科学'] == self.model.wv[u'科学']).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# 紧凑词表：python -m unittest wordembedding.test_vocab
+import random
+import unittest
+
+from utils import unicode2str
+from wordembedding.vocab import VOCAB_DATASETS, pack_vocab, PackedVocab
+
+VOCABULARY = [u'细胞', u'the', u'细胞核', u'', u'a', u'细胞', u'Zebra', u'é', u'the']
+
+
+def build_vocab(vocabulary):
+    arrays = pack_vocab(vocabulary)
+    return PackedVocab(*[arrays[name] for name in VOCAB_DATASETS])
+
+
+class PackedVocabTest(unittest.TestCase):
+    def test_matches_dict(self):
+        vocab = build_vocab(VOCABULARY)
+        word2id = dict((unicode2str(word), idx) for idx, word in enumerate(VOCABULARY))  # 重复的词取最后一次出现的编号
+        self.assertEqual(len(vocab), len(VOCABULARY))
+        for word, idx in word2id.iteritems():
+            self.assertEqual(vocab[word], idx)
+            self.assertEqual(vocab.get(word.decode('utf-8')), idx)  # unicode与utf-8字符串等价
+            self.assertIn(word, vocab)
+        self.assertEqual(vocab[u'细胞'], 5)
+        self.assertEqual(vocab[u'the'], 8)
+        self.assertEqual(list(vocab.iteritems()), sorted(word2id.iteritems()))
+
+    def test_oov(self):
+        vocab = build_vocab(VOCABULARY)
+        for word in [u'细', u'细胞膜', u'zebra', u'b', u'￿', u'e']:
+            self.assertNotIn(word, vocab)
+            self.assertIsNone(vocab.get(word))
+            self.assertEqual(vocab.get(word, -1), -1)
+            self.assertRaises(KeyError, vocab.__getitem__, word)
+        empty = build_vocab([])
+        self.assertEqual(len(empty), 0)
+        self.assertIsNone(empty.get(u'细胞'))
+        self.assertEqual(list(empty.iteritems()), [])
+
+    def test_word(self):
+        vocab = build_vocab(VOCABULARY)
+        for idx, word in enumerate(VOCABULARY):
+            self.assertEqual(vocab.word(idx), unicode2str(word))
+
+    def test_random_vocabulary(self):
+        rs = random.Random(0)
+        vocabulary = [u''.join(rs.choice(u'ab细胞é') for _ in xrange(rs.randint(1, 3))) for _ in xrange(300)]
+        vocab = build_vocab(vocabulary)
+        word2id = dict((unicode2str(word), idx) for idx, word in enumerate(vocabulary))
+        self.assertEqual(dict(vocab.iteritems()), word2id)
+        for word, idx in word2id.iteritems():
+            self.assertEqual(vocab[word], idx)
+
+
+if __name__ == '__main__':
+    unittest.main()
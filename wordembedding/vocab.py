@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# 紧凑词表：按utf-8字节排序后拼接存储，二分查找词的编号，不为每个词创建python对象
+import numpy as np
+
+from utils import unicode2str
+
+# h5文件中紧凑词表的数据集
+VOCAB_BYTES = 'vocab_bytes'          # 排序后的词按utf-8拼接，uint8
+VOCAB_OFFSETS = 'vocab_offsets'      # 第i个词在vocab_bytes中的区间为[offsets[i], offsets[i + 1])
+VOCAB_IDS = 'vocab_ids'              # 排序后第i个词的编号
+VOCAB_POSITIONS = 'vocab_positions'  # 编号为i的词在排序后的位置
+VOCAB_DATASETS = (VOCAB_BYTES, VOCAB_OFFSETS, VOCAB_IDS, VOCAB_POSITIONS)
+
+
+def pack_vocab(vocabulary):
+    """
+    生成紧凑词表，词的编号为其在vocabulary中的下标，重复的词保留全部编号，查询时与dict一致取最后一次出现的编号
+    :param vocabulary: 词列表
+    :return: {数据集名: 数组}
+    """
+    words = [unicode2str(word) for word in vocabulary]
+    order = sorted(xrange(len(words)), key=words.__getitem__)  # 稳定排序，重复的词编号小的在前
+    lengths = np.array([len(words[idx]) for idx in order], dtype=np.int64)
+    offsets = np.zeros(len(words) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    ids = np.array(order, dtype=np.int64)
+    positions = np.zeros(len(words), dtype=np.int64)
+    positions[ids] = np.arange(len(words), dtype=np.int64)
+    return {VOCAB_BYTES: np.frombuffer(''.join(words[idx] for idx in order), dtype=np.uint8),
+            VOCAB_OFFSETS: offsets,
+            VOCAB_IDS: ids,
+            VOCAB_POSITIONS: positions}
+
+
+class PackedVocab(object):
+    """
+    pack_vocab生成的紧凑词表，数组可以是内存映射，接口与word2id字典一致：
+    word in vocab、vocab[word]、vocab.get(word)，词为utf-8字符串或unicode
+    len(vocab)为词表的词数（含重复的词），与h5中的vocab_len一致
+    """
+    def __init__(self, data, offsets, ids, positions):
+        self.data = data
+        self.offsets = offsets
+        self.ids = ids
+        self.positions = positions
+
+    def _word_at(self, position):
+        return self.data[self.offsets[position]:self.offsets[position + 1]].tostring()
+
+    def _position(self, word):
+        """
+        :return: 词在排序后的位置，重复的词取编号最大的一个（排在最后），不存在时为-1
+        """
+        word = unicode2str(word)
+        lo, hi = 0, len(self.ids)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._word_at(mid) <= word:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo > 0 and self._word_at(lo - 1) == word:
+            return lo - 1
+        return -1
+
+    def get(self, word, default=None):
+        position = self._position(word)
+        if position < 0:
+            return default
+        return int(self.ids[position])
+
+    def word(self, index):
+        """
+        :param index: 词的编号
+        :return: utf-8字符串
+        """
+        return self._word_at(self.positions[index])
+
+    def iteritems(self):
+        """
+        :return: 迭代器，元素为(词, 编号)，按词排序，重复的词只返回最后一次出现的编号
+        """
+        for position in xrange(len(self.ids)):
+            word = self._word_at(position)
+            if position + 1 == len(self.ids) or self._word_at(position + 1) != word:  # 重复的词排在最后的编号最大
+                yield word, int(self.ids[position])
+
+    def __getitem__(self, word):
+        position = self._position(word)
+        if position < 0:
+            raise KeyError(word)
+        return int(self.ids[position])
+
+    def __contains__(self, word):
+        return self._position(word) >= 0
+
+    def __len__(self):
+        return len(self.ids)
@@ -7,13 +7,33 @@ from gensim.models import word2vec, KeyedVectors
 from config import HERE
 from utils import seg_doc
 
+KEYED_VECTORS_SUFFIX = '.kv'  # export_keyed_vectors导出的可内存映射的KeyedVectors文件
 
-def load_embedding(embedding_file_path):
+
+def load_embedding(embedding_file_path, mmap=None):
+    """
+    加载词向量
+    :param embedding_file_path: gensim格式或word2vec格式的词向量文件
+    :param mmap: gensim格式时大数组的内存映射方式，如'r'
+    :return: KeyedVectors
+    """
     try:
-        model = KeyedVectors.load(embedding_file_path)
+        model = KeyedVectors.load(embedding_file_path, mmap=mmap)
     except Exception, e:
         model = KeyedVectors.load_word2vec_format(embedding_file_path)
-    return model
+    return getattr(model, 'wv', model)  # train_embedding保存的是完整的Word2Vec，词向量在wv中
+
+
+def export_keyed_vectors(embedding_file_path):
+    """
+    将词向量导出为KeyedVectors格式，大数组全部单独保存为.npy文件（sep_limit=0），
+    加载时才能以mmap='r'内存映射，多个进程共享同一份页缓存；Word2Vec.save保存的小模型数组在pickle中，无法内存映射
+    :param embedding_file_path: gensim格式或word2vec格式的词向量文件
+    :return: 导出的文件路径，为embedding_file_path + KEYED_VECTORS_SUFFIX
+    """
+    output_path = embedding_file_path + KEYED_VECTORS_SUFFIX
+    load_embedding(embedding_file_path).save(output_path, sep_limit=0)
+    return output_path
 
 
 def train_embedding(model_path, corpus_path, dimension, window, min_count):
@@ -67,6 +87,8 @@ if __name__ == '__main__':
     _window = 8
     _min_count = 0
     # train_embedding(_model_path, _corpus_path, _dimension, _window, _min_count)
+    # 训练或更新词向量后导出为可内存映射的KeyedVectors格式
+    # export_keyed_vectors(_model_path)
 
     # 加载词向量并测试
     _model_path = os.path.join(HERE, 'data/word_embedding', 'word_embedding_2017-06-25-23:36:57.vec')